@@ -1,5 +1,6 @@
 import os
 import re
+import threading
 from StringIO import StringIO
 from lxml import etree
 import html5lib
@@ -146,32 +147,82 @@ def sanitize_html(unsafe):
     return tree.toxml()
 
 
+class FragmentSanitizer(object):
+    """
+    Sanitizes HTML fragments for one set of allowed elements, attributes,
+    styles and renamed elements.  The sanitizing tokenizer and the parser
+    are only built once, and each thread gets its own parser to reuse.
+
+    Use get_sanitizer() to get one.
+    """
+    def __init__(self, allowed_elements=None, allowed_attributes_map=None,
+                 allowed_styles_map=None, rename_elements=None):
+        if not allowed_elements:
+            allowed_elements = sanitizer.HTMLSanitizer.allowed_elements
+        self.tokenizer = custom_sanitizer(allowed_elements,
+            allowed_attributes_map, allowed_styles_map, rename_elements)
+        self._local = threading.local()
+
+    @property
+    def parser(self):
+        if not hasattr(self._local, 'parser'):
+            self._local.parser = html5lib.HTMLParser(
+                tree=treebuilders.getTreeBuilder("lxml"),
+                tokenizer=self.tokenizer,
+                namespaceHTMLElements=False
+            )
+        return self._local.parser
+
+    def sanitize(self, unsafe, encoding='UTF-8'):
+        # TODO: make this more simple / understandable and factor out from
+        # plugins.html_to_template_text
+        top_level_elements = self.parser.parseFragment(unsafe,
+                                                       encoding=encoding)
+        # put top level elements in container
+        container = etree.Element('div')
+        if top_level_elements and not hasattr(top_level_elements[0], 'tag'):
+            container.text = top_level_elements.pop(0)
+        container.extend(top_level_elements)
+
+        html_bits = [etree.tostring(elem, method='html', encoding=encoding)
+                         for elem in container]
+
+        return ''.join([escape(container.text or '').encode(encoding)] +
+                       html_bits)
+
+
+_sanitizers = {}
+
+
+def _frozen(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _frozen(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(_frozen(v) for v in value))
+    return value
+
+
+def get_sanitizer(allowed_elements=None, allowed_attributes_map=None,
+                  allowed_styles_map=None, rename_elements=None):
+    """
+    Returns:
+        The FragmentSanitizer for these settings, built the first time
+        they're asked for.
+    """
+    key = _frozen((allowed_elements, allowed_attributes_map,
+                   allowed_styles_map, rename_elements))
+    if key not in _sanitizers:
+        _sanitizers[key] = FragmentSanitizer(allowed_elements,
+            allowed_attributes_map, allowed_styles_map, rename_elements)
+    return _sanitizers[key]
+
+
 def sanitize_html_fragment(unsafe, allowed_elements=None,
         allowed_attributes_map=None, allowed_styles_map=None,
         rename_elements=None, encoding='UTF-8'):
-    # TODO: make this more simple / understandable and factor out from
-    # plugins.html_to_template_text
-    if not allowed_elements:
-        allowed_elements = sanitizer.HTMLSanitizer.allowed_elements
-
-    tokenizer = custom_sanitizer(allowed_elements, allowed_attributes_map,
-                               allowed_styles_map, rename_elements)
-    p = html5lib.HTMLParser(
-        tree=treebuilders.getTreeBuilder("lxml"),
-        tokenizer=tokenizer,
-        namespaceHTMLElements=False
-    )
-    top_level_elements = p.parseFragment(unsafe, encoding=encoding)
-    # put top level elements in container
-    container = etree.Element('div')
-    if top_level_elements and not hasattr(top_level_elements[0], 'tag'):
-        container.text = top_level_elements.pop(0)
-    container.extend(top_level_elements)
-
-    html_bits = [etree.tostring(elem, method='html', encoding=encoding)
-                     for elem in container]
-
-    return ''.join([escape(container.text or '').encode(encoding)] + html_bits)
+    return get_sanitizer(allowed_elements, allowed_attributes_map,
+                         allowed_styles_map, rename_elements).sanitize(
+                         unsafe, encoding=encoding)
 
 
 class XMLField(models.TextField):
@@ -237,13 +288,18 @@ class HTML5FragmentField(models.TextField):
         self.allowed_styles_map = allowed_styles_map
         self.rename_elements = rename_elements
 
+    @property
+    def sanitizer(self):
+        if not hasattr(self, '_sanitizer'):
+            self._sanitizer = get_sanitizer(self.allowed_elements,
+                                            self.allowed_attributes_map,
+                                            self.allowed_styles_map,
+                                            self.rename_elements)
+        return self._sanitizer
+
     def clean(self, value, model_instance):
         value = super(HTML5FragmentField, self).clean(value, model_instance)
-        return sanitize_html_fragment(value, self.allowed_elements,
-                                      self.allowed_attributes_map,
-                                      self.allowed_styles_map,
-                                      self.rename_elements,
-                                      encoding=self.encoding)
+        return self.sanitizer.sanitize(value, encoding=self.encoding)
 
     def formfield(self, **kwargs):
         defaults = {
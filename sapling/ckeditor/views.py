@@ -2,6 +2,8 @@ import os
 import urlparse
 
 from django.conf import settings
+from django.utils import simplejson as json
+from django.utils.safestring import mark_safe
 from django.core.files.storage import FileSystemStorage
 from django.utils.translation import  ugettext_lazy as _
 from django.views.generic.simple import direct_to_template
@@ -31,19 +33,29 @@ def ck_upload(request, upload_folder):
     return ck_upload_result(request, url=saved_url)
 
 
-def ck_upload_result(request, url='', message=''):
+def ck_upload_result(request, url='', message='', metadata=None):
     """
     Notify CKEditor of upload via JS callback
+
+    If there's no message, the optional `metadata` dictionary is handed
+    to the callback in its place.
     """
     try:
         callback = request.GET['CKEditorFuncNum']
     except KeyError:
         callback = ''
 
+    if metadata and not message:
+        # Safe to put inside a <script>.
+        metadata = mark_safe(json.dumps(metadata).replace('<', '\\u003c'))
+    else:
+        metadata = None
+
     context = {
         'callback': callback,
         'saved_url': url,
         'message': message,
+        'metadata': metadata,
         }
 
     return direct_to_template(request, 'ckeditor/upload_result.html', context)
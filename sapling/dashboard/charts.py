@@ -0,0 +1,184 @@
+"""
+Building and caching the dashboard charts.
+
+Charts are never built while serving a request.  The update_dashboard
+management command (run from cron, or with --interval as a long-running
+worker) rebuilds any chart that's missing or older than
+DASHBOARD_STALE_AFTER seconds, and the dashboard keeps serving the
+previous version of a chart until the new one is ready.  Only one
+process builds a given chart at a time: the lock is taken with
+cache.add(), which is atomic.
+
+All of this needs a cache that's shared between processes.  With
+DummyCache, the default, nothing is kept, so the dashboard builds each
+chart as it's asked for instead.
+"""
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.utils.translation import ugettext as _
+
+import pyflot
+
+from pages.models import Page, PageFile
+from maps.models import MapData
+from redirects.models import Redirect
+
+import stats
+
+CHART_KEY = 'dashboard_%s'
+LOCK_KEY = 'dashboard_building_%s'
+# Charts older than this are rebuilt, but are served until they are.
+STALE_AFTER = getattr(settings, 'DASHBOARD_STALE_AFTER', 60 * 60)
+# Keep serving charts for a long time in case they stop being rebuilt.
+CHART_CACHE_TIME = 60 * 60 * 24 * 30
+# If a build dies without releasing its lock, the lock expires.
+LOCK_TIME = 60 * 10
+
+
+def _item_counts(model, oldest_page):
+    series = stats.daily_series(stats.model_label(model), oldest_page)
+    return stats.cumulative(series, lambda s: s.added - s.deleted)
+
+
+def items_over_time(oldest_page):
+    graph = pyflot.Flot()
+
+    graph.add_time_series(_item_counts(Page, oldest_page), label=_("pages"))
+    graph.add_time_series(_item_counts(MapData, oldest_page),
+        label=_("maps"))
+    graph.add_time_series(_item_counts(PageFile, oldest_page),
+        label=_("files"))
+    graph.add_time_series(_item_counts(Redirect, oldest_page),
+        label=_("redirects"))
+
+    return [graph.prepare_series(s) for s in graph._series]
+
+
+def _edits(model, oldest_page):
+    series = stats.daily_series(stats.model_label(model), oldest_page)
+    return [(d, s.edits) for d, s in series]
+
+
+def edits_over_time(oldest_page):
+    graph = pyflot.Flot()
+
+    graph.add_time_series(_edits(Page, oldest_page), label=_("pages"))
+    graph.add_time_series(_edits(MapData, oldest_page), label=_("maps"))
+    graph.add_time_series(_edits(PageFile, oldest_page), label=_("files"))
+    graph.add_time_series(_edits(Redirect, oldest_page),
+        label=_("redirects"))
+
+    return [graph.prepare_series(s) for s in graph._series]
+
+
+def page_content_over_time(oldest_page):
+    graph = pyflot.Flot()
+
+    series = stats.daily_series(stats.model_label(Page), oldest_page)
+    graph.add_time_series(stats.cumulative(series,
+                                           lambda s: s.content_bytes))
+    return [graph.prepare_series(s) for s in graph._series]
+
+
+def users_registered_over_time(oldest_page=None):
+    graph = pyflot.Flot()
+
+    oldest_user = stats.first_day(stats.USERS)
+    if oldest_user is not None:
+        series = stats.daily_series(stats.USERS, oldest_user)
+        graph.add_time_series(stats.cumulative(series, lambda s: s.added))
+
+    return [graph.prepare_series(s) for s in graph._series]
+
+
+CHARTS = (
+    ('num_items_over_time', items_over_time),
+    ('num_edits_over_time', edits_over_time),
+    ('page_content_over_time', page_content_over_time),
+    ('users_registered_over_time', users_registered_over_time),
+)
+
+
+def get_oldest_page_date():
+    oldest = cache.get('dashboard_oldest')
+    if oldest is None:
+        qs = Page.versions.order_by('history_date')
+        qs = qs.filter(history_date__gte=date(2000, 1, 1))
+        if not qs.exists():
+            return None
+        oldest = qs[0].version_info.date
+        cache.set('dashboard_oldest', oldest, CHART_CACHE_TIME)
+    return oldest
+
+
+def charts_are_kept():
+    """
+    Returns:
+        False if the cache throws charts away as soon as they're built.
+    """
+    return not isinstance(cache, DummyCache)
+
+
+def get_chart(key):
+    """
+    Returns:
+        The most recently built version of the chart `key`, or None if it
+        hasn't been built.
+    """
+    return cache.get(CHART_KEY % key)
+
+
+def is_stale(chart):
+    return time.time() - chart['_built'] > STALE_AFTER
+
+
+def build_chart(key, function):
+    """
+    Builds the chart `key` with `function` and caches it, unless another
+    process is already building it.
+
+    Returns:
+        The chart, or None if another process is building it.
+    """
+    # The lock holds a token of our own, so that if it expires while
+    # we're still building we don't release whoever took it next.
+    token = uuid.uuid4().hex
+    if not cache.add(LOCK_KEY % key, token, LOCK_TIME):
+        return None
+    try:
+        start_at = time.time()
+        oldest = get_oldest_page_date()
+        if oldest is None:
+            # We probably have no pages yet
+            chart = {key: [], '_error': 'No page data'}
+        else:
+            chart = {key: function(oldest)}
+        chart['_built'] = time.time()
+        chart['_duration'] = time.time() - start_at
+        cache.set(CHART_KEY % key, chart, CHART_CACHE_TIME)
+    finally:
+        if cache.get(LOCK_KEY % key) == token:
+            cache.delete(LOCK_KEY % key)
+    return chart
+
+
+def build_charts(force=False):
+    """
+    Builds each chart that's missing or stale, or every chart if `force`
+    is True.
+
+    Returns:
+        A list of the keys of the charts that were built.
+    """
+    built = []
+    for key, function in CHARTS:
+        chart = get_chart(key)
+        if force or chart is None or is_stale(chart):
+            if build_chart(key, function) is not None:
+                built.append(key)
+    return built
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the daily statistics the dashboard charts are drawn '
+            'from using the full history.  Run this once after upgrading, '
+            'or whenever the statistics look wrong.  Changes made while '
+            'it runs may be counted twice or not at all.')
+
+    def handle(self, **options):
+        for model in stats.TRACKED_MODELS:
+            self.stdout.write('%s\n' % stats.model_label(model))
+            stats.rebuild(model)
+        self.stdout.write('%s\n' % stats.USERS)
+        stats.rebuild_users()
@@ -0,0 +1,33 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from dashboard import charts
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the dashboard charts that are missing or stale.  Run '
+            'this from cron every few minutes, or pass --interval to keep '
+            'it running.')
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true', dest='force',
+            default=False, help='Rebuild every chart, even fresh ones.'),
+        make_option('--interval', dest='interval', type='int', default=0,
+            help='Keep running, checking the charts every INTERVAL '
+                 'seconds.'),
+    )
+
+    def handle(self, **options):
+        if not charts.charts_are_kept():
+            self.stderr.write('The cache backend keeps nothing, so the '
+                              'charts are built as the dashboard asks for '
+                              'them instead.  Set up a shared cache such '
+                              'as memcached to build them here.\n')
+            return
+        while True:
+            for key in charts.build_charts(force=options['force']):
+                self.stdout.write('Built %s\n' % key)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class DailyStats(models.Model):
+    """
+    What happened to one kind of object on one day.  Kept up to date as
+    historical records are written -- see stats.py.
+    """
+    date = models.DateField()
+    # e.g. 'pages.page'
+    model = models.CharField(max_length=100)
+    added = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    edits = models.IntegerField(default=0)
+    # The change in the total size of the content of the objects that
+    # exist.
+    content_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('model', 'date')
+        ordering = ('date',)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.model, self.date)
+
+
+import signals
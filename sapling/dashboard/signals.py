@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.contrib.auth.models import User
+
+from versionutils.versioning.signals import history_recorded
+
+import stats
+
+
+def _history_recorded(sender, records, **kws):
+    stats.record_history(sender, records)
+
+
+def _user_saved(sender, instance, created, raw, **kws):
+    if created and not raw:
+        stats.add_to_day(instance.date_joined.date(), stats.USERS, added=1)
+
+for model in stats.TRACKED_MODELS:
+    history_recorded.connect(_history_recorded, sender=model)
+post_save.connect(_user_saved, sender=User)
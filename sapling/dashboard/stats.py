@@ -0,0 +1,225 @@
+"""
+Daily statistics for the dashboard charts.
+
+Rather than scanning the whole history of every model each time a chart
+is drawn, we keep a DailyStats row per model per day and add to it as
+each historical record is written.  The charts are built from these
+rows.  The backfill_dashboard_stats management command rebuilds them
+from the history.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Min
+from django.contrib.auth.models import User
+
+from pages.models import Page, PageFile
+from maps.models import MapData
+from redirects.models import Redirect
+from versionutils.versioning.archive import archived_values
+from versionutils.versioning.constants import ADDED_TYPES, DELETED_TYPES
+from versionutils.versioning.indexes import get_identity_fields
+from versionutils.versioning.utils import get_versions
+
+from models import DailyStats
+
+TRACKED_MODELS = (Page, MapData, PageFile, Redirect)
+# Models whose content size we keep track of, with the field to measure.
+CONTENT_FIELDS = {Page: 'content'}
+USERS = 'auth.user'
+
+
+def model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+
+def add_to_day(day, label, added=0, deleted=0, edits=0, content_bytes=0):
+    """
+    Adds the provided amounts to the DailyStats row for `label` on `day`,
+    creating it if need be.
+    """
+    amounts = {'added': added, 'deleted': deleted, 'edits': edits,
+               'content_bytes': content_bytes}
+    changes = dict((k, F(k) + v) for k, v in amounts.iteritems() if v)
+    if not changes:
+        return
+    qs = DailyStats.objects.filter(model=label, date=day)
+    if qs.update(**changes):
+        return
+    try:
+        sid = transaction.savepoint()
+        DailyStats(model=label, date=day, **amounts).save()
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # Someone else just created it.
+        transaction.savepoint_rollback(sid)
+        qs.update(**changes)
+
+
+def _content_length(value):
+    return len(value or '')
+
+
+def _length_select(hist_model, field_name):
+    """
+    Returns:
+        An extra() select that measures `field_name` in the database, so
+        the content itself needn't be loaded.
+    """
+    column = hist_model._meta.get_field(field_name).column
+    return {'content_length': 'length(%s)' %
+            connection.ops.quote_name(column)}
+
+
+def _archived_length(hist_model, history_id, field_name):
+    values = archived_values(hist_model, [history_id]).get(history_id, {})
+    return _content_length(values.get(field_name))
+
+
+def _previous_content_length(hist_model, record, field_name):
+    """
+    Returns:
+        The size of the content of the object `record` describes, as it
+        was just before `record`.
+    """
+    identity = dict((f.attname, getattr(record, f.attname))
+                    for f in get_identity_fields(hist_model))
+    previous = hist_model.objects.filter(**identity).filter(
+        history_date__lte=record.history_date).exclude(
+        history_id=record.history_id).order_by('-history_date',
+        '-history_id').extra(select=_length_select(hist_model, field_name))
+    previous = previous.values_list('history_type', 'content_length',
+                                    'history_archived', 'history_id')[:1]
+    if not previous:
+        return 0
+    history_type, length, archived, history_id = previous[0]
+    if history_type in DELETED_TYPES:
+        return 0
+    if archived:
+        return _archived_length(hist_model, history_id, field_name)
+    return length or 0
+
+
+def record_history(model, records):
+    """
+    Adds the newly-written historical `records` of `model` to the daily
+    statistics.
+    """
+    label = model_label(model)
+    field_name = CONTENT_FIELDS.get(model)
+    days = defaultdict(lambda: defaultdict(int))
+    for record in records:
+        day = days[record.history_date.date()]
+        day['edits'] += 1
+        if record.history_type in ADDED_TYPES:
+            day['added'] += 1
+        elif record.history_type in DELETED_TYPES:
+            day['deleted'] += 1
+        if field_name:
+            after = 0
+            if record.history_type not in DELETED_TYPES:
+                after = _content_length(getattr(record, field_name))
+            day['content_bytes'] += after - _previous_content_length(
+                record.__class__, record, field_name)
+    for day, amounts in days.iteritems():
+        add_to_day(day, label, **amounts)
+
+
+def _history_rows(model):
+    """
+    Yields (date, history_type, content length) for each historical
+    record of `model`, grouped by object and in order.
+    """
+    hist_model = get_versions(model).model
+    identity = [f.attname for f in get_identity_fields(hist_model)]
+    qs = hist_model.objects.order_by(*(identity + ['history_date',
+                                                   'history_id']))
+    field_name = CONTENT_FIELDS.get(model)
+    names = ['history_date', 'history_type']
+    if field_name:
+        qs = qs.extra(select=_length_select(hist_model, field_name))
+        names += ['content_length', 'history_archived', 'history_id']
+
+    for row in qs.values_list(*(identity + names)).iterator():
+        key, row = row[:len(identity)], row[len(identity):]
+        length = 0
+        if field_name:
+            length = row[2] or 0
+            if row[3]:
+                length = _archived_length(hist_model, row[4], field_name)
+        yield key, row[0], row[1], length
+
+
+@transaction.commit_on_success
+def rebuild(model):
+    """
+    Rebuilds the DailyStats rows for `model` from its history.
+    """
+    label = model_label(model)
+    days = defaultdict(lambda: defaultdict(int))
+    last_key = None
+    before = 0
+    for key, date, history_type, length in _history_rows(model):
+        if key != last_key:
+            last_key, before = key, 0
+        day = days[date.date()]
+        day['edits'] += 1
+        if history_type in ADDED_TYPES:
+            day['added'] += 1
+        elif history_type in DELETED_TYPES:
+            day['deleted'] += 1
+        after = 0 if history_type in DELETED_TYPES else length
+        day['content_bytes'] += after - before
+        before = after
+    DailyStats.objects.filter(model=label).delete()
+    for day, amounts in days.iteritems():
+        DailyStats(model=label, date=day, **amounts).save()
+
+
+@transaction.commit_on_success
+def rebuild_users():
+    days = defaultdict(int)
+    for joined in User.objects.values_list('date_joined', flat=True).iterator():
+        days[joined.date()] += 1
+    DailyStats.objects.filter(model=USERS).delete()
+    for day, added in days.iteritems():
+        DailyStats(model=USERS, date=day, added=added).save()
+
+
+def daily_series(label, start):
+    """
+    Returns:
+        A list of (datetime, DailyStats) for each day from `start` through
+        today for `label`.  Days with nothing recorded get an empty
+        DailyStats.
+    """
+    rows = dict((s.date, s) for s in DailyStats.objects.filter(model=label))
+    if isinstance(start, datetime.datetime):
+        start = start.date()
+    day, today = start, datetime.date.today()
+    series = []
+    while day <= today:
+        stats = rows.get(day) or DailyStats(model=label, date=day)
+        series.append((datetime.datetime.combine(day, datetime.time()),
+                       stats))
+        day += datetime.timedelta(days=1)
+    return series
+
+
+def cumulative(series, amount):
+    """
+    Returns:
+        A time series of the running total of amount(stats) over `series`.
+    """
+    total = 0
+    l = []
+    for d, stats in series:
+        total += amount(stats)
+        l.append((d, total))
+    return l
+
+
+def first_day(label):
+    return DailyStats.objects.filter(model=label).aggregate(
+        Min('date'))['date__min']
@@ -0,0 +1,108 @@
+import datetime
+
+from django.test import TestCase
+from django.core.cache import get_cache
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.utils import simplejson as json
+
+from pages.models import Page
+
+from models import DailyStats
+import stats
+import charts
+
+
+class DailyStatsTest(TestCase):
+    def _today(self, label):
+        return DailyStats.objects.get(model=label, date=datetime.date.today())
+
+    def test_recorded_as_history_is_written(self):
+        p = Page(name='Stats', content='<p>123</p>')
+        p.save()
+        p.content = '<p>12345</p>'
+        p.save()
+        label = stats.model_label(Page)
+        today = self._today(label)
+        self.assertEqual((today.added, today.deleted, today.edits),
+                         (1, 0, 2))
+        self.assertEqual(today.content_bytes, len('<p>12345</p>'))
+
+        p.delete()
+        today = self._today(label)
+        self.assertEqual((today.added, today.deleted, today.edits),
+                         (1, 1, 3))
+        self.assertEqual(today.content_bytes, 0)
+
+        User.objects.create_user('stats', 'stats@example.org')
+        self.assertEqual(self._today(stats.USERS).added, 1)
+
+    def test_rebuild_matches(self):
+        p = Page(name='Stats', content='<p>123</p>')
+        p.save()
+        p.content = '<p>12345</p>'
+        p.save()
+        label = stats.model_label(Page)
+        before = self._today(label)
+        DailyStats.objects.all().delete()
+
+        stats.rebuild(Page)
+        after = self._today(label)
+        for name in ('added', 'deleted', 'edits', 'content_bytes'):
+            self.assertEqual(getattr(before, name), getattr(after, name))
+
+        series = stats.daily_series(label, datetime.date.today())
+        self.assertEqual(stats.cumulative(series, lambda s: s.added)[-1][1],
+                         1)
+
+
+class ChartsTest(TestCase):
+    def setUp(self):
+        self.old_cache = charts.cache
+        charts.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+
+    def tearDown(self):
+        charts.cache = self.old_cache
+
+    def test_view_never_builds(self):
+        Page(name='Charts', content='<p>Charts</p>').save()
+        response = self.client.get(reverse('dashboard:render'),
+                                   {'graph': 'num_edits_over_time'})
+        self.assertEqual(json.loads(response.content), {'generated': False})
+
+        self.assertEqual(len(charts.build_charts()), len(charts.CHARTS))
+        # Fresh charts aren't rebuilt.
+        self.assertEqual(charts.build_charts(), [])
+        response = self.client.get(reverse('dashboard:render'),
+                                   {'graph': 'num_edits_over_time'})
+        data = json.loads(response.content)
+        self.assertTrue(data['generated'])
+        self.assertFalse(data['_stale'])
+
+    def test_one_build_at_a_time(self):
+        key, function = charts.CHARTS[0]
+        charts.cache.add(charts.LOCK_KEY % key, True, 60)
+        self.assertEqual(charts.build_chart(key, function), None)
+        charts.cache.delete(charts.LOCK_KEY % key)
+        self.assertNotEqual(charts.build_chart(key, function), None)
+
+    def test_lock_of_another_build_kept(self):
+        key, function = charts.CHARTS[0]
+        lock_key = charts.LOCK_KEY % key
+
+        def slow_build(oldest_page):
+            # Our lock expired and another process took it.
+            charts.cache.set(lock_key, 'theirs', 60)
+            return function(oldest_page)
+        Page(name='Charts', content='<p>Charts</p>').save()
+        self.assertNotEqual(charts.build_chart(key, slow_build), None)
+        self.assertEqual(charts.cache.get(lock_key), 'theirs')
+
+    def test_built_in_view_without_cache(self):
+        charts.cache = get_cache(
+            'django.core.cache.backends.dummy.DummyCache')
+        Page(name='Charts', content='<p>Charts</p>').save()
+        response = self.client.get(reverse('dashboard:render'),
+                                   {'graph': 'num_edits_over_time'})
+        self.assertTrue(json.loads(response.content)['generated'])
@@ -24,6 +24,7 @@ class MapResource(pages.api.PageURLMixin, gis_resources.ModelResource):
             'polys': ALL,
             'geom': ALL,
             'length': ALL,
+            'last_modified': ALL,
         }
         list_allowed_methods = ['get', 'post']
         authentication = ApiKeyWriteAuthentication()
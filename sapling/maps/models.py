@@ -2,6 +2,8 @@ from django.contrib.gis.db import models
 from django.core.urlresolvers import reverse
 
 from versionutils import versioning
+from versionutils.versioning.fields import (LastModifiedField,
+    LastEditorField, VersionCountField)
 
 from fields import FlatCollectionFrom
 
@@ -14,6 +16,10 @@ class MapData(models.Model):
     length = models.FloatField(null=True, editable=False)
 
     page = models.OneToOneField('pages.Page')
+    # Kept up to date from the map's history.
+    last_modified = LastModifiedField()
+    last_editor = LastEditorField()
+    version_count = VersionCountField()
 
     objects = models.GeoManager()
 
@@ -39,3 +45,4 @@ versioning.register(MapData)
 # For registration calls
 import api
 import feeds
+import signals
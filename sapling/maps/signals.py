@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+
+from pages.models import Page
+from utils.cache_dependencies import invalidate, page_dependency
+
+from models import MapData
+
+
+def _invalidate_page_cache(sender, instance, **kws):
+    try:
+        invalidate(page_dependency(instance.page.slug))
+    except Page.DoesNotExist:
+        pass
+
+post_save.connect(_invalidate_page_cache, sender=MapData)
+post_delete.connect(_invalidate_page_cache, sender=MapData)
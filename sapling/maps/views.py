@@ -15,6 +15,8 @@ from django.utils.safestring import mark_safe
 
 from versionutils import diff
 from utils.views import Custom404Mixin, CreateObjectMixin, JSONResponseMixin
+from utils.views import ConditionalGetMixin
+from utils.cache_dependencies import record_dependency, page_dependency
 from versionutils.versioning.views import DeleteView, UpdateView
 from versionutils.versioning.views import RevertView, VersionsList
 from pages.models import Page, slugify, name_to_url
@@ -26,8 +28,15 @@ from forms import MapForm
 from django.utils.html import escape
 
 
-class MapDetailView(Custom404Mixin, DetailView):
+class MapDetailView(Custom404Mixin, ConditionalGetMixin, DetailView):
     model = MapData
+    track_dependencies = True
+
+    def get_last_modified(self):
+        dates = MapData.versions.filter(
+            page__slug=slugify(self.kwargs.get('slug'))).values_list(
+            'history_date', flat=True)[:1]
+        return dates and dates[0] or None
 
     def handler404(self, request, *args, **kwargs):
         page_slug = kwargs.get('slug')
@@ -48,10 +57,12 @@ class MapDetailView(Custom404Mixin, DetailView):
         return mapdata
 
     def get_object_date(self):
-        return self.object.versions.most_recent().version_info.date
+        return (self.object.last_modified or
+                self.object.versions.most_recent().version_info.date)
 
     def get_context_data(self, **kwargs):
         context = super(MapDetailView, self).get_context_data(**kwargs)
+        record_dependency(page_dependency(self.object.page.slug))
 
         context['date'] = self.get_object_date()
         context['map'] = InfoMap([(self.object.geom, self.object.page.name)],
@@ -240,6 +251,10 @@ class MapDeleteView(MapDetailView, DeleteView):
     model = MapData
     context_object_name = 'mapdata'
 
+    def get_last_modified(self):
+        # Don't hand out validators for the confirmation form.
+        return None
+
     def get_success_url(self):
         # Redirect back to the map.
         return reverse('maps:show', args=[self.kwargs.get('slug')])
@@ -250,6 +265,10 @@ class MapRevertView(MapVersionDetailView, RevertView):
     context_object_name = 'mapdata'
     template_name = 'maps/mapdata_confirm_revert.html'
 
+    def get_last_modified(self):
+        # Don't hand out validators for the confirmation form.
+        return None
+
     def get_success_url(self):
         # Redirect back to the map.
         return reverse('maps:show', args=[self.kwargs.get('slug')])
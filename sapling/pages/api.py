@@ -116,9 +116,11 @@ class PageResource(PageURLMixin, ModelResource):
             'slug': ALL,
             'page_tags': ALL_WITH_RELATIONS,
             'map': ALL_WITH_RELATIONS,
+            'last_modified': ALL,
+            'version_count': ALL,
         }
         list_allowed_methods = ['get', 'post']
-        ordering = ['name', 'slug']
+        ordering = ['name', 'slug', 'last_modified', 'version_count']
         validation = PageValidation()
         authentication = ApiKeyWriteAuthentication()
         authorization = DjangoAuthorization()
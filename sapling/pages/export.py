@@ -0,0 +1,415 @@
+"""
+Exporting the wiki as a static site.
+
+Every page is rendered through PageDetailView's template, just as it is
+when someone views it, and written out as <pretty slug>/index.html with
+links between pages, files and thumbnails rewritten to relative paths.
+Stored files and thumbnails are hard-linked into media/ and STATIC_ROOT
+into static/, so the export takes next to no extra disk space.  Files on
+another disk are copied instead.
+
+Pages are rendered by a pool of worker processes.  The index of page
+paths and files that links are resolved against is built once, before
+the workers are started, and shared with them.
+
+The export remembers when it was made and what each page depended on
+(see utils.cache_dependencies).  The next export only renders the pages
+that changed since -- going by their history -- along with the pages
+that include them, list them or link to them.
+"""
+import errno
+import hashlib
+import logging
+import multiprocessing
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from urllib import unquote
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+from django.utils import simplejson as json
+from django.utils import translation
+from django.utils.http import urlquote
+
+from maps.models import MapData
+from redirects.models import Redirect
+from tags.models import PageTagSet, Tag
+from utils import cache_dependencies, thumbnails
+from utils.cache_dependencies import page_dependency, tag_dependency
+from utils.workers import init_worker
+
+from models import Page, PageFile, name_to_url, url_to_name, slugify
+from views import PageDetailView
+
+MANIFEST = '.export.json'
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# Pages handed to a worker at a time.
+CHUNK_SIZE = 100
+
+_url_attribute = re.compile(r'''(\s(?:href|src)=)(["'])(/[^"']*)\2''')
+_file_info_url = re.compile(r'^/(.+)/_files/(.+)/_info/$')
+
+# Set up by export() before the workers start, so they share it.
+_index = None
+
+
+def page_path(pretty_slug):
+    """
+    Returns:
+        The path, relative to the export, that the page with
+        `pretty_slug` is written to.
+    """
+    parts = pretty_slug.split('/')
+    if [p for p in parts if p in ('', '.', '..')]:
+        # Not usable as a directory name.
+        parts = ['_pages', hashlib.md5(pretty_slug.encode('utf-8')
+                                      ).hexdigest()]
+    return '/'.join(parts + ['index.html'])
+
+
+def build_index(site_url=None):
+    """
+    Returns:
+        A dictionary of everything links are resolved against:
+
+        pages       Each page's slug, and the source of each redirect,
+                    mapped to the page's pretty slug.
+        paths       The same slugs mapped to the path of the page in the
+                    export.
+        files       (page slug, file name) mapped to the storage name of
+                    each current file.
+        site_url    The live site, which links to anything that isn't
+                    exported are made to point at.
+    """
+    pages, paths = {}, {}
+    for slug, name in Page.objects.values_list('slug', 'name').iterator():
+        pages[slug] = name_to_url(name)
+        paths[slug] = page_path(pages[slug])
+    for source, slug in Redirect.objects.values_list(
+            'source', 'destination__slug').iterator():
+        if slug in pages and source not in pages:
+            pages[source] = pages[slug]
+            paths[source] = paths[slug]
+    files = {}
+    for slug, name, stored in PageFile.objects.values_list(
+            'slug', 'name', 'file').iterator():
+        files[(slug, name)] = stored
+    return {'pages': pages, 'paths': paths, 'files': files,
+            'site_url': (site_url or '').rstrip('/')}
+
+
+def link_file(source, destination):
+    """
+    Hard-links the file `source` to `destination`, or copies it if it
+    can't be linked.  Does nothing if `destination` already exists.
+    """
+    if os.path.exists(destination):
+        return
+    directory = os.path.dirname(destination)
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    try:
+        os.link(source, destination)
+    except OSError, e:
+        if e.errno == errno.EEXIST:
+            return
+        shutil.copy2(source, destination)
+
+
+def link_tree(source, destination):
+    """
+    Hard-links every file below the directory `source` into
+    `destination`.
+    """
+    for root, dirs, files in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        for name in files:
+            link_file(os.path.join(root, name), os.path.join(target, name))
+
+
+def write_file(path, content):
+    # Write then rename, so nobody reading the export sees half a page.
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.export')
+    f = os.fdopen(fd, 'wb')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+    os.chmod(tmp_path, 0644)
+    os.rename(tmp_path, path)
+
+
+def fs_path(output_dir, path):
+    """
+    Returns:
+        The file system path of `path`, a path in the export.
+    """
+    return os.path.join(output_dir, *path.encode('utf-8').split('/'))
+
+
+def local_url(url, path, media):
+    """
+    Returns:
+        The link to the site-relative `url` from the exported file at
+        `path`.  Media that's linked to is added to the set `media`.
+    """
+    scheme, netloc, url_path, query, fragment = urlsplit(url)
+    target = None
+    if url_path.startswith(settings.STATIC_URL):
+        target = 'static/' + url_path[len(settings.STATIC_URL):]
+    elif url_path.startswith(settings.MEDIA_URL):
+        name = unquote(url_path[len(settings.MEDIA_URL):].encode('utf-8'))
+        media.add(name.decode('utf-8'))
+        target = 'media/' + name.decode('utf-8')
+    elif url_path == '/':
+        target = 'index.html'
+    else:
+        match = _file_info_url.match(url_path)
+        if match:
+            slug = slugify(url_to_name(match.group(1)))
+            name = url_to_name(match.group(2))
+            stored = _index['files'].get((slug, name))
+            if stored:
+                media.add(stored)
+                target = 'media/' + stored
+        else:
+            slug = slugify(url_to_name(url_path.strip('/')))
+            target = _index['paths'].get(slug)
+    if target is None:
+        if _index['site_url']:
+            return _index['site_url'] + url
+        return url
+    link = urlquote(posixpath.relpath(target, posixpath.dirname(path) or '.'))
+    if fragment:
+        link += '#' + fragment
+    return link
+
+
+def rewrite_links(html, path, media):
+    """
+    Returns:
+        `html`, the page written to `path`, with its links made relative.
+    """
+    def rewrite(match):
+        attribute, quote, url = match.groups()
+        url = local_url(url.replace('&amp;', '&'), path, media)
+        return '%s%s%s%s' % (attribute, quote, url.replace('&', '&amp;'),
+                             quote)
+    return _url_attribute.sub(rewrite, html)
+
+
+def render_page(page):
+    """
+    Returns:
+        The HTML of `page` as PageDetailView shows it to an anonymous
+        visitor.
+    """
+    request = RequestFactory().get(page.get_absolute_url())
+    request.user = AnonymousUser()
+    view = PageDetailView(request=request, args=(),
+                          kwargs={'slug': page.slug,
+                                  'original_slug': page.pretty_slug})
+    view.object = page
+    context = view.get_context_data(object=page)
+    # Lets links find out whether pages exist without a query each.
+    context['page_index'] = _index['pages']
+    response = view.render_to_response(context)
+    response.render()
+    return response.content.decode('utf-8')
+
+
+def export_pages(output_dir, slugs):
+    """
+    Renders and writes out the pages with `slugs`.
+
+    Returns:
+        A dictionary mapping the slug of each page exported to a list of
+        its dependencies.
+    """
+    exported = {}
+    media = set()
+    for page in Page.objects.filter(slug__in=slugs):
+        cache_dependencies.start_recording()
+        try:
+            html = render_page(page)
+        except Exception:
+            logging.exception('Unable to export %s' % page.name)
+            continue
+        finally:
+            dependencies = cache_dependencies.stop_recording()[0]
+        paths = [_index['paths'][page.slug]]
+        if page.slug == slugify('Front Page'):
+            paths.append('index.html')
+        for path in paths:
+            write_file(fs_path(output_dir, path),
+                       rewrite_links(html, path, media).encode('utf-8'))
+        exported[page.slug] = sorted(dependencies)
+    for name in media:
+        source = fs_path(settings.MEDIA_ROOT, name)
+        if os.path.isfile(source):
+            link_file(source, fs_path(output_dir, 'media/' + name))
+    return exported
+
+
+def _init_worker():
+    init_worker()
+    translation.activate(settings.LANGUAGE_CODE)
+
+
+def _export_chunk(args):
+    # Make any missing thumbnails right here.  The export needs them now,
+    # and pool workers can't start a thumbnail pool of their own.
+    old_processes, thumbnails.PROCESSES = thumbnails.PROCESSES, 0
+    try:
+        return export_pages(*args)
+    finally:
+        thumbnails.PROCESSES = old_processes
+
+
+def changed_since(since):
+    """
+    Returns:
+        The set of dependencies that may have changed since the datetime
+        `since`, going by the history of pages and what's shown with them.
+    """
+    slugs = set(Page.versions.filter(history_date__gt=since).values_list(
+        'slug', flat=True))
+    slugs.update(PageFile.versions.filter(history_date__gt=since
+        ).values_list('slug', flat=True))
+    tagged = set(PageTagSet.versions.filter(history_date__gt=since
+        ).values_list('page__slug', flat=True))
+    slugs.update(tagged)
+    slugs.update(MapData.versions.filter(history_date__gt=since
+        ).values_list('page__slug', flat=True))
+    slugs.update(Redirect.versions.filter(history_date__gt=since
+        ).values_list('source', flat=True))
+    changed = set([page_dependency(s) for s in slugs])
+    tags = Tag.objects.filter(pagetagset__page__slug__in=tagged)
+    changed.update([tag_dependency(s) for s in
+                    tags.values_list('slug', flat=True)])
+    return changed
+
+
+def load_manifest(output_dir):
+    try:
+        f = open(os.path.join(output_dir, MANIFEST))
+    except IOError:
+        return None
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def remove_page(output_dir, path):
+    full_path = fs_path(output_dir, path)
+    if os.path.exists(full_path):
+        os.remove(full_path)
+        try:
+            os.removedirs(os.path.dirname(full_path))
+        except OSError:
+            # Not empty.
+            pass
+
+
+def export(output_dir, processes=None, full=False, site_url=None):
+    """
+    Exports the wiki as a static site to the directory `output_dir`.
+
+    Args:
+        output_dir: Where to write the site.
+        processes: The number of worker processes to render pages with.
+            Defaults to the number of CPUs.  With 0, pages are rendered
+            in this process.
+        full: If True, render every page, not just the ones that changed
+            since the last export to `output_dir`.
+        site_url: The live site's URL, e.g. 'http://example.org'.  Links
+            to pages' history, editing and so on go there.
+
+    Returns:
+        A dictionary with the number of pages 'exported', 'unchanged',
+        'removed' and 'failed'.
+    """
+    global _index
+
+    started = datetime.now()
+    output_dir = os.path.abspath(output_dir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    _index = build_index(site_url)
+    manifest = None if full else load_manifest(output_dir)
+    previous = (manifest or {}).get('pages', {})
+    if manifest:
+        since = datetime.strptime(manifest['exported'], DATE_FORMAT)
+        changed = changed_since(since)
+    else:
+        changed = None
+
+    current = set(Page.objects.values_list('slug', flat=True))
+    removed = [s for s in previous if s not in current]
+    for slug in removed:
+        remove_page(output_dir, previous[slug]['path'])
+        if changed is not None:
+            changed.add(page_dependency(slug))
+
+    to_export = []
+    for slug in sorted(current):
+        old = previous.get(slug)
+        if (changed is None or old is None or
+                old['path'] != _index['paths'][slug] or
+                changed.intersection(old['dependencies'])):
+            to_export.append(slug)
+
+    if settings.STATIC_ROOT and os.path.isdir(settings.STATIC_ROOT):
+        link_tree(settings.STATIC_ROOT, os.path.join(output_dir, 'static'))
+
+    chunks = [(output_dir, to_export[i:i + CHUNK_SIZE])
+              for i in range(0, len(to_export), CHUNK_SIZE)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker)
+        try:
+            results = pool.imap_unordered(_export_chunk, chunks)
+            exported = {}
+            for result in results:
+                exported.update(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        exported = {}
+        for chunk in chunks:
+            exported.update(_export_chunk(chunk))
+
+    pages = {}
+    for slug in current:
+        if slug in exported:
+            pages[slug] = {'path': _index['paths'][slug],
+                           'dependencies': exported[slug]}
+        elif slug in previous and slug not in to_export:
+            pages[slug] = previous[slug]
+        # Pages that failed aren't remembered, so they're tried again.
+    write_file(os.path.join(output_dir, MANIFEST), json.dumps(
+        {'exported': started.strftime(DATE_FORMAT), 'pages': pages}))
+    _index = None
+    return {'exported': len(exported),
+            'unchanged': len(current) - len(to_export),
+            'removed': len(removed),
+            'failed': len(to_export) - len(exported)}
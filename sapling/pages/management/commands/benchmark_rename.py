@@ -0,0 +1,93 @@
+import os
+import time
+from optparse import make_option
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection
+
+from pages.models import Page, PageFile, slugify
+from maps.models import MapData
+from redirects.models import Redirect
+from tags.models import Tag, PageTagSet
+from versionutils.versioning.utils import get_versions
+
+
+class Command(BaseCommand):
+    help = ('Times Page.rename_to() on a page with many files, a map, tags '
+            'and redirects pointing at it.  The page is renamed back and '
+            'forth and everything it creates is removed afterwards.')
+    option_list = BaseCommand.option_list + (
+        make_option('--files', dest='files', type='int', default=200,
+            help='Number of files to attach to the page.'),
+        make_option('--redirects', dest='redirects', type='int', default=20,
+            help='Number of redirects to point at the page.'),
+        make_option('--repeat', dest='repeat', type='int', default=4,
+            help='Number of renames to time.'),
+        make_option('--keep', action='store_true', dest='keep',
+            default=False, help="Don't remove the pages afterwards."),
+    )
+
+    def handle(self, **options):
+        names = ['Rename benchmark %d %s' % (time.time(), s)
+                 for s in ('A', 'B')]
+        p = Page(name=names[0], content='<p>Rename benchmark.</p>')
+        p.save()
+        for i in range(options['files']):
+            PageFile(file=ContentFile('file %d' % i), name='file%d.txt' % i,
+                     slug=p.slug).save()
+        MapData(page=p, points=GEOSGeometry(
+            'MULTIPOINT (-122.43 37.79, -122.39 37.76)')).save()
+        tagset = PageTagSet(page=p)
+        tagset.save()
+        tag, created = Tag.objects.get_or_create(slug='rename benchmark',
+            defaults={'name': 'rename benchmark'})
+        tagset.tags.add(tag)
+        sources = [slugify('%s redirect %d' % (names[0], i))
+                   for i in range(options['redirects'])]
+        for source in sources:
+            Redirect(source=source, destination=p).save()
+
+        connection.use_debug_cursor = True
+        try:
+            for i in range(options['repeat']):
+                p = Page.objects.get(slug=slugify(names[i % 2]))
+                queries = len(connection.queries)
+                start = time.time()
+                p.rename_to(names[(i + 1) % 2])
+                seconds = time.time() - start
+                self.stdout.write('rename %d: %.3fs, %d queries\n' % (
+                    i + 1, seconds, len(connection.queries) - queries))
+        finally:
+            connection.use_debug_cursor = None
+
+        if not options['keep']:
+            slugs = [slugify(n) for n in names]
+            self.cleanup(slugs, slugs + sources)
+
+    def cleanup(self, slugs, sources):
+        files = PageFile.objects.filter(slug__in=slugs)
+        names = set(files.values_list('file', flat=True))
+        for pf in files:
+            pf.delete(track_changes=False)
+        for r in Redirect.objects.filter(source__in=sources):
+            r.delete(track_changes=False)
+        for p in Page.objects.filter(slug__in=slugs):
+            p.delete(track_changes=False)
+        # Historical maps, tag sets and redirects go along with the
+        # historical pages they point at.
+        get_versions(PageFile).filter(slug__in=slugs).delete()
+        get_versions(Redirect).filter(source__in=sources).delete()
+        get_versions(Page).filter(slug__in=slugs).delete()
+
+        # The versioned storage never deletes, so we remove the stored
+        # files ourselves, unless something else has the same contents.
+        names.difference_update(PageFile.objects.filter(
+            file__in=names).values_list('file', flat=True))
+        names.difference_update(get_versions(PageFile).filter(
+            file__in=names).values_list('file', flat=True))
+        storage = PageFile._meta.get_field('file').storage
+        for name in names:
+            if storage.exists(name):
+                os.remove(storage.path(name))
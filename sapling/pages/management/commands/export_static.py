@@ -0,0 +1,39 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.export import export
+
+
+class Command(BaseCommand):
+    args = '<directory>'
+    help = ('Exports every page as static HTML, with its files, for a '
+            'read-only mirror of the wiki.  Only pages that changed since '
+            'the last export to the directory are rendered again.\n'
+            'Usage: localwiki-manage export_static [--site-url=URL] '
+            '<directory>')
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', dest='processes', type='int',
+            help='Number of processes to render pages with.  Defaults to '
+                 'the number of CPUs; 0 renders them in this process.'),
+        make_option('--full', action='store_true', dest='full',
+            default=False,
+            help='Render every page, not just the ones that changed.'),
+        make_option('--site-url', dest='site_url',
+            help='URL of the live site, which links to history, editing '
+                 'and anything else that isn\'t exported point at.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the directory to export to.')
+        start = time.time()
+        counts = export(args[0], processes=options.get('processes'),
+                        full=options['full'], site_url=options.get('site_url'))
+        self.stdout.write('Exported %(exported)d pages (%(unchanged)d '
+                          'unchanged, %(removed)d removed) ' % counts +
+                          'in %.1fs\n' % (time.time() - start))
+        if counts['failed']:
+            self.stderr.write('%d pages could not be exported and will be '
+                              'tried again next time\n' % counts['failed'])
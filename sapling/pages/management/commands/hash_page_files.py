@@ -0,0 +1,60 @@
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pages.models import PageFile
+from utils.storage import is_hashed_name
+from versionutils.versioning.utils import get_versions
+
+
+class Command(BaseCommand):
+    help = ('Moves page files stored under their old random names into '
+            'content-addressed storage, so that identical files are only '
+            'stored once.  Both current and historical files are moved.')
+    option_list = BaseCommand.option_list + (
+        make_option('--delete-old', action='store_true', dest='delete_old',
+            default=False,
+            help='Delete each old file once nothing refers to it.'),
+    )
+
+    def handle(self, **options):
+        storage = PageFile._meta.get_field('file').storage
+        hist_model = get_versions(PageFile).model
+        names = set(PageFile.objects.values_list('file', flat=True))
+        names.update(hist_model.objects.values_list('file', flat=True))
+
+        moved, stored, freed = 0, set(), 0
+        for name in sorted(names):
+            if not name or is_hashed_name(name):
+                continue
+            if not storage.exists(name):
+                self.stderr.write('Missing file: %s\n' % name)
+                continue
+            f = storage.open(name)
+            try:
+                new_name = storage.save(name, f)
+            finally:
+                f.close()
+            self.rename(hist_model, name, new_name)
+            moved += 1
+            stored.add(new_name)
+            if options['delete_old']:
+                # The versioned storage never deletes, so we do it here.
+                path = storage.path(name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+
+        self.stdout.write('Moved %d files into %d stored files\n' %
+                          (moved, len(stored)))
+        if options['delete_old']:
+            self.stdout.write('Freed %d bytes\n' % freed)
+        if moved:
+            self.stdout.write('Thumbnails will be made again for the new '
+                              'names; run make_thumbnails to make them now.\n')
+
+    @transaction.commit_on_success
+    def rename(self, hist_model, name, new_name):
+        PageFile.objects.filter(file=name).update(file=new_name)
+        hist_model.objects.filter(file=name).update(file=new_name)
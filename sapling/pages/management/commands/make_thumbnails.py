@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from pages.models import Page
+from pages.thumbnails import queue_page_thumbnails
+from utils import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Makes the thumbnails of resized images on every page that '
+            "haven't been made yet, e.g. after upgrading or clearing the "
+            'thumbnail store.')
+
+    def handle(self, **options):
+        made = queued = 0
+        for page in Page.objects.all().iterator():
+            queued += queue_page_thumbnails(page)
+            if queued >= thumbnails.MAX_QUEUED // 2:
+                # Let the queue drain before it starts dropping them.
+                made += thumbnails.wait()
+                queued = 0
+        made += thumbnails.wait()
+        self.stdout.write('Made %d thumbnails\n' % made)
@@ -5,6 +5,7 @@ import re
 from copy import copy
 
 from django.contrib.gis.db import models
+from django.db import connection, transaction
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import stringfilter
 from django.core.exceptions import ValidationError
@@ -12,12 +13,16 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy
 
-from django_randomfilenamestorage.storage import (
-    RandomFilenameFileSystemStorage)
-
 from ckeditor.models import HTML5FragmentField
+from utils.storage import ContentAddressedFileSystemStorage
+from utils.transactions import commit_on_success
 from versionutils import diff
 from versionutils import versioning
+from versionutils.versioning.fields import (LastModifiedField,
+    LastEditorField, VersionCountField)
+from versionutils.versioning.bulk import (bulk_history,
+    create_historical_records)
+from versionutils.versioning.constants import TYPE_ADDED
 
 import exceptions
 
@@ -74,6 +79,10 @@ class Page(models.Model):
                                  allowed_attributes_map=allowed_attributes_map,
                                  allowed_styles_map=allowed_styles_map,
                                  rename_elements=rename_elements)
+    # Kept up to date from the page's history.
+    last_modified = LastModifiedField()
+    last_editor = LastEditorField()
+    version_count = VersionCountField()
 
     def __unicode__(self):
         return self.name
@@ -126,15 +135,8 @@ class Page(models.Model):
         Renames the page to `pagename`.  Moves related objects around
         accordingly.
         """
-        def _get_slug_lookup(unique_together, obj, new_p):
-            d = {}
-            for field in unique_together:
-                d[field] = getattr(obj, field)
-            d['slug'] = new_p.slug
-            return d
-
-        from redirects.models import Redirect
-        from redirects.exceptions import RedirectToSelf
+        from utils.cache_dependencies import invalidate, page_dependency
+        from search_indexes import PageIndex
 
         if Page.objects.filter(slug=slugify(pagename)):
             if slugify(pagename) == self.slug:
@@ -147,87 +149,171 @@ class Page(models.Model):
                 raise exceptions.PageExistsError(
                     _("The page '%s' already exists!") % pagename)
 
-        # Copy the current page into the new page, zeroing out the
-        # primary key and setting a new name and slug.
-        new_p = copy(self)
-        new_p.pk = None
-        new_p.name = pagename
-        new_p.slug = slugify(pagename)
-        new_p.save(comment=_('Renamed from "%s"') % self.name)
-
-        # Get all related objects before the original page is deleted.
-        related_objs = []
-        for r in self._meta.get_all_related_objects():
-            try:
-                rel_obj = getattr(self, r.get_accessor_name())
-            except:
-                continue  # No object for this relation.
-
-            # Is this a related /set/, e.g. redirect_set?
-            if isinstance(rel_obj, models.Manager):
-                # list() freezes the QuerySet, which we don't want to be
-                # fetched /after/ we delete the page.
-                related_objs.append(
-                    (r.get_accessor_name(), list(rel_obj.all())))
-            else:
-                related_objs.append((r.get_accessor_name(), rel_obj))
-
-        # Cache all ManyToMany values on related objects so we can restore them
-        # later--otherwise they will be lost when page is deleted.
-        for attname, rel_obj_list in related_objs:
-            if not isinstance(rel_obj_list, list):
-                rel_obj_list = [rel_obj_list]
-            for rel_obj in rel_obj_list:
-                rel_obj._m2m_values = dict(
-                    (f.attname, list(getattr(rel_obj, f.attname).all()))
-                    for f in rel_obj._meta.many_to_many)
-
-        # Create a redirect from the starting pagename to the new pagename.
-        redirect = Redirect(source=self.slug, destination=new_p)
-        # Creating the redirect causes the starting page to be deleted.
-        redirect.save()
-
-        # Point each related object to the new page and save the object with a
-        # 'was renamed' comment.
-        for attname, rel_obj in related_objs:
-            if isinstance(rel_obj, list):
-                for obj in rel_obj:
+        new_p, restored_m2m = self._rename_to(pagename)
+
+        # Now that everything's committed.
+        invalidate(page_dependency(self.slug), page_dependency(new_p.slug))
+        if restored_m2m:
+            # Saving the new page indexed it before its tags were back.
+            PageIndex(Page).update_object(new_p)
+
+    @commit_on_success
+    def _rename_to(self, pagename):
+        """
+        Does the work of rename_to() in a single transaction, with the
+        historical records written in batch.
+
+        Returns:
+            A tuple of the new page and whether any ManyToMany values
+            were restored on its related objects.
+        """
+        from redirects.models import Redirect
+        from redirects.exceptions import RedirectToSelf
+        from utils.cache_dependencies import invalidate, page_dependency
+
+        comment = _("Parent page renamed")
+        with bulk_history():
+            # Copy the current page into the new page, zeroing out the
+            # primary key and setting a new name and slug.
+            new_p = copy(self)
+            new_p.pk = None
+            new_p.name = pagename
+            new_p.slug = slugify(pagename)
+            new_p.save(comment=_('Renamed from "%s"') % self.name)
+
+            # Get all related objects before the original page is
+            # deleted.
+            related_objs = []
+            for r in self._meta.get_all_related_objects():
+                try:
+                    rel_obj = getattr(self, r.get_accessor_name())
+                except:
+                    continue  # No object for this relation.
+
+                # Is this a related /set/, e.g. redirect_set?
+                if isinstance(rel_obj, models.Manager):
+                    # list() freezes the QuerySet, which we don't want to
+                    # be fetched /after/ we delete the page.
+                    related_objs.append((r.field.name, list(rel_obj.all())))
+                else:
+                    related_objs.append((r.field.name, [rel_obj]))
+
+            # Cache all ManyToMany values on related objects so we can
+            # restore them later--otherwise they will be lost when page is
+            # deleted.
+            for field_name, objs in related_objs:
+                for obj in objs:
+                    obj._m2m_values = dict(
+                        (f, list(getattr(obj, f.attname).values_list(
+                            'pk', flat=True)))
+                        for f in obj._meta.many_to_many
+                        if f.rel.through._meta.auto_created)
+
+            # Create a redirect from the starting pagename to the new
+            # pagename.
+            redirect = Redirect(source=self.slug, destination=new_p)
+            # Creating the redirect causes the starting page to be
+            # deleted.
+            redirect.save()
+
+            # Point each related object to the new page and save the
+            # object with a 'was renamed' comment.
+            m2m_rows = []
+            for field_name, objs in related_objs:
+                for obj in objs:
                     obj.pk = None  # Reset the primary key before saving.
+                    setattr(obj, field_name, new_p)
                     try:
-                        getattr(new_p, attname).add(obj)
-                        obj.save(comment=_("Parent page renamed"))
-                        # Restore any m2m fields now that we have a new pk
-                        for name, value in obj._m2m_values.items():
-                            setattr(obj, name, value)
-                    except RedirectToSelf, s:
+                        obj.save(comment=comment)
+                    except RedirectToSelf:
                         # We don't want to create a redirect to ourself.
                         # This happens during a rename -> rename-back
                         # cycle.
                         continue
-            else:
-                # This is an easy way to set obj to point to new_p.
-                setattr(new_p, attname, rel_obj)
-                rel_obj.pk = None  # Reset the primary key before saving.
-                rel_obj.save(comment=_("Parent page renamed"))
-                # Restore any m2m fields now that we have a new pk
-                for name, value in rel_obj._m2m_values.items():
-                    setattr(rel_obj, name, value)
+                    for f, pks in obj._m2m_values.items():
+                        m2m_rows.extend([(f, obj.pk, pk) for pk in pks])
+            # Restore the m2m values now that we have new pks.  The
+            # historical sets are read from these rows when the
+            # bulk_history() block exits.
+            _insert_m2m_rows(m2m_rows)
 
         # Do the same with related-via-slug objects.
+        copies = []
         for info in self._get_slug_related_objs():
-            unique_together = info['unique_together']
-            objs = info['objs']
-            for obj in objs:
-                # If we already have the same object with this slug then
-                # skip it. This happens when there's, say, a PageFile that's
-                # got the same name that's attached to the page -- which can
-                # happen during a page rename -> rename back cycle.
-                obj_lookup = _get_slug_lookup(unique_together, obj, new_p)
-                if obj.__class__.objects.filter(**obj_lookup):
-                    continue
-                obj.slug = new_p.slug
-                obj.pk = None  # Reset the primary key before saving.
-                obj.save(comment=_("Parent page renamed"))
+            copies.extend(_copy_slug_related_objs(
+                info['objs'], info['unique_together'], new_p.slug, comment))
+        if copies:
+            # The copies were inserted directly, so post_save wasn't sent
+            # for them.  history_recorded was, which keeps the dashboard
+            # stats up to date, but the page's cache and thumbnails are
+            # ours to look after.
+            invalidate(page_dependency(new_p.slug))
+            thumbnails.queue_page_thumbnails(new_p)
+
+        return new_p, bool(m2m_rows)
+
+
+def _insert_m2m_rows(rows):
+    """
+    Args:
+        rows: A list of (ManyToManyField, pk, member pk) tuples.
+    """
+    by_field = {}
+    for field, pk, member_pk in rows:
+        by_field.setdefault(field, []).append((pk, member_pk))
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for field, values in by_field.iteritems():
+        cursor.executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+            qn(field.m2m_db_table()), qn(field.m2m_column_name()),
+            qn(field.m2m_reverse_name())), values)
+    if by_field:
+        transaction.set_dirty()
+
+
+def _copy_slug_related_objs(qs, unique_together, slug, comment):
+    """
+    Copies the objects in `qs` to `slug` with one multi-row INSERT,
+    skipping those that already exist there, and records their history
+    in batch.
+
+    Returns:
+        A list of the copies.
+    """
+    model = qs.model
+    key_names = [n for n in unique_together if n != 'slug']
+    # If we already have the same object with this slug then skip it.
+    # This happens when there's, say, a PageFile that's got the same name
+    # that's attached to the page -- which can happen during a page
+    # rename -> rename back cycle.
+    existing = set(model.objects.filter(slug=slug).values_list(*key_names))
+    objs = [o for o in qs
+            if tuple([getattr(o, n) for n in key_names]) not in existing]
+    if not objs:
+        return []
+
+    fields = [f for f in model._meta.local_fields
+              if not isinstance(f, models.AutoField)]
+    rows = []
+    for obj in objs:
+        obj.slug = slug
+        rows.append([f.get_db_prep_save(getattr(obj, f.attname),
+                                        connection=connection)
+                     for f in fields])
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(model._meta.db_table), ', '.join([qn(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields))), rows)
+    transaction.set_dirty()
+
+    keys = set([tuple([getattr(o, n) for n in key_names]) for o in objs])
+    copies = [o for o in model.objects.filter(slug=slug)
+              if tuple([getattr(o, n) for n in key_names]) in keys]
+    for obj in copies:
+        obj._save_with = {'comment': comment}
+    create_historical_records(model, copies, TYPE_ADDED)
+    return copies
 
 
 class PageDiff(diff.BaseModelDiff):
@@ -242,7 +328,7 @@ versioning.register(Page)
 
 class PageFile(models.Model):
     file = models.FileField(ugettext_lazy("file"), upload_to='pages/files/',
-                            storage=RandomFilenameFileSystemStorage())
+                            storage=ContentAddressedFileSystemStorage())
     name = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, editable=False)
 
@@ -256,6 +342,10 @@ class PageFile(models.Model):
                        (r'^application/vnd.ms-powerpoint', 'powerpoint'),
                        (r'^application/vnd.ms-excel', 'excel')
                       ]
+    # Rough types by mime type, filled in as they're asked for.  The
+    # rough type follows from the file name alone, so this is cheaper
+    # than a column that would need filling in and keeping in step.
+    _rough_types = {}
 
     def get_absolute_url(self):
         return reverse('pages:file',
@@ -272,11 +362,13 @@ class PageFile(models.Model):
     @property
     def rough_type(self):
         mime = self.mime_type
-        if mime:
+        if mime not in self._rough_types:
+            self._rough_types[mime] = 'unknown'
             for regex, rough_type in self._rough_type_map:
-                if re.match(regex, mime):
-                    return rough_type
-        return 'unknown'
+                if mime and re.match(regex, mime):
+                    self._rough_types[mime] = rough_type
+                    break
+        return self._rough_types[mime]
 
     @property
     def mime_type(self):
@@ -357,5 +449,6 @@ url_to_name = stringfilter(url_to_name)
 
 # For registration calls
 import signals
+import thumbnails
 import api
 import feeds
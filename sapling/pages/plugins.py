@@ -40,6 +40,7 @@ The function html_to_template_text parses the HTML and lets each registered
 handler a chance to do something with an element, such as replace it with a
 template tag.
 """
+import hashlib
 import re
 from lxml import etree
 from lxml.html import fragments_fromstring
@@ -51,12 +52,14 @@ from copy import copy
 
 from django.template import Node
 from django.core.urlresolvers import reverse
+from django.utils.encoding import smart_str, smart_unicode
 from django.utils.text import unescape_entities
 from django.utils.translation import  ugettext as _
 from django.conf import settings
 
-from ckeditor.models import parse_style, sanitize_html_fragment
+from ckeditor.models import parse_style, get_sanitizer
 from redirects.models import Redirect
+from utils.cache_dependencies import record_dependency, page_dependency
 
 from models import Page, name_to_url, url_to_name, PageFile
 from models import allowed_tags as pages_allowed_tags
@@ -198,13 +201,77 @@ def file_url_to_name(url):
     return prefixed_url_to_name(url, _files_url)
 
 
-def handle_image(elem, context=None):
-    # only handle resized images
-    do_thumbnail = True
+def get_page_files(context):
+    """
+    Returns:
+        A dictionary of the files attached to context['page'], by name.
+
+    The files are looked up with a single query the first time they're
+    asked for during a render, so that a page full of images and file
+    links doesn't cost a query per file.
+    """
+    slug = context['page'].slug
+    render_context = getattr(context, 'render_context', None)
+    if render_context is None:
+        cache = {}
+    else:
+        # The outermost render context lasts for the whole render,
+        # including the page content templates we make below it.
+        cache = render_context.dicts[0].setdefault('page_files', {})
+    if slug not in cache:
+        cache[slug] = dict((f.name, f) for f in
+                           PageFile.objects.filter(slug__exact=slug))
+    return cache[slug]
+
+
+def get_page_file(context, name):
+    """
+    Returns:
+        The file called `name` attached to context['page'], or None.
+    """
+    return get_page_files(context).get(smart_unicode(name))
+
+
+def thumbnail_geometry(elem):
+    """
+    Returns:
+        The "WIDTHxHEIGHT" geometry string for the img element `elem` if
+        it's been resized, otherwise None.
+    """
     style = parse_style(elem.attrib.get('style', ''))
     if 'width' not in style or 'height' not in style:
-        do_thumbnail = False
+        return None
+    width = int(style['width'].replace('px', ''))
+    height = int(style['height'].replace('px', ''))
+    return '%dx%d' % (width, height)
+
+
+def thumbnail_sizes(html):
+    """
+    Returns:
+        A set of (file name, geometry string) for each resized image of
+        an attached file in the page content `html`.
+    """
+    sizes = set()
+    if not html:
+        return sizes
+    for fragment in fragments_fromstring(html):
+        if isinstance(fragment, basestring):
+            continue
+        for elem in fragment.iter('img'):
+            src = desanitize(elem.attrib.get('src', ''))
+            if not src.startswith(_files_url):
+                continue
+            try:
+                geometry = thumbnail_geometry(elem)
+            except ValueError:
+                continue
+            if geometry:
+                sizes.add((file_url_to_name(src), geometry))
+    return sizes
+
 
+def handle_image(elem, context=None):
     src = desanitize(elem.attrib.get('src', ''))
     if not src.startswith(_files_url):
         return
@@ -213,18 +280,22 @@ def handle_image(elem, context=None):
         return
 
     page = context['page']
-    try:
-        file = PageFile.objects.get(slug__exact=page.slug,
-                                     name__exact=file_url_to_name(src))
-    except PageFile.DoesNotExist:
+    file = get_page_file(context, file_url_to_name(src))
+    if file is None:
         return
 
-    if do_thumbnail:
-        width = int(style['width'].replace('px', ''))
-        height = int(style['height'].replace('px', ''))
+    # only handle resized images
+    try:
+        geometry = thumbnail_geometry(elem)
+    except ValueError:
+        # Not sized in pixels, so show the original.
+        geometry = None
+    if geometry:
         escaped_filename = escape_quotes(file.file.name)
-        before = '{%% thumbnail "%s" "%dx%d" as im %%}' % (escaped_filename,
-                                                           width, height)
+        # The thumbnail is made when the file or page is saved (see
+        # pages/thumbnails.py).  Until it's ready we show the original.
+        before = ('{%% thumbnail "%s" "%s" background=1 as im %%}' %
+                  (escaped_filename, geometry))
         after = '{% endthumbnail %}'
         # HTML will want to encode {{ }} inside a src, and we don't want that,
         # so we will just rename it to src_thumb until just before it's output
@@ -321,24 +392,37 @@ class LinkNode(Node):
             page = context['page']
             if self.is_relative_link(url):
                 if url.startswith('_files/'):
+                    record_dependency(page_dependency(page.slug))
                     filename = file_url_to_name(url)
                     url = reverse('pages:file-info', args=[page.pretty_slug,
                                                        filename])
-                    try:
-                        file = PageFile.objects.get(slug__exact=page.slug,
-                                                    name__exact=filename)
+                    file = get_page_file(context, filename)
+                    if file is not None:
                         cls = ' class="file_%s"' % file.rough_type
-                    except PageFile.DoesNotExist:
+                    else:
                         cls = ' class="missing_link"'
                 elif unquote_plus(url).startswith('tags/'):
                     cls = ' class="tag_link"'
                 else:
+                    # Whether the page exists decides how the link looks.
+                    record_dependency(page_dependency(slugify(url)))
+                    # The static export passes in every page's and
+                    # redirect's pretty slug, so it needn't look them up.
+                    index = context.get('page_index')
                     try:
-                        page = Page.objects.get(slug__exact=slugify(url))
-                        url = reverse('pages:show', args=[page.pretty_slug])
+                        if index is not None:
+                            if slugify(url) not in index:
+                                raise Page.DoesNotExist
+                            pretty_slug = index[slugify(url)]
+                        else:
+                            pretty_slug = Page.objects.get(
+                                slug__exact=slugify(url)).pretty_slug
+                        url = reverse('pages:show', args=[pretty_slug])
                     except Page.DoesNotExist:
                         # Check if Redirect exists.
-                        if not Redirect.objects.filter(source=slugify(url)):
+                        if (index is not None or
+                                not Redirect.objects.filter(
+                                    source=slugify(url))):
                             cls = ' class="missing_link"'
                         # Convert to proper URL: My%20page -> My_page
                         url = name_to_url(url_to_name(url))
@@ -354,6 +438,20 @@ class LinkNode(Node):
                 and not url_parts.fragment)
 
 
+_allowed_src_regexes = {}
+
+
+def allowed_src_regexes(patterns):
+    """
+    Returns:
+        The compiled regular expressions for the EMBED_ALLOWED_SRC
+        `patterns`, compiled the first time they're asked for.
+    """
+    if patterns not in _allowed_src_regexes:
+        _allowed_src_regexes[patterns] = [re.compile(p) for p in patterns]
+    return _allowed_src_regexes[patterns]
+
+
 class EmbedCodeNode(Node):
     allowed_tags = copy(pages_allowed_tags)
     allowed_attributes = copy(pages_allowed_attributes_map)
@@ -364,39 +462,60 @@ class EmbedCodeNode(Node):
     allowed_attributes['iframe'] = [
         'allowfullscreen', 'width', 'height', 'src']
 
+    # Rendered embeds by a hash of their embed code, with the result being
+    # the HTML or the exception raised.
+    _rendered = {}
+    RENDERED_CACHE_SIZE = 1000
+
     def __init__(self, nodelist):
         self.nodelist = nodelist
 
     def sanitize(self, html):
-        return sanitize_html_fragment(html, self.allowed_tags,
-            self.allowed_attributes, self.allowed_styles_map)
+        return get_sanitizer(self.allowed_tags, self.allowed_attributes,
+                             self.allowed_styles_map).sanitize(html)
 
-    def _process_iframe(self, iframe):
+    def _process_iframe(self, iframe, allowed_src):
         src = iframe.attrib.get('src', '')
-        allowed_src = getattr(settings, 'EMBED_ALLOWED_SRC', ['.*'])
         # We don't want a self-closing iframe tag.
         if iframe.text is None:
             iframe.text = ''
-        if any(re.match(regex, src) for regex in allowed_src):
+        if any(regex.match(src) for regex in allowed_src):
             return iframe
         else:
             raise IFrameSrcNotApproved
 
+    def render_embed(self, html, allowed_src):
+        safe_html = self.sanitize(html)
+        top_level_elements = fragments_fromstring(safe_html)
+        # TODO: We need to remember to patch in whatever pre-save
+        #       HTML processing we eventually do here, too.  E.g.
+        #       a spam URL blacklist.
+        out = []
+        for elem in top_level_elements:
+            if elem.tag == 'iframe':
+                elem = self._process_iframe(elem, allowed_src)
+            out.append(etree.tostring(elem, method='html',
+                                      encoding='UTF-8'))
+        return ''.join(out)
+
     def render(self, context):
         try:
             html = unescape_entities(self.nodelist.render(context))
-            safe_html = self.sanitize(html)
-            top_level_elements = fragments_fromstring(safe_html)
-            # TODO: We need to remember to patch in whatever pre-save
-            #       HTML processing we eventually do here, too.  E.g.
-            #       a spam URL blacklist.
-            out = []
-            for elem in top_level_elements:
-                if elem.tag == 'iframe':
-                    elem = self._process_iframe(elem)
-                out.append(etree.tostring(elem, method='html',
-                                          encoding='UTF-8'))
-            return ''.join(out)
+            patterns = tuple(getattr(settings, 'EMBED_ALLOWED_SRC', ['.*']))
+            key = (hashlib.md5(smart_str(html)).hexdigest(), patterns)
+            if key not in self._rendered:
+                try:
+                    result = self.render_embed(html,
+                                               allowed_src_regexes(patterns))
+                except Exception, e:
+                    result = e
+                if len(self._rendered) >= self.RENDERED_CACHE_SIZE:
+                    self._rendered.clear()
+                self._rendered[key] = result
+            result = self._rendered[key]
+            if isinstance(result, Exception):
+                raise result
+            return result
 
         except IFrameSrcNotApproved:
             return (
@@ -1,9 +1,10 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.utils.translation import ugettext as _
 
 from redirects.models import Redirect
+from utils.cache_dependencies import invalidate, page_dependency
 
-from models import Page
+from models import Page, PageFile
 
 
 def _delete_page(sender, instance, raw, **kws):
@@ -27,3 +28,19 @@ pre_save.connect(_delete_page, sender=Redirect)
 # When a page is created that overlaps with a Redirect we should
 # delete the Redirect.
 pre_save.connect(_delete_redirect, sender=Page)
+
+
+def _invalidate_page_cache(sender, instance, **kws):
+    invalidate(page_dependency(instance.slug))
+
+
+def _invalidate_redirect_source_cache(sender, instance, **kws):
+    invalidate(page_dependency(instance.source))
+
+# Purge cached responses that show the page, include it or link to it.
+for model in (Page, PageFile):
+    post_save.connect(_invalidate_page_cache, sender=model)
+    post_delete.connect(_invalidate_page_cache, sender=model)
+# Links to a page that doesn't exist look different if there's a redirect.
+post_save.connect(_invalidate_redirect_source_cache, sender=Redirect)
+post_delete.connect(_invalidate_redirect_source_cache, sender=Redirect)
@@ -1,15 +1,20 @@
+import hashlib
+
 from django import template
 from django.template.loader_tags import BaseIncludeNode
 from django.template import Template
-from django.utils.translation import ugettext as _
+from django.utils.encoding import smart_str
+from django.utils.translation import ugettext as _, get_language
 from django.conf import settings
 
-from pages.plugins import html_to_template_text, SearchBoxNode
+from pages.plugins import html_to_template_text, get_page_files, SearchBoxNode
 from pages.plugins import LinkNode, EmbedCodeNode
 from pages import models
 from django.utils.text import unescape_string_literal
 from pages.models import Page, slugify
 from django.core.urlresolvers import reverse
+from utils.cache_dependencies import (record_dependency, page_dependency,
+    render_cached)
 
 register = template.Library()
 
@@ -20,6 +25,33 @@ def name_to_url(value):
 name_to_url.is_safe = True
 
 
+# Compiled page content templates.  See get_page_template().
+_page_templates = {}
+PAGE_TEMPLATE_CACHE_SIZE = 500
+
+
+def get_page_template(html, context, render_plugins=True):
+    """
+    Returns:
+        The compiled Template for the page content `html`, as shown on
+        context['page'].  Templates are compiled once and reused for as
+        long as the content, the page's name and its files stay the same.
+    """
+    parts = [render_plugins]
+    if 'page' in context:
+        page = context['page']
+        files = get_page_files(context)
+        parts += [page.slug, page.name,
+                  sorted([(n, f.file.name) for n, f in files.iteritems()])]
+    key = hashlib.md5(repr(parts) + smart_str(html)).hexdigest()
+    if key not in _page_templates:
+        if len(_page_templates) >= PAGE_TEMPLATE_CACHE_SIZE:
+            _page_templates.clear()
+        _page_templates[key] = Template(html_to_template_text(html, context,
+                                                              render_plugins))
+    return _page_templates[key]
+
+
 class PageContentNode(BaseIncludeNode):
     def __init__(self, html_var, render_plugins=True, *args, **kwargs):
         super(PageContentNode, self).__init__(*args, **kwargs)
@@ -29,8 +61,7 @@ class PageContentNode(BaseIncludeNode):
     def render(self, context):
         try:
             html = unicode(self.html_var.resolve(context))
-            t = Template(html_to_template_text(html, context,
-                                               self.render_plugins))
+            t = get_page_template(html, context, self.render_plugins)
             return self.render_template(t, context)
         except:
             if settings.TEMPLATE_DEBUG:
@@ -43,6 +74,7 @@ class IncludeContentNode(BaseIncludeNode):
     Base class for including some named content inside a other content.
 
     Subclass and override get_content() and get_title() to return HTML or None.
+    To render the content some other way, override render_content().
     The name of the content to include is stored in self.name
     All other parameters are stored in self.args, without quotes (if any).
     """
@@ -67,16 +99,18 @@ class IncludeContentNode(BaseIncludeNode):
         """ Override this to return a title or None to omit it. """
         return self.name
 
+    def render_content(self, context):
+        template = Template(self.get_content(context))
+        return self.render_template(template, context)
+
     def render(self, context):
         try:
-            template_text = ''
+            output = ''
             if 'showtitle' in self.args:
                 title = self.get_title(context)
                 if title:
-                    template_text += '<h2>%s</h2>' % title
-            template_text += self.get_content(context)
-            template = Template(template_text)
-            return self.render_template(template, context)
+                    output += '<h2>%s</h2>' % title
+            return output + self.render_content(context)
         except:
             if settings.TEMPLATE_DEBUG:
                 raise
@@ -84,46 +118,69 @@ class IncludeContentNode(BaseIncludeNode):
 
 
 class IncludePageNode(IncludeContentNode):
-    def __init__(self, *args, **kwargs):
-        super(IncludePageNode, self).__init__(*args, **kwargs)
-        try:
-            self.page = Page.objects.get(slug__exact=slugify(self.name))
-        except Page.DoesNotExist:
-            self.page = None
+    """
+    Includes a page's content.  The page is looked up each time we're
+    rendered, as this node lives on in cached templates.  The rendered
+    content is cached along with what it depends on (see
+    utils.cache_dependencies.render_cached), so editing the included page,
+    or anything it includes or links to, refreshes every page that
+    includes it.
+    """
+    def get_page(self, context):
+        # Once per render.
+        if self not in context.render_context:
+            try:
+                page = Page.objects.get(slug__exact=slugify(self.name))
+            except Page.DoesNotExist:
+                page = None
+            context.render_context[self] = page
+        return context.render_context[self]
 
     def get_title(self, context):
-        if not self.page:
+        page = self.get_page(context)
+        if not page:
             return None
         return ('<a href="%s">%s</a>'
-                % (self.get_page_url(), self.page.name))
+                % (self.get_page_url(page), page.name))
 
-    def get_page_url(self):
-        if self.page:
-            slug = self.page.pretty_slug
+    def get_page_url(self, page):
+        if page:
+            slug = page.pretty_slug
         else:
             slug = name_to_url(self.name)
         return reverse('pages:show', args=[slug])
 
-    def get_content(self, context):
-        if not self.page:
+    def render_content(self, context):
+        record_dependency(page_dependency(slugify(self.name)))
+        page = self.get_page(context)
+        if not page:
             return (('<p class="plugin includepage">' + _('Unable to include '
                     '<a href="%(page_url)s" class="missing_link">%(page_name)s</a>') + '</p>')
-                    % {'page_url': self.get_page_url(), 'page_name': self.name})
+                    % {'page_url': self.get_page_url(page), 'page_name': self.name})
         # prevent endless loops
-        context_page = context['page']
-        include_stack = context.get('_include_stack', [])
-        include_stack.append(context_page.name)
-        if self.page.name in include_stack:
+        include_stack = (context.get('_include_stack', []) +
+                         [context['page'].name])
+        if page.name in include_stack:
             return (('<p class="plugin includepage">' + _('Unable to'
                     ' include <a href="%(page_url)s">%(page_name)s</a>: endless include'
-                    ' loop.') + '</p>') % {'page_url': self.get_page_url(), 'page_name': self.page.name})
-        context['_include_stack'] = include_stack
-        context['page'] = self.page
-        template_text = html_to_template_text(self.page.content, context)
-        # restore context
-        context['_include_stack'].pop()
-        context['page'] = context_page
-        return template_text
+                    ' loop.') + '</p>') % {'page_url': self.get_page_url(page), 'page_name': page.name})
+
+        def render():
+            context.push()
+            try:
+                context['_include_stack'] = include_stack
+                context['page'] = page
+                return self.render_template(
+                    get_page_template(page.content, context), context)
+            finally:
+                context.pop()
+
+        key = 'include_page:%s' % hashlib.md5(smart_str(
+            '%s:%s' % (page.slug, get_language()))).hexdigest()
+        # What's included from a page that's further up the include
+        # stack differs from what's included elsewhere.
+        return render_cached(key, render, unless_depends_on=[
+            page_dependency(slugify(name)) for name in include_stack])
 
 
 @register.tag(name='render_plugins')
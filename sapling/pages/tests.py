@@ -1,7 +1,12 @@
 # coding=utf-8
 
+import os
+import shutil
+import tempfile
+import time
 from urllib import quote
 from lxml.html import fragments_fromstring
+import sorl.thumbnail
 
 from django.test import TestCase
 from django.db import models
@@ -10,20 +15,33 @@ from django.template.base import Template
 from django.template.context import Context
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.cache import get_cache
+from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry
 
 from versionutils.merging.forms import MergeMixin
 from forms import PageForm
 from redirects.models import Redirect
 from maps.models import MapData
+from versionutils.versioning.constants import (TYPE_ADDED,
+    TYPE_DELETED_CASCADE)
 
 from pages.models import (Page, PageFile, slugify,
     url_to_name, clean_name, name_to_url)
 from pages.plugins import html_to_template_text
-from pages.plugins import tag_imports
+from pages.plugins import tag_imports, thumbnail_sizes, EmbedCodeNode
+from pages.views import _find_available_filename
+from pages.export import export
 from pages.xsstests import xss_exploits
-from pages import exceptions
+from pages import exceptions, thumbnails
 from tags.models import PageTagSet, Tag
+from utils import cache_dependencies, transactions
+from utils import thumbnails as utils_thumbnails
+from utils.cache_dependencies import page_dependency, thumbnail_dependency
+from utils.storage import is_hashed_name
+from utils import sendfile
 
 
 class PageTest(TestCase):
@@ -340,6 +358,116 @@ class PageTest(TestCase):
         p_h = p_c.versions.as_of(version=1)
         p_h.revert_to()
 
+    def test_page_rename_history(self):
+        p = Page(name="Rename History", content="<p>Files and a map.</p>")
+        p.save()
+        for i in range(3):
+            PageFile(file=ContentFile("foo"), name="file%d.txt" % i,
+                     slug=p.slug).save()
+        map = MapData(points=GEOSGeometry("MULTIPOINT (-122.4 37.8)"),
+                      page=p)
+        map.save()
+
+        p.rename_to("Renamed History")
+        new_p = Page.objects.get(name="Renamed History")
+
+        # The copied files get an 'added' record each.
+        for pf in PageFile.objects.filter(slug=new_p.slug):
+            versions = pf.versions.all()
+            self.assertEqual(len(versions), 1)
+            self.assertEqual(versions[0].version_info.type, TYPE_ADDED)
+            self.assertEqual(versions[0].version_info.comment,
+                             "Parent page renamed")
+
+        # The old map's cascaded delete points at the old page as it
+        # was before it was deleted, so reverting the page brings the
+        # map back.
+        old_map = MapData.versions.filter(id=map.id)[0]
+        self.assertEqual(old_map.version_info.type, TYPE_DELETED_CASCADE)
+        self.assertEqual(old_map.page.version_info.type, TYPE_ADDED)
+        new_map = MapData.objects.get(page=new_p)
+        self.assertEqual(new_map.versions.most_recent().page.name,
+                         "Renamed History")
+
+    def test_rename_with_files(self):
+        queued = []
+        old_queue = thumbnails.queue_thumbnail
+        thumbnails.queue_thumbnail = lambda name, geometry: queued.append(
+            (name, geometry))
+        try:
+            p = Page(name="Photo Page", content=(
+                '<p><img src="_files/photo.jpg" style="width: 100px; '
+                'height: 50px;"/></p>'))
+            p.save()
+            pf = PageFile(file=ContentFile("not really a jpeg"),
+                          name="photo.jpg", slug=p.slug)
+            pf.save()
+            del queued[:]
+
+            # The copied file is inserted directly, without post_save,
+            # but the new page's thumbnails are still queued.
+            p.rename_to("Renamed Photo Page")
+            self.assertEqual(queued, [(pf.file.name, '100x50')])
+        finally:
+            thumbnails.queue_thumbnail = old_queue
+
+    def test_file_storage(self):
+        a = PageFile(file=ContentFile('same'), name='a.txt', slug='page a')
+        a.save()
+        b = PageFile(file=ContentFile('same'), name='b.txt', slug='page b')
+        b.save()
+        c = PageFile(file=ContentFile('different'), name='c.txt',
+                     slug='page b')
+        c.save()
+        # Identical files are stored once, under the hash of their contents.
+        self.assertEqual(a.file.name, b.file.name)
+        self.assertNotEqual(a.file.name, c.file.name)
+        self.assertTrue(is_hashed_name(a.file.name))
+        self.assertTrue(a.file.name.startswith('pages/files/'))
+        self.assertTrue(a.file.name.endswith('.txt'))
+        self.assertEqual(PageFile.objects.get(name='b.txt').file.read(),
+                         'same')
+        # Deleting one doesn't take the file away from the other.
+        a.delete()
+        self.assertEqual(PageFile.objects.get(name='b.txt').file.read(),
+                         'same')
+
+    def test_upload_metadata(self):
+        from StringIO import StringIO
+        from PIL import Image
+        from pages import views
+
+        data = StringIO()
+        Image.new('RGB', (40, 20)).save(data, 'PNG')
+        uploaded = ContentFile(data.getvalue())
+        pf = PageFile(file=uploaded, name='tiny.png', slug='uploads')
+        pf.save()
+        queued = []
+        old_queue = views.queue_thumbnail
+        views.queue_thumbnail = lambda name, geometry: queued.append(
+            (name, geometry))
+        try:
+            metadata = views._upload_metadata(pf, uploaded)
+        finally:
+            views.queue_thumbnail = old_queue
+        self.assertEqual((metadata['width'], metadata['height']), (40, 20))
+        # The thumbnail's made in the background, not during the upload.
+        self.failIf('thumbnail' in metadata)
+        self.assertEqual(queued, [(pf.file.name, '32x32')])
+
+    def test_find_available_filename(self):
+        for name in ['IMG.jpg', 'IMG 2.jpg', 'IMG 4.jpg', 'IMG 2 2.jpg']:
+            PageFile(file=ContentFile(name), name=name, slug='camera').save()
+        self.assertNumQueries(1, _find_available_filename, 'IMG.jpg',
+                              'camera')
+        self.assertEqual(_find_available_filename('IMG.jpg', 'camera'),
+                         'IMG 3.jpg')
+        self.assertEqual(_find_available_filename('IMG 2.jpg', 'camera'),
+                         'IMG 2 3.jpg')
+        self.assertEqual(_find_available_filename('IMG.png', 'camera'),
+                         'IMG.png')
+        self.assertEqual(_find_available_filename('IMG', 'camera'), 'IMG')
+
 
 class TestModel(models.Model):
     save_time = models.DateTimeField(auto_now=True)
@@ -700,6 +828,32 @@ class PluginTest(TestCase):
             '<iframe src="http://www.youtube.com/embed/JVRsWAjvQSg"></iframe>'
             in rendered)
 
+    def test_embed_rendered_once(self):
+        html = ('<span class="plugin embed">&lt;iframe '
+                'src="http://www.youtube.com/embed/JVRsWAjvQSg"'
+                '&gt;&lt;/iframe&gt;</span>')
+        template = Template(html_to_template_text(html))
+        EmbedCodeNode._rendered.clear()
+        render_embed = EmbedCodeNode.render_embed
+        calls = []
+
+        def counting_render_embed(self, *args):
+            calls.append(args)
+            return render_embed(self, *args)
+        EmbedCodeNode.render_embed = counting_render_embed
+        try:
+            first = template.render(Context())
+            self.assertEqual(template.render(Context()), first)
+            self.assertEqual(len(calls), 1)
+            # The list of allowed providers is part of what's cached.
+            settings.EMBED_ALLOWED_SRC = ['http://player.vimeo.com/video/.*']
+            rendered = template.render(Context())
+            self.failUnless(('The embedded URL is not on the list of '
+                             'approved providers') in rendered)
+            self.assertEqual(len(calls), 2)
+        finally:
+            EmbedCodeNode.render_embed = render_embed
+
     def test_amp_in_link_with_class(self):
         page = Page(name='Explore')
         html = ('<p><a class="external something" '
@@ -708,6 +862,454 @@ class PluginTest(TestCase):
         rendered = template.render(Context({'page': page}))
         self.failUnless('http://example.org/?t=1&amp;i=2' in rendered)
 
+    def test_files_looked_up_once(self):
+        p = Page(name='Gallery')
+        content = []
+        for i in range(5):
+            PageFile(file=ContentFile('image %d' % i), name='image%d.jpg' % i,
+                     slug=p.slug).save()
+            content.append('<p><img src="_files/image%d.jpg"/> '
+                           '<a href="_files/image%d.jpg">image</a></p>' %
+                           (i, i))
+        content.append('<p><a href="_files/missing.pdf">missing</a></p>')
+        p.content = ''.join(content)
+        p.save()
+
+        context = Context({'page': p})
+        with self.assertNumQueries(1):
+            template = Template(html_to_template_text(p.content, context))
+            rendered = template.render(context)
+        self.assertEqual(rendered.count('class="file_image"'), 5)
+        self.failUnless('class="missing_link"' in rendered)
+
+    def test_image_not_sized_in_pixels(self):
+        p = Page(name='Sizes')
+        PageFile(file=ContentFile('image'), name='image.jpg',
+                 slug=p.slug).save()
+        p.content = ('<p><img src="http://example.org/a.jpg" '
+                     'style="width: 50%; height: auto;"/> '
+                     '<img src="_files/image.jpg" '
+                     'style="width: 50%; height: auto;"/></p>')
+        p.save()
+        context = Context({'page': p})
+        template = Template(html_to_template_text(p.content, context))
+        rendered = template.render(context)
+        self.failUnless('src="http://example.org/a.jpg"' in rendered)
+        # Attached images that aren't sized in pixels are shown as they
+        # are, without a thumbnail.
+        self.failUnless('src="%s"' % PageFile.objects.get(
+            slug=p.slug, name='image.jpg').file.url in rendered)
+
+    def test_thumbnail_sizes(self):
+        html = ('<p><img src="_files/a.jpg" style="width: 100px; '
+                'height: 50px;"/> <img src="_files/b.jpg"/> '
+                '<img src="http://example.org/c.jpg" style="width: 10px; '
+                'height: 10px;"/> <img src="_files/a%20b.jpg" '
+                'style="width: 20px; height: 30px;"/></p>')
+        self.assertEqual(thumbnail_sizes(html),
+                         set([('a.jpg', '100x50'), ('a b.jpg', '20x30')]))
+        self.assertEqual(thumbnail_sizes(''), set())
+
+
+class CacheDependencyTest(TestCase):
+    def setUp(self):
+        self.old_cache = cache_dependencies.cache
+        cache_dependencies.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        transactions.discard_pending()
+
+    def tearDown(self):
+        cache_dependencies.cache = self.old_cache
+
+    def render_page(self, page):
+        cache_dependencies.start_recording()
+        cache_dependencies.record_dependency(page_dependency(page.slug))
+        context = Context({'page': page})
+        template = Template(html_to_template_text(page.content, context))
+        template.render(context)
+        return cache_dependencies.stop_recording()
+
+    def test_records_links_and_includes(self):
+        a = Page(name='Page A', content=(
+            '<p><a href="Page B">b</a></p>'
+            '<a class="plugin includepage" href="Page C">c</a>'))
+        a.save()
+        dependencies, versions = self.render_page(a)
+        self.assertEqual(dependencies, set([page_dependency('page a'),
+            page_dependency('page b'), page_dependency('page c')]))
+        self.assertTrue(cache_dependencies.is_current(versions))
+
+    def test_clocks_not_compared(self):
+        a = Page(name='Page A', content='<p>a</p>')
+        a.save()
+        dependencies, versions = self.render_page(a)
+        # Edited on a server whose clock is behind ours.
+        cache_dependencies.cache.set(cache_dependencies._version_key(
+            page_dependency('page a')), '%f' % (time.time() - 60))
+        self.assertFalse(cache_dependencies.is_current(versions))
+
+    def test_thumbnail_being_made(self):
+        old_processes = utils_thumbnails.PROCESSES
+        old_queue = utils_thumbnails.queue_thumbnail
+        old_get_thumbnail = sorl.thumbnail.get_thumbnail
+        utils_thumbnails.PROCESSES = 2
+        utils_thumbnails.queue_thumbnail = lambda name, geometry: None
+        sorl.thumbnail.get_thumbnail = lambda name, geometry: None
+        try:
+            p = Page(name='Photos')
+            pf = PageFile(file=ContentFile('image'), name='photo.jpg',
+                          slug=p.slug)
+            pf.save()
+            p.content = ('<p><img src="_files/photo.jpg" '
+                         'style="width: 100px; height: 50px;"/></p>')
+            p.save()
+            # The original is shown until the thumbnail's made.
+            dependencies, versions = self.render_page(p)
+            self.failUnless(thumbnail_dependency(pf.file.name, '100x50')
+                            in dependencies)
+            self.assertTrue(cache_dependencies.is_current(versions))
+            utils_thumbnails.make_thumbnail(pf.file.name, '100x50')
+            self.assertFalse(cache_dependencies.is_current(versions))
+        finally:
+            utils_thumbnails.PROCESSES = old_processes
+            utils_thumbnails.queue_thumbnail = old_queue
+            sorl.thumbnail.get_thumbnail = old_get_thumbnail
+
+    def test_invalidated_again_on_commit(self):
+        a = Page(name='Page A', content='<p>a</p>')
+        a.save()
+        # Rendered after the save but before the commit, so it may have
+        # read the old page.
+        dependencies, versions = self.render_page(a)
+        self.assertTrue(cache_dependencies.is_current(versions))
+        transactions.run_pending()
+        self.assertFalse(cache_dependencies.is_current(versions))
+
+    def test_edits_invalidate(self):
+        a = Page(name='Page A', content='<p><a href="Page B">b</a></p>')
+        a.save()
+        unrelated = Page(name='Unrelated', content='<p>Hi</p>')
+        unrelated.save()
+
+        dependencies, versions = self.render_page(a)
+        unrelated.content = '<p>Changed</p>'
+        unrelated.save()
+        self.assertTrue(cache_dependencies.is_current(versions))
+
+        # Creating a linked-to page changes how the link looks.
+        b = Page(name='Page B', content='<p>b</p>')
+        b.save()
+        self.assertFalse(cache_dependencies.is_current(versions))
+
+        dependencies, versions = self.render_page(a)
+        m = MapData(page=a, points=GEOSGeometry('MULTIPOINT (0 0)'))
+        m.save()
+        self.assertFalse(cache_dependencies.is_current(versions))
+
+    def test_included_page_cached(self):
+        nav = Page(name='Navigation', content='<p>Nav</p>')
+        nav.save()
+        a = Page(name='Page A', content=(
+            '<a class="plugin includepage" href="Navigation">nav</a>'))
+        a.save()
+        b = Page(name='Page B', content=(
+            '<a class="plugin includepage" href="Navigation">nav</a>'))
+        b.save()
+
+        def render(page):
+            context = Context({'page': page})
+            return Template(html_to_template_text(page.content,
+                                                  context)).render(context)
+        self.failUnless('<p>Nav</p>' in render(a))
+        # Changed behind our back, so the cached copy is still used.
+        Page.objects.filter(slug=nav.slug).update(content='<p>Sneaky</p>')
+        self.failUnless('<p>Nav</p>' in render(b))
+        # Editing the included page refreshes every page including it.
+        nav = Page.objects.get(slug=nav.slug)
+        nav.content = '<p>Nav 2</p>'
+        nav.save()
+        self.failUnless('<p>Nav 2</p>' in render(a))
+        self.failUnless('<p>Nav 2</p>' in render(b))
+
+    def test_include_loop_not_cached(self):
+        a = Page(name='Page A', content=(
+            '<p>a</p><a class="plugin includepage" href="Page B">b</a>'))
+        a.save()
+        b = Page(name='Page B', content=(
+            '<p>b</p><a class="plugin includepage" href="Page A">a</a>'))
+        b.save()
+        context = Context({'page': a})
+        rendered = Template(html_to_template_text(a.content,
+                                                  context)).render(context)
+        self.failUnless('endless include loop' in rendered)
+        context = Context({'page': b})
+        rendered = Template(html_to_template_text(b.content,
+                                                  context)).render(context)
+        self.assertEqual(rendered.count('<p>a</p>'), 1)
+        self.failUnless('endless include loop' in rendered)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.page = Page(name='Conditional Page', content='<p>Hello</p>')
+        self.page.save()
+
+    def test_history_not_modified(self):
+        url = reverse('pages:history', args=[self.page.pretty_slug])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        self.page.content = '<p>Changed</p>'
+        self.page.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_dependency_change_modifies(self):
+        old_cache = cache_dependencies.cache
+        cache_dependencies.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            linked = Page(name='Linked Page', content='<p>Hi</p>')
+            linked.save()
+            self.page.content = '<p><a href="Linked Page">linked</a></p>'
+            self.page.save()
+            url = reverse('pages:show', args=[self.page.pretty_slug])
+            # The first response tells us what the page depends on.
+            self.client.get(url)
+            last_modified = self.client.get(url)['Last-Modified']
+            response = self.client.get(url,
+                                       HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+            # Last-Modified only has whole seconds.
+            time.sleep(1)
+            linked.delete()
+            response = self.client.get(url,
+                                       HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+        finally:
+            cache_dependencies.cache = old_cache
+
+    def test_feed_not_modified(self):
+        url = reverse('pages:changes-feed', args=[self.page.pretty_slug])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+
+class FileServingTest(TestCase):
+    def setUp(self):
+        self.old_method = sendfile.FILE_SERVE_METHOD
+        self.file = PageFile(file=ContentFile('0123456789'), name='digits.txt',
+                             slug='file serving')
+        self.file.save()
+        self.url = self.file.get_absolute_url()
+
+    def tearDown(self):
+        sendfile.FILE_SERVE_METHOD = self.old_method
+
+    def test_redirect(self):
+        sendfile.FILE_SERVE_METHOD = 'redirect'
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(self.file.file.url))
+
+    def test_sendfile(self):
+        sendfile.FILE_SERVE_METHOD = 'sendfile'
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], self.file.file.path)
+        self.assertEqual(response.content, '')
+
+    def test_direct(self):
+        sendfile.FILE_SERVE_METHOD = 'direct'
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '0123456789')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, '234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(response.content, '789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        # The file changed since the client got the first part of it.
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4',
+                                   HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '0123456789')
+
+    def test_historical_version(self):
+        sendfile.FILE_SERVE_METHOD = 'direct'
+        self.file.file = ContentFile('changed')
+        self.file.save()
+        url = reverse('pages:file-as_of_version',
+                      args=['file serving', 'digits.txt', 1])
+        response = self.client.get(url)
+        self.assertEqual(response.content, '0123456789')
+
+
+class StaticExportTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def read(self, path):
+        f = open(os.path.join(self.output_dir, path))
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_export(self):
+        a = Page(name='Export A', content=('<p><a href="Export B">B</a> '
+                                           '<a href="Not Here">N</a></p>'))
+        a.save()
+        b = Page(name='Export B', content='<p>Bee</p>')
+        b.save()
+        c = Page(name='Export C', content='<p>Sea</p>')
+        c.save()
+        counts = export(self.output_dir, processes=0)
+        self.assertEqual(counts['exported'], 3)
+        html = self.read('Export_A/index.html')
+        self.assertTrue('href="../Export_B/index.html"' in html)
+        self.assertTrue('class="missing_link"' in html)
+
+        # Only the changed page and the page linking to it are rendered.
+        b.content = '<p>Buzz</p>'
+        b.save()
+        counts = export(self.output_dir, processes=0)
+        self.assertEqual(counts['exported'], 2)
+        self.assertEqual(counts['unchanged'], 1)
+        self.assertTrue('Buzz' in self.read('Export_B/index.html'))
+
+        c.delete()
+        counts = export(self.output_dir, processes=0)
+        self.assertEqual(counts['exported'], 0)
+        self.assertEqual(counts['removed'], 1)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output_dir, 'Export_C')))
+
+    def test_thumbnails_made(self):
+        from StringIO import StringIO
+        from PIL import Image
+
+        data = StringIO()
+        Image.new('RGB', (40, 20)).save(data, 'PNG')
+        p = Page(name='Export Photos')
+        PageFile(file=ContentFile(data.getvalue()), name='photo.png',
+                 slug=p.slug).save()
+        p.content = ('<p><img src="_files/photo.png" '
+                     'style="width: 20px; height: 10px;"/></p>')
+        p.save()
+        queued = []
+        old_processes = utils_thumbnails.PROCESSES
+        old_queue = utils_thumbnails.queue_thumbnail
+        utils_thumbnails.PROCESSES = 2
+        utils_thumbnails.queue_thumbnail = (
+            lambda name, geometry: queued.append((name, geometry)))
+        try:
+            export(self.output_dir, processes=0)
+        finally:
+            utils_thumbnails.PROCESSES = old_processes
+            utils_thumbnails.queue_thumbnail = old_queue
+        # Made while exporting rather than left to a pool.
+        self.assertEqual(queued, [])
+        self.assertEqual(utils_thumbnails.PROCESSES, old_processes)
+        self.assertTrue('<img' in self.read('Export_Photos/index.html'))
+
+
+class VersionInfoTest(TestCase):
+    def test_updated_on_save(self):
+        user = User.objects.create_user('editor', 'editor@example.org')
+        p = Page(name='Version Info', content='<p>First</p>')
+        p.save()
+        p = Page.objects.get(pk=p.pk)
+        self.assertEqual(p.version_count, 1)
+        self.assertEqual(p.last_modified,
+                         p.versions.most_recent().version_info.date)
+        self.assertEqual(p.last_editor, None)
+
+        p.content = '<p>Second</p>'
+        p.save(user=user)
+        self.assertEqual(p.version_count, 2)
+        p = Page.objects.get(pk=p.pk)
+        self.assertEqual(p.version_count, 2)
+        self.assertEqual(p.last_editor, user)
+        self.assertEqual(p.last_modified,
+                         p.versions.most_recent().version_info.date)
+
+    def test_recreated(self):
+        p = Page(name='Version Info', content='<p>First</p>')
+        p.save()
+        p.delete()
+        # The new page carries on the old page's history.
+        p = Page(name='Version Info', content='<p>Again</p>')
+        p.save()
+        self.assertEqual(p.version_count, 3)
+        p.content = '<p>Changed</p>'
+        p.save()
+        p = Page.objects.get(pk=p.pk)
+        self.assertEqual(p.version_count, 4)
+
+    def test_not_versioned(self):
+        hist_fields = [f.name for f in Page.versions.model._meta.fields]
+        for name in ('last_modified', 'last_editor', 'version_count'):
+            self.assertFalse(name in hist_fields)
+
+        p = Page(name='Version Info', content='<p>First</p>')
+        p.save()
+        p.content = '<p>Second</p>'
+        p.save()
+        old = p.versions.as_of(version=1)
+        self.assertEqual(old.content, '<p>First</p>')
+        old.revert_to()
+        p = Page.objects.get(pk=p.pk)
+        self.assertEqual(p.content, '<p>First</p>')
+        self.assertEqual(p.version_count, 3)
+
+    def test_mapdata(self):
+        p = Page(name='Version Info', content='<p>Hi</p>')
+        p.save()
+        m = MapData(page=p, points=GEOSGeometry('MULTIPOINT (0 0)'))
+        m.save()
+        m = MapData.objects.get(pk=m.pk)
+        self.assertEqual(m.version_count, 1)
+        self.assertEqual(m.last_modified,
+                         m.versions.most_recent().version_info.date)
+
+    def test_backfill(self):
+        p = Page(name='Version Info', content='<p>First</p>')
+        p.save()
+        p.content = '<p>Second</p>'
+        p.save()
+        Page.objects.filter(pk=p.pk).update(last_modified=None,
+                                            version_count=0)
+        call_command('update_version_info', 'pages.Page')
+        p = Page.objects.get(pk=p.pk)
+        self.assertEqual(p.version_count, 2)
+        self.assertEqual(p.last_modified,
+                         p.versions.most_recent().version_info.date)
+
 
 class XSSTest(TestCase):
     """ Test for tricky attempts to inject scripts into a page
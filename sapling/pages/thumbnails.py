@@ -0,0 +1,66 @@
+"""
+Making the thumbnails a page shows as soon as they're known about.
+
+When a page or one of its files is saved we find the resized images in
+the page's content and queue any of their thumbnails that haven't been
+made yet, so they're ready before anyone views the page.  See
+utils/thumbnails.py.
+"""
+from django.db.models.signals import post_save
+
+from sorl.thumbnail import default
+
+from utils.thumbnails import queue_thumbnail
+
+from models import Page, PageFile
+from plugins import thumbnail_sizes
+
+
+def queue_page_thumbnails(page, names=None):
+    """
+    Queues the thumbnails shown in the content of `page` that haven't
+    been made yet.
+
+    Args:
+        page: A Page.
+        names: Optional list of file names.  If provided, only thumbnails
+            of these files are queued.
+
+    Returns:
+        The number of thumbnails queued.
+    """
+    sizes = [(name, geometry) for name, geometry in
+             thumbnail_sizes(page.content)
+             if names is None or name in names]
+    if not sizes:
+        return 0
+    files = dict(PageFile.objects.filter(slug=page.slug,
+        name__in=set([name for name, geometry in sizes])).values_list(
+        'name', 'file'))
+    queued = 0
+    for name, geometry in sizes:
+        if name not in files:
+            continue
+        if default.backend.get_cached_thumbnail(files[name], geometry):
+            continue
+        if queue_thumbnail(files[name], geometry):
+            queued += 1
+    return queued
+
+
+def _page_saved(sender, instance, raw, **kws):
+    if not raw:
+        queue_page_thumbnails(instance)
+
+
+def _file_saved(sender, instance, raw, **kws):
+    if raw or instance.rough_type != 'image':
+        return
+    try:
+        page = Page.objects.get(slug=instance.slug)
+    except Page.DoesNotExist:
+        return
+    queue_page_thumbnails(page, names=[instance.name])
+
+post_save.connect(_page_saved, sender=Page)
+post_save.connect(_file_saved, sender=PageFile)
@@ -1,5 +1,6 @@
 from dateutil.parser import parse as dateparser
 import copy
+import re
 
 from django.conf import settings
 from django.views.generic.base import RedirectView
@@ -18,15 +19,26 @@ from django.utils.http import urlquote
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy
 
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+from sorl.thumbnail import default
+
 from ckeditor.views import ck_upload_result
 from versionutils import diff
 from versionutils.versioning.views import UpdateView, DeleteView
 from versionutils.versioning.views import RevertView, VersionsList
 from utils.views import (Custom404Mixin, CreateObjectMixin,
-    PermissionRequiredMixin)
+    PermissionRequiredMixin, ConditionalGetMixin)
+from utils.cache_dependencies import record_dependency, page_dependency
+from utils import sendfile
+from utils.thumbnails import queue_thumbnail
 from models import Page, PageFile, url_to_name
 from forms import PageForm, PageFileForm
 from maps.widgets import InfoMap
+from maps.models import MapData
+from tags.models import PageTagSet
 
 from models import slugify, clean_name
 from exceptions import PageExistsError
@@ -35,9 +47,32 @@ from users.decorators import permission_required
 # Where possible, we subclass similar generic views here.
 
 
-class PageDetailView(Custom404Mixin, DetailView):
+def page_last_modified(slug):
+    """
+    Returns:
+        The date of the most recent change to the page with slug `slug`
+        or to anything shown along with it (map, tags, files), or None if
+        the page has no history.
+    """
+    dates = list(Page.versions.filter(slug=slug).values_list(
+        'history_date', flat=True)[:1])
+    if not dates:
+        return None
+    for qs in (MapData.versions.filter(page__slug=slug),
+               PageTagSet.versions.filter(page__slug=slug),
+               PageFile.versions.filter(slug=slug)):
+        dates.extend(qs.values_list('history_date', flat=True)[:1])
+    return max(dates)
+
+
+class PageDetailView(Custom404Mixin, ConditionalGetMixin, DetailView):
     model = Page
     context_object_name = 'page'
+    # Pages also depend on included and linked pages.
+    track_dependencies = True
+
+    def get_last_modified(self):
+        return page_last_modified(self.kwargs['slug'])
 
     def get(self, request, **kwargs):
         self.object = self.get_object()
@@ -56,7 +91,9 @@ class PageDetailView(Custom404Mixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(PageDetailView, self).get_context_data(**kwargs)
-        context['date'] = self.object.versions.most_recent().version_info.date
+        record_dependency(page_dependency(self.object.slug))
+        context['date'] = (self.object.last_modified or
+            self.object.versions.most_recent().version_info.date)
         if hasattr(self.object, 'mapdata'):
             # Remove the PanZoomBar on normal page views.
             olwidget_options = copy.deepcopy(getattr(settings,
@@ -165,7 +202,12 @@ class PageRevertView(PermissionRequiredMixin, RevertView):
         return reverse('pages:show', args=[self.kwargs.get('original_slug')])
 
 
-class PageVersionsList(VersionsList):
+class PageVersionsList(ConditionalGetMixin, VersionsList):
+    def get_last_modified(self):
+        dates = Page(slug=self.kwargs['slug']).versions.all().values_list(
+            'history_date', flat=True)[:1]
+        return dates and dates[0] or None
+
     def get_queryset(self):
         all_page_versions = Page(slug=self.kwargs['slug']).versions.all()
         # We set self.page to the most recent historical instance of the
@@ -208,17 +250,33 @@ class PageFilebrowserView(PageFileListView):
         return context
 
 
-class PageFileView(RedirectView):
+class PageFileServeMixin(object):
+    """
+    Delivers the file from get_page_file() as set by FILE_SERVE_METHOD
+    (see utils/sendfile.py), rather than always redirecting to it.
+    """
+    def get(self, request, *args, **kwargs):
+        if sendfile.FILE_SERVE_METHOD == 'redirect':
+            return super(PageFileServeMixin, self).get(request, *args,
+                                                       **kwargs)
+        page_file = self.get_page_file(**kwargs)
+        return sendfile.serve_stored_file(request, page_file.file,
+                                          page_file.name)
+
+    def get_redirect_url(self, **kwargs):
+        return self.get_page_file(**kwargs).file.url
+
+
+class PageFileView(PageFileServeMixin, RedirectView):
     permanent = False
 
-    def get_redirect_url(self, slug, file, **kwargs):
-        page_file = get_object_or_404(PageFile, slug__exact=slug,
-                                      name__exact=file)
-        return page_file.file.url
+    def get_page_file(self, slug, file, **kwargs):
+        return get_object_or_404(PageFile, slug__exact=slug,
+                                 name__exact=file)
 
 
-class PageFileVersionDetailView(RedirectView):
-    def get_redirect_url(self, slug, file, **kwargs):
+class PageFileVersionDetailView(PageFileServeMixin, RedirectView):
+    def get_page_file(self, slug, file, **kwargs):
         page_file = PageFile(slug=slug, name=file)
         version = self.kwargs.get('version')
         date = self.kwargs.get('date')
@@ -228,7 +286,7 @@ class PageFileVersionDetailView(RedirectView):
         if date:
             page_file = page_file.versions.as_of(date=dateparser(date))
 
-        return page_file.file.url
+        return page_file
 
 
 class PageFileCompareView(diff.views.CompareView):
@@ -311,13 +369,65 @@ class PageCreateView(RedirectView):
 def _find_available_filename(filename, slug):
     """
     Returns a filename that isn't taken for the given page slug.
+
+    If "photo.jpg" is taken we use the first free one of "photo 2.jpg",
+    "photo 3.jpg" and so on.  The taken names are looked up all at once.
     """
-    basename, ext = filename.rsplit(".", 1)
-    suffix_count = 1
-    while PageFile.objects.filter(name=filename, slug=slug).exists():
+    if '.' in filename:
+        basename, ext = filename.rsplit('.', 1)
+        ext = '.' + ext
+    else:
+        basename, ext = filename, ''
+    taken = set(PageFile.objects.filter(slug=slug,
+        name__startswith=basename).values_list('name', flat=True))
+    if filename not in taken:
+        return filename
+    numbered = re.compile(r'^%s (\d+)%s$' % (re.escape(basename),
+                                             re.escape(ext)))
+    suffixes = set()
+    for name in taken:
+        match = numbered.match(name)
+        if match:
+            suffixes.add(int(match.group(1)))
+    suffix_count = 2
+    while suffix_count in suffixes:
         suffix_count += 1
-        filename = "%s %d.%s" % (basename, suffix_count, ext)
-    return filename
+    return '%s %d%s' % (basename, suffix_count, ext)
+
+
+def _upload_metadata(file, uploaded):
+    """
+    Returns:
+        A dictionary describing the PageFile `file`, just saved from the
+        UploadedFile `uploaded`, for the editor.  Images get their
+        dimensions, and a thumbnail once it's been made.
+    """
+    metadata = {
+        'name': file.name,
+        'size': uploaded.size,
+        'mime_type': (getattr(uploaded, 'sniffed_type', None) or
+                      file.mime_type),
+        'type': file.rough_type,
+    }
+    if file.is_image():
+        f = file.file.storage.open(file.file.name)
+        try:
+            # Only reads as far as the image's header.
+            metadata['width'], metadata['height'] = Image.open(f).size
+        except IOError:
+            # Not an image we can read.
+            return metadata
+        finally:
+            f.close()
+        # The same size the editor's image picker shows.  We don't make it
+        # here, so a big batch of uploads isn't held up resizing each one.
+        thumbnail = default.backend.get_cached_thumbnail(file.file.name,
+                                                         '32x32')
+        if thumbnail is not None:
+            metadata['thumbnail'] = thumbnail.url
+        else:
+            queue_thumbnail(file.file.name, '32x32')
+    return metadata
 
 
 @permission_required('pages.change_page', (Page, 'slug', 'slug'))
@@ -349,12 +459,17 @@ def upload(request, slug, **kwargs):
                                             args=[slug, kwargs['file']]))
 
     # uploaded from ckeditor
-    filename = _find_available_filename(uploaded.name, slug)
+    filename = uploaded.name
+    sniffed_ext = getattr(uploaded, 'sniffed_ext', None)
+    if '.' not in filename and sniffed_ext:
+        filename = '%s.%s' % (filename, sniffed_ext)
+    filename = _find_available_filename(filename, slug)
     relative_url = '_files/' + urlquote(filename)
     try:
         file = PageFile(file=uploaded, name=filename, slug=slug)
         file.save()
-        return ck_upload_result(request, url=relative_url)
+        return ck_upload_result(request, url=relative_url,
+                                metadata=_upload_metadata(file, uploaded))
     except IntegrityError:
         error = _('A file with this name already exists')
     return ck_upload_result(request, url=relative_url, message=error)
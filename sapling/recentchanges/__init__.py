@@ -1,3 +1,5 @@
+import itertools
+
 from models import RecentChanges
 
 
@@ -30,3 +32,17 @@ def get_changes_classes():
         A list of the registered changes classes.
     """
     return changes_registry.get_changes_classes()
+
+
+def merge_changes(objs_lists):
+    """
+    Given a list of arguments (*objs_lists), each of which is an iterable
+    of historical objects, we return an iterable of the provided
+    objs_lists combined and sorted by edit date (most recent edits appearing
+    earlier in the list).
+    """
+    # In theory we could use the fact each obj_list is already sorted.
+    # This is fast enough for now.  heapq.merge does this, but it
+    # doesn't take a key parameter.
+    return sorted(itertools.chain(*objs_lists),
+                  key=lambda x: x.version_info.date, reverse=True)
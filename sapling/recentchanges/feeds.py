@@ -1,13 +1,14 @@
 from django.contrib.syndication.views import Feed
 from django.contrib.sites.models import get_current_site
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 
 from versionutils.versioning.constants import *
 
 from django.utils.translation import ugettext as _
-from utils import merge_changes
+from utils.views import conditional_response
 from views import IGNORE_TYPES
-from recentchanges import get_changes_classes
+from recentchanges import get_changes_classes, merge_changes
 
 MAX_CHANGES = 500
 
@@ -104,6 +105,18 @@ class RecentChangesFeed(Feed):
         self.request = request
         return super(RecentChangesFeed, self).get_feed(obj, request)
 
+    def get_last_modified(self):
+        dates = []
+        for change_class in get_changes_classes():
+            qs = change_class().queryset()
+            dates.extend(qs.values_list('history_date', flat=True)[:1])
+        return dates and max(dates) or None
+
+    def __call__(self, request, *args, **kwargs):
+        parent = super(RecentChangesFeed, self)
+        return conditional_response(request, self.get_last_modified(), [],
+            lambda: parent.__call__(request, *args, **kwargs))
+
 
 class ChangesOnItemFeed(Feed):
     """
@@ -192,6 +205,20 @@ class ChangesOnItemFeed(Feed):
         self.request = request
         return super(ChangesOnItemFeed, self).get_feed(obj, request)
 
+    def get_last_modified(self, request, *args, **kwargs):
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+            dates = obj.versions.all().values_list('history_date', flat=True)
+            return dates[0]
+        except (ObjectDoesNotExist, IndexError):
+            return None
+
+    def __call__(self, request, *args, **kwargs):
+        parent = super(ChangesOnItemFeed, self)
+        return conditional_response(request,
+            self.get_last_modified(request, *args, **kwargs), [],
+            lambda: parent.__call__(request, *args, **kwargs))
+
 
 def skip_ignored_change_types(objs):
     return [o for o in objs if o.version_info.type not in IGNORE_TYPES]
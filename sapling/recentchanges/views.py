@@ -8,8 +8,7 @@ from django.core.urlresolvers import reverse
 from versionutils.versioning.constants import *
 from pages.models import Page
 
-from utils import merge_changes
-from recentchanges import get_changes_classes
+from recentchanges import get_changes_classes, merge_changes
 
 MAX_DAYS_BACK = 7
 IGNORE_TYPES = [
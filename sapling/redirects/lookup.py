@@ -0,0 +1,183 @@
+"""
+A process-local redirect table used by RedirectFallbackMiddleware.
+
+Every 404 on the site -- including the endless stream of bot probes for
+things like /wp-login.php -- falls through to the redirect middleware.
+Rather than hitting the database each time, we keep a bloom filter of
+every redirect source so that the common miss costs no query at all,
+and remember the destination of each redirect we've looked up.  A
+redirect we haven't seen yet costs a single query, and its destination
+URL is built from a template rather than with reverse().
+
+Invalidation works through a generation counter kept in the shared
+cache.  Saving or deleting a Redirect bumps the counter, and each
+process throws away its table when it sees the counter change.  The
+bloom filter itself is stored in the cache too, keyed by generation, so
+only one process needs to rebuild it.  The counter is bumped again once
+the change is committed, so that a filter built from the old rows in
+the meantime isn't used.
+"""
+import hashlib
+import math
+import struct
+import time
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save, post_delete
+
+from pages.models import name_to_url
+from utils.transactions import repeat_on_commit
+
+from models import Redirect
+
+GENERATION_KEY = 'redirects_generation'
+BLOOM_KEY = 'redirects_bloom_%s'
+# Keep the generation for as long as the cache allows.
+CACHE_TIME = 60 * 60 * 24 * 30
+# Bound the number of destinations we remember per process.
+MAX_TABLE_SIZE = 10000
+URL_PLACEHOLDER = 'REDIRECT_DESTINATION'
+
+
+def new_generation():
+    # An integer, so it can be bumped with cache.incr(), that differs
+    # from any generation handed out before the key went missing.
+    return int(time.time() * 1000)
+
+
+class BloomFilter(object):
+    """
+    A simple bloom filter.  Membership tests never give false negatives
+    and give false positives at roughly the provided error rate.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _offsets(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(key).digest())
+        for i in xrange(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key):
+        for offset in self._offsets(key):
+            self.bits[offset // 8] |= 1 << (offset % 8)
+
+    def __contains__(self, key):
+        for offset in self._offsets(key):
+            if not self.bits[offset // 8] & (1 << (offset % 8)):
+                return False
+        return True
+
+
+class RedirectTable(object):
+    def __init__(self):
+        self.generation = None
+        self.bloom = None
+        self.destinations = {}
+        self.url_template = None
+
+    def page_url(self, name, slug):
+        """
+        Returns:
+            The same URL as Page.get_absolute_url() for a page with the
+            given name and slug, without going through reverse().
+        """
+        if self.url_template is None:
+            self.url_template = reverse('pages:show', args=[URL_PLACEHOLDER])
+        return self.url_template.replace(URL_PLACEHOLDER,
+                                         name and name_to_url(name) or slug)
+
+    def current_generation(self):
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # Either nobody's set it yet or it was evicted.  Either way
+            # we want every process to start fresh.
+            cache.add(GENERATION_KEY, new_generation(), CACHE_TIME)
+            generation = cache.get(GENERATION_KEY)
+        return generation
+
+    def build_bloom(self):
+        sources = Redirect.objects.values_list('source', flat=True)
+        sources = list(sources)
+        bloom = BloomFilter(len(sources))
+        for source in sources:
+            bloom.add(source)
+        return bloom
+
+    def refresh(self):
+        generation = self.current_generation()
+        if self.bloom is not None and generation == self.generation:
+            return
+        bloom = None
+        if generation is not None:
+            bloom = cache.get(BLOOM_KEY % generation)
+        if bloom is None:
+            bloom = self.build_bloom()
+            if generation is not None:
+                cache.set(BLOOM_KEY % generation, bloom, CACHE_TIME)
+        self.generation = generation
+        self.bloom = bloom
+        self.destinations = {}
+
+    def destination_url(self, slug):
+        """
+        Returns:
+            The URL the redirect with source `slug` points to, or None
+            if there's no such redirect.
+        """
+        self.refresh()
+        if slug not in self.bloom:
+            return None
+        if slug in self.destinations:
+            return self.destinations[slug]
+
+        destination = Redirect.objects.filter(source=slug).values_list(
+            'destination__name', 'destination__slug')
+        if destination:
+            url = self.page_url(*destination[0])
+        else:
+            # A bloom filter false positive.
+            url = None
+        if len(self.destinations) >= MAX_TABLE_SIZE:
+            self.destinations = {}
+        self.destinations[slug] = url
+        return url
+
+    def invalidate(self):
+        try:
+            cache.incr(GENERATION_KEY)
+        except (ValueError, TypeError):
+            # Not set yet (or evicted), or left over from when it wasn't
+            # a number.
+            cache.set(GENERATION_KEY, new_generation(), CACHE_TIME)
+        # The cache may not be shared (or may be the dummy cache), so
+        # always reset our own state.
+        self.bloom = None
+        self.destinations = {}
+
+
+_table = RedirectTable()
+
+
+def get_redirect_url(slug):
+    """
+    Returns:
+        The URL that the Redirect with source `slug` points to, or None if
+        there's no such Redirect.
+    """
+    return _table.destination_url(slug)
+
+
+def invalidate_redirects(*args, **kwargs):
+    repeat_on_commit(_table.invalidate)
+
+post_save.connect(invalidate_redirects, sender=Redirect)
+post_delete.connect(invalidate_redirects, sender=Redirect)
@@ -0,0 +1,84 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pages.models import Page
+from redirects.models import Redirect
+from versionutils.versioning.utils import get_versions
+
+
+class Command(BaseCommand):
+    help = ('Finds redirect chains and cycles and flattens them so that '
+            'every redirect points directly at an existing page.\n'
+            'Usage: localwiki-manage flatten_redirects [--dry-run]')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help="Report what would change but don't "
+                                "change anything."),
+    )
+
+    def _last_slug(self, page_id):
+        # The destination page may have been deleted out from under the
+        # redirect.  Use its last known slug to keep following the chain.
+        versions = get_versions(Page).filter(id=page_id)
+        if versions:
+            return versions[0].slug
+        return None
+
+    def _final_slug(self, redirect):
+        """
+        Follows `redirect` until it reaches an existing page.
+
+        Returns:
+            The slug of the existing page, or None if the chain is a
+            cycle or leads nowhere.
+        """
+        seen = set([redirect.source])
+        while True:
+            slug = self.page_slugs.get(redirect.destination_id)
+            if slug is None:
+                slug = self._last_slug(redirect.destination_id)
+            if slug is None or slug in seen:
+                return None
+            if slug in self.existing_slugs:
+                return slug
+            seen.add(slug)
+            redirect = self.redirects.get(slug)
+            if redirect is None:
+                return None
+
+    def _delete(self, redirect, reason):
+        self.stdout.write((u'Deleting redirect "%s": %s\n' %
+                           (redirect.source, reason)).encode('utf-8'))
+        if not self.dry_run:
+            redirect.delete(comment=reason)
+        del self.redirects[redirect.source]
+
+    def handle(self, *args, **options):
+        self.dry_run = options.get('dry_run')
+        self.page_slugs = dict(Page.objects.values_list('id', 'slug'))
+        self.existing_slugs = set(self.page_slugs.values())
+        self.redirects = dict((r.source, r) for r in Redirect.objects.all())
+
+        # A redirect whose source page exists never fires.  This is also
+        # how a cycle (a -> b, b -> a) between two existing pages looks.
+        for r in self.redirects.values():
+            if r.source in self.existing_slugs:
+                self._delete(r, 'a page exists with the same name')
+
+        updated = 0
+        for r in self.redirects.values():
+            final = self._final_slug(r)
+            if final is None:
+                self._delete(r, 'redirect chain is a cycle or is broken')
+                continue
+            if self.page_slugs.get(r.destination_id) == final:
+                continue
+            self.stdout.write((u'Pointing redirect "%s" at "%s"\n' %
+                               (r.source, final)).encode('utf-8'))
+            updated += 1
+            if not self.dry_run:
+                r.destination = Page.objects.get(slug=final)
+                r.save(comment='Flattened redirect chain')
+
+        self.stdout.write('Flattened %d redirects.\n' % updated)
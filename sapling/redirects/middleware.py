@@ -2,7 +2,7 @@ from django.http import HttpResponseRedirect
 
 from pages.models import slugify
 
-from models import Redirect
+from lookup import get_redirect_url
 
 
 def _is_redirect(response):
@@ -23,20 +23,15 @@ class RedirectFallbackMiddleware(object):
             # force-displayed.
             return response
 
-        r = None
         # Skip leading slash.
         slug = slugify(request.get_full_path()[1:])
         # Skip trailing slash.
         if slug.endswith('/'):
             slug = slug[:-1]
-        try:
-            r = Redirect.objects.get(source=slug)
-        except Redirect.DoesNotExist:
-            pass
-        if r is not None:
+        url = get_redirect_url(slug)
+        if url is not None:
             return HttpResponseRedirect(
-                r.destination.get_absolute_url() +
-                '?&redirected_from=%s' % slug
+                url + '?&redirected_from=%s' % slug
             )
 
         # No redirect was found. Return the response.
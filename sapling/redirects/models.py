@@ -33,3 +33,4 @@ pre_save.connect(_validate_redirect, sender=Redirect)
 # For registration calls
 import feeds
 import api
+import lookup
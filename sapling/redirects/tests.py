@@ -1,8 +1,12 @@
 from django.test import TestCase
+from django.core.cache import get_cache
+from django.core.management import call_command
 
 from pages.models import Page
 
 from models import Redirect
+from lookup import BloomFilter, get_redirect_url
+import lookup
 import exceptions
 
 
@@ -12,3 +16,102 @@ class RedirectTest(TestCase):
         p.save()
         r = Redirect(source='foobar', destination=p)
         self.assertRaises(exceptions.RedirectToSelf, r.save)
+
+
+class BloomFilterTest(TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(100)
+        keys = [u'page_%d' % i for i in range(100)] + [u'caf\xe9']
+        for key in keys:
+            bloom.add(key)
+        for key in keys:
+            self.assertTrue(key in bloom)
+
+    def test_misses(self):
+        bloom = BloomFilter(100)
+        for i in range(100):
+            bloom.add(u'page_%d' % i)
+        misses = [u'other_%d' % i for i in range(1000)]
+        false_positives = len([k for k in misses if k in bloom])
+        self.assertTrue(false_positives < 50)
+
+
+class RedirectLookupTest(TestCase):
+    def setUp(self):
+        self.page = Page(name="Destination", content="<p>dest</p>")
+        self.page.save()
+
+    def test_lookup(self):
+        r = Redirect(source='old_name', destination=self.page)
+        r.save()
+        self.assertEqual(get_redirect_url('old_name'),
+                         self.page.get_absolute_url())
+        self.assertEqual(get_redirect_url('something_else'), None)
+
+    def test_miss_needs_no_query(self):
+        Redirect(source='old_name', destination=self.page).save()
+        get_redirect_url('warm_up')
+        self.assertNumQueries(0, get_redirect_url, 'wp-login.php')
+
+    def test_invalidated_on_change(self):
+        r = Redirect(source='old_name', destination=self.page)
+        r.save()
+        self.assertEqual(get_redirect_url('old_name'),
+                         self.page.get_absolute_url())
+        r.delete()
+        self.assertEqual(get_redirect_url('old_name'), None)
+        Redirect(source='new_name', destination=self.page).save()
+        self.assertEqual(get_redirect_url('new_name'),
+                         self.page.get_absolute_url())
+
+    def test_shared_generation(self):
+        old_cache = lookup.cache
+        lookup.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            get_redirect_url('warm_up')
+            generation = lookup.cache.get(lookup.GENERATION_KEY)
+            Redirect(source='old_name', destination=self.page).save()
+            self.assertTrue(
+                lookup.cache.get(lookup.GENERATION_KEY) > generation)
+            self.assertEqual(get_redirect_url('old_name'),
+                             self.page.get_absolute_url())
+        finally:
+            lookup.cache = old_cache
+
+
+class RedirectChainTest(TestCase):
+    def test_rename_collapses_chain(self):
+        p = Page(name="Page A", content="<p>a</p>")
+        p.save()
+        p.rename_to("Page B")
+        Page.objects.get(slug='page b').rename_to("Page C")
+        c = Page.objects.get(slug='page c')
+        self.assertEqual(Redirect.objects.get(source='page a').destination,
+                         c)
+        self.assertEqual(Redirect.objects.get(source='page b').destination,
+                         c)
+        self.assertEqual(get_redirect_url('page a'), c.get_absolute_url())
+
+    def test_flatten_redirects(self):
+        b = Page(name="Page B", content="<p>b</p>")
+        b.save()
+        old_b_id = b.id
+        b.rename_to("Page C")
+        c = Page.objects.get(slug='page c')
+        # Simulate a redirect left pointing at the old page.
+        r = Redirect(source='page x', destination=c)
+        r.save()
+        Redirect.objects.filter(source='page x').update(destination=old_b_id)
+        # And a redirect that's shadowed by an existing page.
+        d = Page(name="Page D", content="<p>d</p>")
+        d.save()
+        Redirect(source='page y', destination=c).save()
+        Redirect.objects.filter(source='page y').update(source='page d')
+
+        call_command('flatten_redirects')
+
+        self.assertEqual(Redirect.objects.get(source='page x').destination,
+                         c)
+        self.assertEqual(len(Redirect.objects.filter(source='page d')), 0)
+        self.assertEqual(len(Page.objects.filter(slug='page d')), 1)
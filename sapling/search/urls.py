@@ -10,6 +10,7 @@ from haystack.forms import SearchForm as DefaultSearchForm
 from pages.models import Page, slugify
 from maps.models import MapData
 from maps.widgets import InfoMap
+from users.shortcuts import objects_with_perm
 
 
 class CreatePageSearchView(SearchView):
@@ -42,8 +43,19 @@ class CreatePageSearchView(SearchView):
         context['query_slug'] = Page(name=self.query).pretty_slug
         context['keywords'] = self.query.split()
         context['map'] = self.get_map()
+        context['protected_pages'] = self.get_protected_pages()
         return context
 
+    def get_protected_pages(self):
+        (paginator, page) = self.build_page()
+        result_pks = [r.pk for r in page.object_list
+                      if r and r.model_name == 'page']
+        pages = Page.objects.filter(pk__in=result_pks).defer('content')
+        editable = objects_with_perm(self.request.user, 'pages.change_page',
+                                     pages)
+        # Search result pks are strings.
+        return set([unicode(p.pk) for p in pages if p.pk not in editable])
+
 
 def popup_html(map_data):
     page = map_data.page
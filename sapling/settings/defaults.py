@@ -84,6 +84,10 @@ MEDIA_ROOT = os.path.join(DATA_ROOT, 'media')
 # Examples: "http://media.lawrence.com", "http://example.com/media/"
 MEDIA_URL = '/media/'
 
+# Uploads are streamed to disk and hashed as they arrive.  See
+# utils/uploadhandler.py.
+FILE_UPLOAD_HANDLERS = ('utils.uploadhandler.HashingUploadHandler',)
+
 # staticfiles settings
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(DATA_ROOT, 'static')
@@ -211,8 +215,9 @@ MIDDLEWARE_CLASSES = (
     'honeypot.middleware.HoneypotMiddleware',
     'versionutils.versioning.middleware.AutoTrackUserInfoMiddleware',
     'redirects.middleware.RedirectFallbackMiddleware',
+    'utils.transactions.CommitHooksMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    'utils.middleware.FetchFromCacheMiddleware',
     'utils.middleware.TrackPOSTMiddleware',
     'api.middleware.XsSharing',
 )
@@ -224,6 +229,10 @@ CACHES = {
     }
 }
 
+# Cached pages that know what they depend on are thrown away as soon as
+# any of it changes, so they can be kept much longer than other pages.
+CACHE_MIDDLEWARE_TRACKED_SECONDS = 60 * 60 * 24
+
 ROOT_URLCONF = 'sapling.urls'
 
 TEMPLATE_DIRS = (
@@ -1,9 +1,15 @@
+from django.conf.urls.defaults import url
+
 from tastypie.resources import ModelResource, ALL
-from tastypie import fields
+from tastypie import fields, http
 from tastypie.constants import ALL_WITH_RELATIONS
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.utils import trailing_slash
 
-from models import Tag, PageTagSet
+from models import Tag, PageTagSet, slugify
+from bulk import bulk_update_tags, get_or_create_tags
 from pages.api import PageURLMixin
+from pages.models import Page, slugify as page_slugify
 from sapling.api import api
 from sapling.api.resources import ModelHistoryResource
 from sapling.api.authentication import ApiKeyWriteAuthentication
@@ -54,6 +60,62 @@ class PageTagSetResource(PageURLMixin, ModelResource):
         authentication = ApiKeyWriteAuthentication()
         authorization = ChangePageAuthorization()
 
+    def prepend_urls(self):
+        # Page names can't start with the _ character, so this can't
+        # collide with a page's tag set.
+        l = [
+            url(r"^(?P<resource_name>%s)/_bulk%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                 self.wrap_view('bulk_update'), name="api_bulk_update"),
+        ]
+        l += super(PageTagSetResource, self).prepend_urls()
+        return l
+
+    def bulk_update(self, request, **kwargs):
+        """
+        Adds and removes tags across many pages in one go.  POST
+        something like::
+
+            {"pages": ["Front Page", "Parks"],
+             "add": ["park", "outdoors"],
+             "remove": ["indoors"],
+             "comment": "Reorganizing"}
+
+        Responds with the names of the pages whose tags were changed.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        self.throttle_check(request)
+
+        data = self.deserialize(request, request.raw_post_data,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        page_names = data.get('pages') or []
+        if not page_names or not (data.get('add') or data.get('remove')):
+            raise ImmediateHttpResponse(response=http.HttpBadRequest(
+                'You must provide "pages" and at least one of "add" or '
+                '"remove".'))
+
+        pages = Page.objects.filter(
+            slug__in=[page_slugify(name) for name in page_names])
+        for page in pages:
+            if not request.user.has_perm('pages.change_page', page):
+                raise ImmediateHttpResponse(response=http.HttpForbidden(
+                    'You do not have permission to change the tags on "%s".'
+                    % page.name))
+
+        changed = bulk_update_tags(pages,
+            add=get_or_create_tags(data.get('add') or []),
+            remove=Tag.objects.filter(slug__in=[
+                slugify(name) for name in data.get('remove') or []]),
+            comment=data.get('comment'),
+            user=request.user.is_authenticated() and request.user or None,
+            user_ip=request.META.get('REMOTE_ADDR'))
+
+        self.log_throttled_access(request)
+        return self.create_response(request,
+            {'changed': [p.name for p in changed]})
+
 
 # We don't use detail_uri_name here because it becomes too complicated
 # to generate pretty URLs with the historical version identifers.
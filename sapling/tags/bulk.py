@@ -0,0 +1,161 @@
+"""
+Adding and removing tags across many pages at once.
+
+Tagging pages one at a time through PageTagSetForm (or the API) saves
+each PageTagSet, fires m2m_changed for every change and reindexes the
+page right away.  bulk_update_tags() instead makes all of the changes
+inside a single transaction using multi-row inserts, records the
+history in batch and reindexes the changed pages once at the end.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from versionutils.versioning.bulk import (create_historical_records,
+    create_historical_m2m)
+from versionutils.versioning.constants import TYPE_ADDED, TYPE_UPDATED
+from pages.models import Page
+
+from models import Tag, PageTagSet, slugify
+from forms import tag_change_comment
+from signals import reindex_pages, invalidate_tag_cache
+from utils.cache_dependencies import invalidate, page_dependency
+
+
+def get_or_create_tags(names):
+    """
+    Returns:
+        A list of the Tags with the provided names, creating any that
+        don't exist yet.
+    """
+    tags = {}
+    for name in names:
+        name = name.strip()
+        if not name or slugify(name) in tags:
+            continue
+        tag, created = Tag.objects.get_or_create(slug=slugify(name),
+                                                 defaults={'name': name})
+        tags[tag.slug] = tag
+    return tags.values()
+
+
+def _create_tagsets(pages):
+    """
+    Creates empty PageTagSets for `pages` using a single INSERT.  No
+    signals are sent; the caller is responsible for the history.
+    """
+    if not pages:
+        return []
+    qn = connection.ops.quote_name
+    page_field = PageTagSet._meta.get_field('page')
+    cursor = connection.cursor()
+    cursor.executemany('INSERT INTO %s (%s) VALUES (%%s)' % (
+        qn(PageTagSet._meta.db_table), qn(page_field.column)),
+        [(p.pk,) for p in pages])
+    transaction.set_dirty()
+    return list(PageTagSet.objects.filter(page__in=[p.pk for p in pages]))
+
+
+@transaction.commit_on_success
+def _bulk_update_tags(pages, add, remove, comment, user, user_ip):
+    field = PageTagSet._meta.get_field('tags')
+    through = field.rel.through
+    tagset_col = field.m2m_field_name()
+    tag_col = field.m2m_reverse_field_name()
+
+    tagsets = dict((ts.page_id, ts) for ts in
+                   PageTagSet.objects.filter(page__in=[p.pk for p in pages]))
+    created = []
+    if add:
+        missing = [p for p in pages if p.pk not in tagsets]
+        created = _create_tagsets(missing)
+        for ts in created:
+            tagsets[ts.page_id] = ts
+    if not tagsets:
+        return []
+
+    current = defaultdict(set)
+    qs = through.objects.filter(
+        **{'%s__in' % tagset_col: [ts.pk for ts in tagsets.values()]})
+    for tagset_id, tag_id in qs.values_list(tagset_col, tag_col):
+        current[tagset_id].add(tag_id)
+
+    created_ids = set([ts.pk for ts in created])
+    tag_names = dict((t.pk, t) for t in add + remove)
+    add = set([t.pk for t in add])
+    remove = set([t.pk for t in remove]) - add
+    changed = []
+    new_rows = []
+    members = {}
+    for ts in tagsets.values():
+        before = current[ts.pk]
+        after = (before | add) - remove
+        if after == before and ts.pk not in created_ids:
+            continue
+        new_rows.extend([(ts.pk, tag_id) for tag_id in add - before])
+        members[ts.pk] = after
+        ts._save_with = {
+            'comment': comment or tag_change_comment(
+                [tag_names[t] for t in after - before],
+                [tag_names[t] for t in before - after]),
+            'user': user,
+            'user_ip': user_ip,
+        }
+        if ts.pk in created_ids:
+            ts._history_type = TYPE_ADDED
+        changed.append(ts)
+    if not changed:
+        return []
+
+    if remove:
+        through.objects.filter(**{
+            '%s__in' % tagset_col: [ts.pk for ts in changed],
+            '%s__in' % tag_col: remove,
+        }).delete()
+    if new_rows:
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+            qn(through._meta.db_table), qn(field.m2m_column_name()),
+            qn(field.m2m_reverse_name())), new_rows)
+        transaction.set_dirty()
+
+    history_ids = create_historical_records(PageTagSet, changed, TYPE_UPDATED)
+    create_historical_m2m(PageTagSet, 'tags', dict(
+        (history_ids[pk], tag_ids) for pk, tag_ids in members.iteritems()))
+
+    return [ts.page_id for ts in changed]
+
+
+def bulk_update_tags(pages, add=None, remove=None, comment=None, user=None,
+                     user_ip=None):
+    """
+    Adds the tags `add` to, and removes the tags `remove` from, each of
+    the provided pages.  All of the changes happen in one transaction,
+    a single historical record is written for each page whose tags
+    changed, and the changed pages are reindexed once the transaction
+    has been committed.
+
+    Args:
+        pages: An iterable of Pages.
+        add: An iterable of Tags to add.
+        remove: An iterable of Tags to remove.  If a tag is in both
+            `add` and `remove` it's added.
+        comment: Optional history comment.  By default the comment
+            lists the tags that were added and removed on each page.
+        user: Optional User to record the change as coming from.
+        user_ip: Optional IP address to record the change as coming from.
+
+    Returns:
+        A list of the Pages whose tags changed.
+    """
+    pages = list(pages)
+    add, remove = list(add or []), list(remove or [])
+    changed_ids = set(_bulk_update_tags(pages, add, remove, comment, user,
+                                        user_ip))
+    changed = [p for p in pages if p.pk in changed_ids]
+    reindex_pages(Page.objects.filter(pk__in=changed_ids))
+    if changed:
+        invalidate(*[page_dependency(p.slug) for p in changed])
+        invalidate_tag_cache(add + remove)
+    return changed
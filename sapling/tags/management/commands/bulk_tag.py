@@ -0,0 +1,61 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pages.models import Page, slugify as page_slugify
+from tags.models import Tag, slugify
+from tags.bulk import bulk_update_tags, get_or_create_tags
+
+
+def _split_names(value):
+    if not value:
+        return []
+    return [s.strip() for s in value.split(',') if s.strip()]
+
+
+class Command(BaseCommand):
+    args = '<pagename pagename ...>'
+    help = ('Adds and removes tags on many pages at once.\n' +
+           'Usage: localwiki-manage bulk_tag --add="tag 1,tag 2" '
+           '--remove="tag 3" <pagename> [<pagename> ...]')
+    option_list = BaseCommand.option_list + (
+        make_option('--add', dest='add',
+            help='Comma-separated list of tags to add.'),
+        make_option('--remove', dest='remove',
+            help='Comma-separated list of tags to remove.'),
+        make_option('--comment', dest='comment',
+            help='Comment to save in the page tags history.'),
+        make_option('--pages-from', dest='pages_from',
+            help='Read page names, one per line, from this file.'),
+    )
+
+    def handle(self, *pagenames, **options):
+        pagenames = list(pagenames)
+        if options.get('pages_from'):
+            f = open(options['pages_from'])
+            pagenames += [line.decode('utf-8').strip() for line in f
+                          if line.strip()]
+            f.close()
+        add = _split_names(options.get('add'))
+        remove = _split_names(options.get('remove'))
+        if not pagenames:
+            raise CommandError("You must provide at least one page name.")
+        if not (add or remove):
+            raise CommandError("You must provide --add or --remove.")
+
+        slugs = set([page_slugify(name) for name in pagenames])
+        pages = list(Page.objects.filter(slug__in=slugs))
+        missing = slugs - set([p.slug for p in pages])
+        for slug in missing:
+            self.stderr.write((u'Page "%s" does not exist, skipping.\n' %
+                               slug).encode('utf-8'))
+
+        changed = bulk_update_tags(pages,
+            add=get_or_create_tags(add),
+            remove=Tag.objects.filter(
+                slug__in=[slugify(name) for name in remove]),
+            comment=options.get('comment'))
+
+        self.stdout.write('Updated tags on %d of %d pages.\n' %
+                          (len(changed), len(pages)))
@@ -1,7 +1,9 @@
 from django.db import models
 from pages.search_indexes import PageIndex
-from tags.models import PageTagSet
+from tags.models import PageTagSet, Tag
 from pages.models import Page
+from utils.cache_dependencies import (invalidate, page_dependency,
+    tag_dependency)
 
 
 def reindex_page(sender, **kwargs):
@@ -11,5 +13,55 @@ def reindex_page(sender, **kwargs):
     if kwargs['action'] in ['post_add', 'post_remove', 'post_clear']:
         PageIndex(Page).update_object(kwargs['instance'].page)
 
+
+def reindex_pages(pages):
+    """
+    Reindexes `pages` with a single call to the search backend.
+    """
+    pages = list(pages)
+    if not pages:
+        return
+    index = PageIndex(Page)
+    index.backend.update(index, pages)
+
 models.signals.m2m_changed.connect(reindex_page,
     sender=PageTagSet.tags.through)
+
+
+def invalidate_tag_cache(tags):
+    invalidate(*[tag_dependency(t.slug) for t in tags])
+
+
+def _tags_changed_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'pre_clear']:
+        return
+    if reverse:
+        # Changed from the Tag side, e.g. tag.pagetagset_set.add(..)
+        tags = [instance]
+        if action == 'pre_clear':
+            tagsets = instance.pagetagset_set.all()
+        else:
+            tagsets = PageTagSet.objects.filter(pk__in=pk_set)
+    else:
+        if action == 'pre_clear':
+            tags = instance.tags.all()
+        else:
+            tags = Tag.objects.filter(pk__in=pk_set)
+        tagsets = [instance]
+    invalidate_tag_cache(tags)
+    invalidate(*[page_dependency(ts.page.slug) for ts in tagsets])
+
+
+def _tagset_deleted_cache(sender, instance, **kwargs):
+    invalidate_tag_cache(instance.tags.all())
+    invalidate(page_dependency(instance.page.slug))
+
+
+def _page_saved_cache(sender, instance, **kwargs):
+    # Lists of tagged pages show the page's name.
+    invalidate_tag_cache(Tag.objects.filter(pagetagset__page=instance))
+
+models.signals.m2m_changed.connect(_tags_changed_cache,
+    sender=PageTagSet.tags.through)
+models.signals.pre_delete.connect(_tagset_deleted_cache, sender=PageTagSet)
+models.signals.post_save.connect(_page_saved_cache, sender=Page)
@@ -1,9 +1,15 @@
+import hashlib
+
 from django import template
-from tags.models import PageTagSet, slugify, Tag
+from django.utils.encoding import smart_str
+from django.utils.translation import get_language
+from tags.models import PageTagSet, slugify
 from tags.forms import PageTagSetForm
 from django.template.loader import render_to_string
 from pages.templatetags.pages_tags import IncludeContentNode
 from tags.views import TaggedList
+from utils.cache_dependencies import (record_dependency, page_dependency,
+    render_cached)
 
 
 register = template.Library()
@@ -44,13 +50,6 @@ def do_include_page(parser, token):
 
 
 class IncludeTagNode(IncludeContentNode):
-    def __init__(self, *args, **kwargs):
-        super(IncludeTagNode, self).__init__(*args, **kwargs)
-        try:
-            self.tag = Tag.objects.get(slug=slugify(self.name))
-        except Tag.DoesNotExist:
-            self.tag = None
-
     def get_title(self, context):
         return 'Pages tagged &ldquo;%s&rdquo;' % self.name
 
@@ -58,5 +57,14 @@ class IncludeTagNode(IncludeContentNode):
         view = TaggedList()
         view.kwargs = dict(slug=self.name)
         view.object_list = view.get_queryset()
+        # The list shows each page's name and map.
+        record_dependency(*[page_dependency(ts.page.slug)
+                            for ts in view.object_list])
         data = view.get_context_data(object_list=view.object_list)
         return render_to_string('tags/tagged_list_snippet.html', data)
+
+    def render_content(self, context):
+        # The list is cached until the tag's pages change.
+        key = 'include_tag:%s' % hashlib.md5(smart_str(
+            '%s:%s' % (slugify(self.name), get_language()))).hexdigest()
+        return render_cached(key, lambda: self.get_content(context))
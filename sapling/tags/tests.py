@@ -1,7 +1,10 @@
 # coding=utf-8
 
 from django.test import TestCase
-from tags.models import Tag
+from tags.models import Tag, PageTagSet
+from tags.bulk import bulk_update_tags
+from pages.models import Page
+from versionutils.versioning.constants import TYPE_ADDED, TYPE_UPDATED
 from django.db import IntegrityError
 
 
@@ -33,3 +36,69 @@ class TagTest(TestCase):
         t = Tag(name='Сочи 2014')
         t.save()
         self.assertEqual(t.slug, 'сочи2014'.decode('utf-8'))
+
+
+class BulkUpdateTagsTest(TestCase):
+    def setUp(self):
+        self.pages = []
+        for name in ['Page one', 'Page two', 'Page three']:
+            p = Page(name=name, content='<p>%s</p>' % name)
+            p.save()
+            self.pages.append(p)
+        self.park = Tag(name='park')
+        self.park.save()
+        self.dogs = Tag(name='dogs')
+        self.dogs.save()
+
+    def _tag_slugs(self, page):
+        return set([t.slug for t in
+                    PageTagSet.objects.get(page=page).tags.all()])
+
+    def test_add_tags(self):
+        changed = bulk_update_tags(self.pages, add=[self.park, self.dogs])
+        self.assertEqual(len(changed), 3)
+        for p in self.pages:
+            self.assertEqual(self._tag_slugs(p), set(['park', 'dogs']))
+            tagset = PageTagSet.objects.get(page=p)
+            self.assertEqual(len(tagset.versions.all()), 1)
+            latest = tagset.versions.most_recent()
+            self.assertEqual(latest.version_info.type, TYPE_ADDED)
+            self.assertEqual(set([t.slug for t in latest.tags.all()]),
+                             set(['park', 'dogs']))
+
+    def test_remove_tags(self):
+        bulk_update_tags(self.pages, add=[self.park, self.dogs])
+        changed = bulk_update_tags(self.pages[:2], remove=[self.dogs],
+                                   comment='No dogs allowed')
+        self.assertEqual(len(changed), 2)
+        self.assertEqual(self._tag_slugs(self.pages[0]), set(['park']))
+        self.assertEqual(self._tag_slugs(self.pages[2]),
+                         set(['park', 'dogs']))
+
+        tagset = PageTagSet.objects.get(page=self.pages[0])
+        self.assertEqual(len(tagset.versions.all()), 2)
+        latest = tagset.versions.most_recent()
+        self.assertEqual(latest.version_info.type, TYPE_UPDATED)
+        self.assertEqual(latest.version_info.comment, 'No dogs allowed')
+        self.assertEqual([t.slug for t in latest.tags.all()], ['park'])
+        # The older version still has both tags.
+        first = tagset.versions.as_of(version=1)
+        self.assertEqual(set([t.slug for t in first.tags.all()]),
+                         set(['park', 'dogs']))
+
+    def test_unchanged_pages_skipped(self):
+        tagset = PageTagSet(page=self.pages[0])
+        tagset.save()
+        tagset.tags.add(self.park)
+        num_versions = len(tagset.versions.all())
+
+        changed = bulk_update_tags(self.pages, add=[self.park])
+        self.assertEqual(set([p.pk for p in changed]),
+                         set([p.pk for p in self.pages[1:]]))
+        self.assertEqual(len(tagset.versions.all()), num_versions)
+
+        # Removing a tag from pages without a tag set does nothing.
+        p = Page(name='Untagged', content='<p>Untagged</p>')
+        p.save()
+        self.assertEqual(bulk_update_tags([p], remove=[self.park]), [])
+        self.assertFalse(PageTagSet.objects.filter(page=p).exists())
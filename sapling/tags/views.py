@@ -14,6 +14,8 @@ from versionutils.diff.views import CompareView
 from models import PageTagSet, Tag, slugify
 from forms import PageTagSetForm
 from pages.models import Page
+from users.shortcuts import objects_with_perm
+from utils.cache_dependencies import record_dependency, tag_dependency
 
 from utils.views import CreateObjectMixin, PermissionRequiredMixin,\
     Custom404Mixin
@@ -38,10 +40,12 @@ class TaggedList(ListView):
 
     def get_queryset(self):
         self.tag_name = slugify(self.kwargs['slug'])
+        record_dependency(tag_dependency(self.tag_name))
         try:
             self.tag = Tag.objects.get(slug=self.tag_name)
             self.tag_name = self.tag.name
-            return PageTagSet.objects.filter(tags=self.tag)
+            return PageTagSet.objects.filter(tags=self.tag).select_related(
+                'page')
         except Tag.DoesNotExist:
             self.tag = None
             return PageTagSet.objects.none()
@@ -63,6 +67,13 @@ class TaggedList(ListView):
         context = super(TaggedList, self).get_context_data(*args, **kwargs)
         context['tag'] = self.tag
         context['tag_name'] = self.tag_name
+        if getattr(self, 'request', None):
+            # Not set when the list is included in another page.
+            pages = [ts.page for ts in context['object_list']]
+            editable = objects_with_perm(self.request.user,
+                                         'pages.change_page', pages)
+            context['protected_pages'] = set(
+                [p.pk for p in pages if p.pk not in editable])
         map_objects = self.get_map_objects()
         if map_objects:
             # Remove the PanZoomBar on normal page views.
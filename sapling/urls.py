@@ -42,7 +42,7 @@ if not settings.DEBUG:
     urlpatterns += patterns('',
         (r'^static/(?P<path>.*)$', 'django.views.static.serve',
         {'document_root': settings.STATIC_ROOT}),
-        (r'^media/(?P<path>.*)$', 'django.views.static.serve',
+        (r'^media/(?P<path>.*)$', 'utils.sendfile.serve',
         {'document_root': settings.MEDIA_ROOT}),
     )
 
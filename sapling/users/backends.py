@@ -1,9 +1,18 @@
+import time
+
 from django.contrib.auth.models import User
 from guardian.backends import ObjectPermissionBackend
+from guardian.core import ObjectPermissionChecker
+from guardian.exceptions import WrongAppError
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from guardian.models import UserObjectPermission, GroupObjectPermission
 
+from utils.transactions import repeat_on_commit
+
 
 class CaseInsensitiveModelBackend(object):
     supports_object_permissions = True
@@ -49,6 +58,11 @@ class RestrictiveBackend(object):
 
     Uses django-guardian internally to check object permissions and the default
     django.contrib.auth.backends.ModelBackend for model permissions.
+
+    Results are memoized on the user object, which usually lives for a
+    single request, so repeated checks in templates and views are cheap.
+    The memoized results are thrown away whenever object permissions
+    change.
     """
     supports_object_permissions = True
     supports_anonymous_user = True
@@ -59,31 +73,146 @@ class RestrictiveBackend(object):
     def authenticate(self, username=None, password=None):
         return None
 
+    def _get_perm_cache(self, user_obj):
+        """
+        Returns:
+            A dictionary, stored on `user_obj`, used to memoize permission
+            checks for as long as `user_obj` is around.
+        """
+        perm_cache = getattr(user_obj, '_restrictive_perm_cache', None)
+        if (perm_cache is None or perm_cache['generation'] !=
+                object_permissions.local_generation):
+            # Check for changes made elsewhere once per user object.
+            generation = object_permissions.refresh()
+            perm_cache = {'generation': generation, 'perms': {}}
+            user_obj._restrictive_perm_cache = perm_cache
+        return perm_cache
+
     def is_banned(self, user_obj):
-        return (BANNED_GROUP and
-               user_obj.groups.filter(name=BANNED_GROUP).exists())
+        if not BANNED_GROUP:
+            return False
+        perm_cache = self._get_perm_cache(user_obj)
+        if 'banned' not in perm_cache:
+            perm_cache['banned'] = user_obj.groups.filter(
+                name=BANNED_GROUP).exists()
+        return perm_cache['banned']
+
+    def get_anonymous_user(self, user_obj):
+        perm_cache = self._get_perm_cache(user_obj)
+        if 'anonymous' not in perm_cache:
+            perm_cache['anonymous'] = User.objects.get(pk=ANONYMOUS_USER_ID)
+        return perm_cache['anonymous']
 
     def has_perm(self, user_obj, perm, obj=None):
         default_has_perm = False
         if user_obj.is_authenticated():
             default_has_perm = LOGGED_IN_HAS_PERM
         else:
-            user_obj = User.objects.get(pk=ANONYMOUS_USER_ID)
+            user_obj = self.get_anonymous_user(user_obj)
         if not user_obj.is_active:
             return False
         if user_obj.is_superuser:
             return True
         if self.is_banned(user_obj):
             return False
-        if obj and self.object_has_perms(obj):
-            return self._object_backend.has_perm(user_obj, perm, obj)
-        has_model_perm = self._model_backend.has_perm(user_obj, perm)
-        return has_model_perm or default_has_perm
+
+        perms = self._get_perm_cache(user_obj)['perms']
+        key = (perm, obj and object_key(obj))
+        if key not in perms:
+            if obj and self.object_has_perms(obj):
+                perms[key] = self._object_has_perm(user_obj, perm, obj)
+            else:
+                has_model_perm = self._model_backend.has_perm(user_obj, perm)
+                perms[key] = has_model_perm or default_has_perm
+        return perms[key]
+
+    def get_perms_for_objects(self, user_obj, perm, objects):
+        """
+        Checks `perm` on many objects at once.  Works like calling
+        has_perm() on each object, except that the object permissions are
+        looked up with two queries (one for the user's permissions, one
+        for their groups') per type of object.
+
+        Returns:
+            A dictionary mapping the pk of each object to True or False.
+        """
+        objects = list(objects)
+        default_has_perm = False
+        if user_obj.is_authenticated():
+            default_has_perm = LOGGED_IN_HAS_PERM
+        else:
+            user_obj = self.get_anonymous_user(user_obj)
+        if not user_obj.is_active:
+            return dict((obj.pk, False) for obj in objects)
+        if user_obj.is_superuser:
+            return dict((obj.pk, True) for obj in objects)
+        if self.is_banned(user_obj):
+            return dict((obj.pk, False) for obj in objects)
+
+        perms = self._get_perm_cache(user_obj)['perms']
+        result = {}
+        restricted = []
+        for obj in objects:
+            key = (perm, object_key(obj))
+            if key in perms:
+                result[obj.pk] = perms[key]
+            elif self.object_has_perms(obj):
+                restricted.append(obj)
+            else:
+                has_model_perm = self._model_backend.has_perm(user_obj, perm)
+                result[obj.pk] = perms[key] = (has_model_perm or
+                                               default_has_perm)
+        granted = self._objects_with_perm(user_obj, perm, restricted)
+        for obj in restricted:
+            key = (perm, object_key(obj))
+            result[obj.pk] = perms[key] = key[1] in granted
+        return result
+
+    def _objects_with_perm(self, user_obj, perm, objects):
+        """
+        Returns:
+            A set of (content type id, object pk) pairs for the objects in
+            `objects` that `user_obj` has the object permission `perm` on.
+        """
+        by_type = {}
+        for obj in objects:
+            if '.' in perm and perm.split('.')[0] != obj._meta.app_label:
+                raise WrongAppError("Passed perm has app label of '%s' and "
+                    "given obj has '%s'" % (perm.split('.')[0],
+                                            obj._meta.app_label))
+            ct_id, pk = object_key(obj)
+            by_type.setdefault(ct_id, []).append(pk)
+
+        codename = perm.split('.')[-1]
+        granted = set()
+        for ct_id, pks in by_type.iteritems():
+            lookup = {'content_type': ct_id, 'object_pk__in': pks,
+                      'permission__codename': codename}
+            user_perms = UserObjectPermission.objects.filter(user=user_obj,
+                **lookup)
+            group_perms = GroupObjectPermission.objects.filter(
+                group__user=user_obj, **lookup)
+            for qs in (user_perms, group_perms):
+                granted.update([(ct_id, unicode(object_pk)) for object_pk in
+                                qs.values_list('object_pk', flat=True)])
+        return granted
+
+    def _object_has_perm(self, user_obj, perm, obj):
+        # Like ObjectPermissionBackend.has_perm, but we keep the
+        # ObjectPermissionChecker around so its cache of each object's
+        # permissions is reused.
+        if '.' in perm:
+            app_label, perm = perm.split('.')
+            if app_label != obj._meta.app_label:
+                raise WrongAppError("Passed perm has app label of '%s' and "
+                    "given obj has '%s'" % (app_label, obj._meta.app_label))
+        perm_cache = self._get_perm_cache(user_obj)
+        if 'checker' not in perm_cache:
+            perm_cache['checker'] = ObjectPermissionChecker(user_obj)
+        return perm_cache['checker'].has_perm(perm, obj)
 
     def object_has_perms(self, obj):
-        return (GroupObjectPermission.objects.filter(object_pk=obj.pk).exists()
-                or
-                UserObjectPermission.objects.filter(object_pk=obj.pk).exists())
+        return object_key(obj) in object_permissions
 
     def has_module_perms(self, user_obj, app_label):
         return self._model_backend.has_module_perms(user_obj, app_label)
@@ -91,3 +220,94 @@ class RestrictiveBackend(object):
 ANONYMOUS_USER_ID = settings.ANONYMOUS_USER_ID  # we *want* error if not set
 BANNED_GROUP = getattr(settings, "USERS_BANNED_GROUP", None)
 LOGGED_IN_HAS_PERM = getattr(settings, "USERS_LOGGED_IN_HAS_PERM", False)
+
+
+def object_key(obj):
+    return (ContentType.objects.get_for_model(obj).id, unicode(obj.pk))
+
+
+class ObjectPermissionIndex(object):
+    """
+    The set of (content type id, object pk) pairs that have any object
+    permissions set on them.  Almost no objects do, so keeping the whole
+    set in memory saves us from asking the database about every object.
+
+    Changes are picked up through a generation counter kept in the shared
+    cache, which is bumped whenever object permissions change, and again
+    once the change is committed.
+    """
+    generation_key = 'users_object_permissions_generation'
+    # Keep the generation for as long as the cache allows.
+    cache_time = 60 * 60 * 24 * 30
+
+    def __init__(self):
+        self.generation = None
+        self.local_generation = 0
+        self.objects = None
+
+    def _new_generation(self):
+        # An integer, so it can be bumped with cache.incr(), that differs
+        # from any generation handed out before the key went missing.
+        return int(time.time() * 1000)
+
+    def _shared_generation(self):
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, self._new_generation(),
+                      self.cache_time)
+            generation = cache.get(self.generation_key)
+        return generation
+
+    def refresh(self):
+        """
+        Reloads the set if the object permissions have changed.
+
+        Returns:
+            A value that changes whenever the set is reloaded.
+        """
+        generation = self._shared_generation()
+        if self.objects is None or generation != self.generation:
+            objects = set()
+            for model in (UserObjectPermission, GroupObjectPermission):
+                objects.update(model.objects.values_list(
+                    'content_type', 'object_pk').distinct())
+            self.objects = set([(ct, unicode(pk)) for ct, pk in objects])
+            self.generation = generation
+            self.local_generation += 1
+        return self.local_generation
+
+    def __contains__(self, key):
+        if self.objects is None:
+            self.refresh()
+        return key in self.objects
+
+    def invalidate(self):
+        try:
+            cache.incr(self.generation_key)
+        except (ValueError, TypeError):
+            # Not set yet (or evicted), or left over from when it wasn't
+            # a number.
+            cache.set(self.generation_key, self._new_generation(),
+                      self.cache_time)
+        # The cache may not be shared, so always reset our own state.
+        self.objects = None
+        self.local_generation += 1
+
+object_permissions = ObjectPermissionIndex()
+
+
+def _object_permissions_changed(sender, **kwargs):
+    repeat_on_commit(object_permissions.invalidate)
+
+for model in (UserObjectPermission, GroupObjectPermission):
+    post_save.connect(_object_permissions_changed, sender=model)
+    post_delete.connect(_object_permissions_changed, sender=model)
+
+
+def _groups_changed(sender, instance, **kwargs):
+    # Group membership decides whether a user is banned, so forget what
+    # we've memoized about this user.
+    if hasattr(instance, '_restrictive_perm_cache'):
+        del instance._restrictive_perm_cache
+
+m2m_changed.connect(_groups_changed, sender=User.groups.through)
@@ -58,3 +58,4 @@ class UserProfile(models.Model):
 # For registration calls
 import signals
 import api
+import backends
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_backends
+
+
+def get_perms_for_objects(user, perm, objects):
+    """
+    Checks whether `user` has the permission `perm` on each of `objects`.
+
+    Authentication backends that provide a get_perms_for_objects() method
+    (like RestrictiveBackend) are asked to do this in bulk.  Otherwise
+    we fall back to calling has_perm() on each object.
+
+    Args:
+        user: A User or AnonymousUser.
+        perm: A permission string, e.g. 'pages.change_page'.
+        objects: An iterable of model instances.
+
+    Returns:
+        A dictionary mapping the pk of each object to True or False.
+    """
+    objects = list(objects)
+    if not objects:
+        return {}
+    for backend in get_backends():
+        if not (hasattr(backend, 'get_perms_for_objects') and
+                getattr(backend, 'supports_object_permissions', False)):
+            continue
+        if (not user.is_authenticated() and
+                not getattr(backend, 'supports_anonymous_user', False)):
+            continue
+        return backend.get_perms_for_objects(user, perm, objects)
+    return dict((obj.pk, user.has_perm(perm, obj)) for obj in objects)
+
+
+def objects_with_perm(user, perm, objects):
+    """
+    Returns:
+        A set of the pks of the objects in `objects` that `user` has the
+        permission `perm` on.
+    """
+    perms = get_perms_for_objects(user, perm, objects)
+    return set([pk for pk, has_perm in perms.items() if has_perm])
@@ -1,11 +1,16 @@
 from django.test import TestCase
 from django.conf import settings
+from django.core.cache import get_cache
 
 from utils import TestSettingsManager
 from models import *
 from django.contrib.auth.models import User, Permission, Group
+from django.contrib.auth.models import AnonymousUser
 from guardian.shortcuts import assign
 
+from users.shortcuts import get_perms_for_objects
+from users import backends
+
 mgr = TestSettingsManager()
 INSTALLED_APPS = list(settings.INSTALLED_APPS)
 INSTALLED_APPS.append('users.tests')
@@ -110,3 +115,84 @@ class RestrictiveBackendTest(TestCase):
         self.assertTrue(self.user.has_perm('tests.change_thing', t))
         self.assertFalse(self.user.has_perm('tests.add_thing', t))
         self.assertFalse(self.user.has_perm('tests.delete_thing', t))
+
+    def test_repeated_checks_memoized(self):
+        t = Thing(name='Test thing')
+        t.save()
+        assign('change_thing', self.user, t)
+        self.assertTrue(self.user.has_perm('tests.change_thing', t))
+        self.assertFalse(self.user.has_perm('tests.delete_thing', t))
+        self.assertNumQueries(0, self.user.has_perm, 'tests.change_thing', t)
+        self.assertNumQueries(0, self.user.has_perm, 'tests.delete_thing', t)
+
+        # Changing object permissions is picked up right away.
+        assign('delete_thing', self.user, t)
+        self.assertTrue(self.user.has_perm('tests.delete_thing', t))
+
+    def test_shared_generation(self):
+        old_cache = backends.cache
+        backends.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            t = Thing(name='Test thing')
+            t.save()
+            self.assertFalse(backends.object_key(t) in
+                             backends.object_permissions)
+            key = backends.object_permissions.generation_key
+            generation = backends.cache.get(key)
+            assign('change_thing', self.user, t)
+            self.assertTrue(backends.cache.get(key) > generation)
+            self.assertTrue(backends.object_key(t) in
+                            backends.object_permissions)
+        finally:
+            backends.cache = old_cache
+
+    def test_anonymous_user_memoized(self):
+        anon = AnonymousUser()
+        anon.has_perm('tests.change_thing')
+        self.assertNumQueries(0, anon.has_perm, 'tests.change_thing')
+
+    def test_object_permissions_keyed_by_model(self):
+        t = Thing(name='Test thing')
+        t.save()
+        perm = Permission.objects.get(codename="change_thing")
+        self.user.user_permissions.add(perm)
+        self.user.save()
+        # An object permission on a different kind of object with the
+        # same primary key shouldn't restrict this one.
+        other = Group(pk=t.pk, name='Other group')
+        assign('change_group', self.user, other)
+        self.assertTrue(self.user.has_perm('tests.change_thing', t))
+
+    def test_get_perms_for_objects(self):
+        things = [Thing(name='Thing %d' % i) for i in range(4)]
+        for t in things:
+            t.save()
+        perm = Permission.objects.get(codename="change_thing")
+        self.user.user_permissions.add(perm)
+        self.user.save()
+        # Restrict the first two things to the user and their group.
+        other = User.objects.create(username='Other', email='o@blah.com')
+        assign('change_thing', other, things[0])
+        assign('change_thing', other, things[1])
+        assign('change_thing', self.group, things[1])
+
+        perms = get_perms_for_objects(self.user, 'tests.change_thing', things)
+        self.assertEqual(perms, {things[0].pk: False, things[1].pk: True,
+                                 things[2].pk: True, things[3].pk: True})
+        for t in things:
+            self.assertEqual(self.user.has_perm('tests.change_thing', t),
+                             perms[t.pk])
+
+    def test_get_perms_for_objects_queries(self):
+        things = [Thing(name='Thing %d' % i) for i in range(10)]
+        for t in things:
+            t.save()
+            assign('change_thing', self.user, t)
+        user = User.objects.get(pk=self.user.pk)
+        user.has_perm('tests.change_thing')
+        # One query for the user's object permissions and one for their
+        # groups', no matter how many objects.
+        self.assertNumQueries(2, get_perms_for_objects, user,
+                              'tests.change_thing', things)
+
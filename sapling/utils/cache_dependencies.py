@@ -0,0 +1,249 @@
+"""
+Dependency tracking for the full-page cache.
+
+While a response is being generated, views and template tags call
+record_dependency() with a key for each thing that went into it -- the
+page being shown, pages it includes or links to, tags it lists, and so
+on.  The cache middleware stores the current version of each of those
+keys alongside the cached response.  When something changes we call
+invalidate() with its key, which bumps the version, and every cached
+response that depended on it is thrown away the next time it's fetched.
+
+Because versions are bumped rather than cache entries being found and
+deleted, there's no shared index to keep up to date and no race between
+two requests adding to one.  Versions are bumped again once the change
+is committed, so a response generated from the old rows in the meantime
+isn't kept.
+
+We take note of each dependency's version when it's first recorded and
+only store a response if none of them have changed by the time it's
+done.  Versions are only ever compared for equality: they're written by
+different servers, whose clocks needn't agree.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from transactions import repeat_on_commit
+
+cache = get_cache(settings.CACHE_MIDDLEWARE_ALIAS)
+# Versions need to outlive every response that depends on them.
+VERSION_CACHE_TIME = 60 * 60 * 24 * 30
+
+_state = threading.local()
+
+
+def page_dependency(slug):
+    """
+    Key for everything shown as part of the page with slug `slug`: the
+    page itself, whether it exists, its files, map and tags.
+    """
+    return u'page:%s' % slug
+
+
+def tag_dependency(slug):
+    """
+    Key for the list of pages tagged with the tag with slug `slug`.
+    """
+    return u'tag:%s' % slug
+
+
+def thumbnail_dependency(name, geometry):
+    """
+    Key for the `geometry` thumbnail of the image file with storage name
+    `name`.  Pages showing the original while the thumbnail's being made
+    depend on it.
+    """
+    return u'thumbnail:%s:%s' % (name, geometry)
+
+
+def _version_key(dependency):
+    if isinstance(dependency, unicode):
+        dependency = dependency.encode('utf-8')
+    return 'cachedep:%s' % hashlib.md5(dependency).hexdigest()
+
+
+def new_version():
+    return '%f' % time.time()
+
+
+def start_recording():
+    _state.dependencies = set()
+    _state.versions = {}
+
+
+def stop_recording():
+    """
+    Returns:
+        A tuple of the set of dependencies recorded since
+        start_recording() was called and a dictionary of their versions
+        as they were when each was recorded, to pass to is_current().
+    """
+    dependencies = getattr(_state, 'dependencies', None) or set()
+    versions = getattr(_state, 'versions', None) or {}
+    _state.dependencies = None
+    _state.versions = None
+    return dependencies, versions
+
+
+def _snapshot(dependencies):
+    """
+    Returns:
+        A dictionary of the current versions of `dependencies`, giving
+        those that don't have one yet a version of their own.
+    """
+    keys = [_version_key(d) for d in dependencies]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            initial = new_version()
+            if cache.add(key, initial, VERSION_CACHE_TIME):
+                versions[key] = initial
+            else:
+                # Someone else just set it.
+                versions[key] = cache.get(key)
+    return versions
+
+
+def _record(dependencies, versions):
+    recorded = getattr(_state, 'dependencies', None)
+    if recorded is None:
+        return
+    recorded.update(dependencies)
+    for key, version in versions.iteritems():
+        _state.versions.setdefault(key, version)
+
+
+def record_dependency(*dependencies):
+    """
+    Notes that the response currently being generated depends on
+    `dependencies`.  Does nothing when we're not recording.
+    """
+    recorded = getattr(_state, 'dependencies', None)
+    if recorded is None:
+        return
+    new = [d for d in dependencies if d not in recorded]
+    if new:
+        _record(new, _snapshot(new))
+
+
+def invalidate(*dependencies):
+    """
+    Marks every cached response that depends on any of `dependencies` as
+    stale.
+    """
+    if not dependencies:
+        return
+
+    def bump():
+        version = new_version()
+        cache.set_many(dict((_version_key(d), version)
+                            for d in dependencies), VERSION_CACHE_TIME)
+    repeat_on_commit(bump)
+
+
+def is_current(versions):
+    """
+    Returns:
+        True if none of the dependencies recorded in `versions` have
+        changed.
+    """
+    current = cache.get_many(versions.keys())
+    for key, version in versions.iteritems():
+        if current.get(key) != version:
+            return False
+    return True
+
+
+def recorded_dependencies():
+    """
+    Returns:
+        A copy of the dependencies recorded so far for the response
+        currently being generated, or None if we're not recording.
+    """
+    dependencies = getattr(_state, 'dependencies', None)
+    if dependencies is None:
+        return None
+    return set(dependencies)
+
+
+def _dependency_set_key(name):
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return 'cachedepset:%s' % hashlib.md5(name).hexdigest()
+
+
+def remember_dependencies(name, dependencies):
+    """
+    Stores `dependencies` under `name` (e.g. a URL) so we can later tell
+    whether anything that went into it has changed without regenerating
+    it.  See stored_versions().
+    """
+    dependencies = list(dependencies)
+    keys = [_version_key(d) for d in dependencies]
+    existing = cache.get_many(keys)
+    for key in keys:
+        if key not in existing:
+            cache.add(key, new_version(), VERSION_CACHE_TIME)
+    cache.set(_dependency_set_key(name), dependencies, VERSION_CACHE_TIME)
+
+
+def stored_versions(name):
+    """
+    Returns:
+        A dictionary of the current versions of the dependencies stored
+        under `name` with remember_dependencies(), or None if we don't
+        know them.
+    """
+    dependencies = cache.get(_dependency_set_key(name))
+    if dependencies is None:
+        return None
+    keys = [_version_key(d) for d in dependencies]
+    versions = cache.get_many(keys)
+    if len(versions) != len(keys):
+        return None
+    return versions
+
+
+def render_cached(key, render, unless_depends_on=()):
+    """
+    Returns render()'s output, cached under `key` along with the
+    dependencies recorded while rendering it, until one of them changes.
+    The dependencies are recorded for the response being generated
+    whether or not the output came from the cache.
+
+    Args:
+        key: The cache key for the output.
+        render: A function returning the output.
+        unless_depends_on: Dependencies that make the output specific to
+            this render, e.g. the pages an included page is being included
+            from.  Output that depends on any of them isn't cached, or
+            taken from the cache.
+    """
+    unless_depends_on = set(unless_depends_on)
+    cached = cache.get(key)
+    if cached is not None:
+        output, dependencies, versions = cached
+        if (not unless_depends_on.intersection(dependencies) and
+                is_current(versions)):
+            _record(dependencies, versions)
+            return output
+
+    outer = (getattr(_state, 'dependencies', None),
+             getattr(_state, 'versions', None))
+    _state.dependencies, _state.versions = set(), {}
+    try:
+        output = render()
+        dependencies, versions = _state.dependencies, _state.versions
+    finally:
+        _state.dependencies, _state.versions = outer
+    _record(dependencies, versions)
+
+    if (dependencies and not unless_depends_on.intersection(dependencies)
+            and is_current(versions)):
+        cache.set(key, (output, list(dependencies), versions),
+                  VERSION_CACHE_TIME)
+    return output
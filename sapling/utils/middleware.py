@@ -1,17 +1,30 @@
 from django.middleware.cache import UpdateCacheMiddleware
+from django.middleware.cache import FetchFromCacheMiddleware as \
+    DjangoFetchFromCacheMiddleware
 from django.core.exceptions import MiddlewareNotUsed
 from django.conf import settings
 from django.utils.importlib import import_module
 from django.utils.cache import learn_cache_key, get_max_age
 
+import cache_dependencies
+
 
 class UpdateCacheMiddlewareNoHeaders(UpdateCacheMiddleware):
     """
     Just like UpdateCacheMiddleware but we don't set cache headers in the
     HTTP response.
+
+    If the response recorded its dependencies (see utils.cache_dependencies)
+    we store their versions with it and cache it for
+    CACHE_MIDDLEWARE_TRACKED_SECONDS, as it'll be thrown away as soon as any
+    of them change.
     """
+    def process_request(self, request):
+        cache_dependencies.start_recording()
+
     def process_response(self, request, response):
         """Sets the cache, if needed."""
+        dependencies, versions = cache_dependencies.stop_recording()
         if not self._should_update_cache(request, response):
             # We don't need to update the cache, just return.
             return response
@@ -23,6 +36,9 @@ class UpdateCacheMiddlewareNoHeaders(UpdateCacheMiddleware):
         timeout = get_max_age(response)
         if timeout == None:
             timeout = self.cache_timeout
+            if dependencies:
+                timeout = getattr(settings,
+                    'CACHE_MIDDLEWARE_TRACKED_SECONDS', timeout)
         elif timeout == 0:
             # max-age was set to 0, don't bother caching.
             return response
@@ -30,12 +46,19 @@ class UpdateCacheMiddlewareNoHeaders(UpdateCacheMiddleware):
         if timeout:
             cache_key = learn_cache_key(
                 request, response, timeout, self.key_prefix, cache=self.cache)
+
+            def _set_cache(r):
+                if dependencies:
+                    if not cache_dependencies.is_current(versions):
+                        # Something changed while we were rendering.
+                        return
+                    r._cache_dependencies = versions
+                self.cache.set(cache_key, r, timeout)
+
             if hasattr(response, 'render') and callable(response.render):
-                response.add_post_render_callback(
-                    lambda r: self.cache.set(cache_key, r, timeout)
-                )
+                response.add_post_render_callback(_set_cache)
             else:
-                self.cache.set(cache_key, response, timeout)
+                _set_cache(response)
         return response
 
 
@@ -66,6 +89,21 @@ class UpdateCacheMiddleware(UpdateCacheMiddlewareNoEdit, UpdateCacheMiddlewareNo
     pass
 
 
+class FetchFromCacheMiddleware(DjangoFetchFromCacheMiddleware):
+    """
+    Just like Django's FetchFromCacheMiddleware but treats cached responses
+    whose dependencies have changed since they were cached as missing.
+    """
+    def process_request(self, request):
+        response = super(FetchFromCacheMiddleware, self).process_request(
+            request)
+        versions = getattr(response, '_cache_dependencies', None)
+        if versions and not cache_dependencies.is_current(versions):
+            request._cache_update_cache = True
+            return None
+        return response
+
+
 class TrackPOSTMiddleware(object):
     def process_request(self, request):
         if request.method == 'POST' and 'has_POSTed' not in request.session:
@@ -0,0 +1,191 @@
+"""
+Serving stored files.
+
+How files are handed out is set by FILE_SERVE_METHOD:
+
+    'redirect'  Redirect to the file's URL and let whatever serves
+                MEDIA_URL deliver it.  This is the default.
+    'sendfile'  Hand the file over to the front-end web server with the
+                SENDFILE_HEADER header, e.g. X-Sendfile for Apache's
+                mod_xsendfile or lighttpd, or X-Accel-Redirect for nginx.
+    'direct'    Send the file from Django, answering byte range and
+                conditional requests.  Handy when there's no front-end
+                server that can do better.
+
+For X-Sendfile the header holds the file's path on disk.  Servers that
+want a URL instead, like nginx, should set SENDFILE_URL to the internal
+URL that MEDIA_ROOT is served at, e.g. '/protected-media/'.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import urllib
+
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         HttpResponseRedirect)
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+FILE_SERVE_METHOD = getattr(settings, 'FILE_SERVE_METHOD', 'redirect')
+SENDFILE_HEADER = getattr(settings, 'SENDFILE_HEADER', 'X-Sendfile')
+SENDFILE_URL = getattr(settings, 'SENDFILE_URL', None)
+CHUNK_SIZE = 64 * 1024
+
+_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def serve_stored_file(request, field_file, name=None):
+    """
+    Returns:
+        A response delivering `field_file`, a file from a FileField,
+        using FILE_SERVE_METHOD.
+
+    Args:
+        request: The HttpRequest.
+        field_file: The FieldFile to deliver.
+        name: Optional file name used to pick the content type.  Defaults
+            to the stored file's name.
+    """
+    if FILE_SERVE_METHOD == 'redirect':
+        return HttpResponseRedirect(field_file.url)
+    return serve_path(request, field_file.path, name or field_file.name,
+                      relative_name=field_file.name)
+
+
+def serve(request, path, document_root):
+    """
+    A stand-in for django.views.static.serve that delivers files using
+    FILE_SERVE_METHOD.
+    """
+    path = posixpath.normpath(urllib.unquote(path)).lstrip('/')
+    if [p for p in path.split('/') if p in ('', '.', '..')]:
+        raise Http404
+    return serve_path(request, os.path.join(document_root, path), path,
+                      relative_name=path)
+
+
+def _sendfile_value(full_path, relative_name):
+    if SENDFILE_URL is None:
+        return full_path
+    return SENDFILE_URL + urllib.quote(relative_name.encode('utf-8'))
+
+
+def serve_path(request, full_path, name, relative_name=None):
+    """
+    Returns:
+        A response delivering the file at `full_path`.  `relative_name`
+        is its path below MEDIA_ROOT, used for SENDFILE_URL.
+    """
+    if not os.path.isfile(full_path):
+        raise Http404
+    # Keep file responses out of the page cache.
+    request._cache_update_cache = False
+    content_type = (mimetypes.guess_type(name)[0] or
+                    'application/octet-stream')
+
+    if FILE_SERVE_METHOD == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response[SENDFILE_HEADER] = _sendfile_value(
+            full_path, relative_name or name)
+        return response
+
+    stat = os.stat(full_path)
+    size, mtime = stat.st_size, int(stat.st_mtime)
+    etag = '%x-%x' % (mtime, size)
+    headers = {
+        'Last-Modified': http_date(mtime),
+        'ETag': '"%s"' % etag,
+        'Accept-Ranges': 'bytes',
+    }
+    if _not_modified(request, etag, mtime):
+        response = HttpResponseNotModified()
+    else:
+        byte_range = _requested_range(request, etag, mtime, size)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+        elif byte_range:
+            start, end = byte_range
+            response = _file_response(request, full_path, content_type,
+                                      start, end - start + 1)
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        else:
+            response = _file_response(request, full_path, content_type,
+                                      0, size)
+    for k, v in headers.items():
+        response[k] = v
+    return response
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return bool(if_modified_since) and mtime <= if_modified_since
+
+
+def _requested_range(request, etag, mtime, size):
+    """
+    Returns:
+        (first byte, last byte) of the single byte range asked for, None
+        to send the whole file, or 'unsatisfiable'.  We don't handle
+        multiple ranges, so we send the whole file for those.
+    """
+    match = _range.match(request.META.get('HTTP_RANGE', '').replace(' ', ''))
+    if not match or request.method not in ('GET', 'HEAD'):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        # Only send part of the file if it hasn't changed.
+        if if_range.startswith('W/'):
+            return None
+        if if_range.startswith('"'):
+            if parse_etags(if_range) != [etag]:
+                return None
+        elif parse_http_date_safe(if_range) != mtime:
+            return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The final `last` bytes.
+        length = int(last)
+        if not length:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = int(last) if last else size - 1
+    if first >= size:
+        return 'unsatisfiable'
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+def _read_range(full_path, start, length):
+    f = open(full_path, 'rb')
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _file_response(request, full_path, content_type, start, length):
+    if request.method == 'HEAD':
+        content = ''
+    else:
+        content = _read_range(full_path, start, length)
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Length'] = str(length)
+    return response
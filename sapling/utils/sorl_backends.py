@@ -1,5 +1,7 @@
-from sorl.thumbnail.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings, defaults as default_settings
 from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
 
 
 FORMAT_DICT = {
@@ -14,10 +16,57 @@ class AutoFormatBackend(ThumbnailBackend):
         """
         Sets the format option (if not explicitly set) to the same format as
         the original file.
+
+        With the extra option background=1 the thumbnail is never made
+        here.  If it's not ready yet it's queued to be made in the
+        background and the original image is returned instead.  The
+        response then depends on the thumbnail, so it isn't cached past
+        the thumbnail being made.
         """
+        background = options.pop('background', False)
+        self.set_format(file_, options)
+
+        from utils import thumbnails
+        if background and thumbnails.PROCESSES:
+            thumbnail = self.get_cached_thumbnail(file_, geometry_string,
+                                                  **options)
+            if thumbnail is not None:
+                return thumbnail
+            from utils.cache_dependencies import (record_dependency,
+                thumbnail_dependency)
+            record_dependency(thumbnail_dependency(unicode(file_),
+                                                   geometry_string))
+            # In case it was made before we started depending on it.
+            thumbnail = self.get_cached_thumbnail(file_, geometry_string,
+                                                  **options)
+            if thumbnail is not None:
+                return thumbnail
+            thumbnails.queue_thumbnail(file_, geometry_string)
+            return ImageFile(file_)
+
+        return super(AutoFormatBackend, self).get_thumbnail(
+            file_, geometry_string, **options)
+
+    def set_format(self, file_, options):
         if not options.get('format'):
             ext = str(file_).split('.')[-1].lower()
             options['format'] = FORMAT_DICT.get(ext, settings.THUMBNAIL_FORMAT)
 
-        return super(AutoFormatBackend, self).get_thumbnail(
-            file_, geometry_string, **options)
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """
+        Returns:
+            The thumbnail from the key-value store, or None if it hasn't
+            been made.  The options are filled in the same way as
+            get_thumbnail() does, so we look for the same thumbnail it
+            would make.
+        """
+        self.set_format(file_, options)
+        source = ImageFile(file_)
+        for key, value in self.default_options.iteritems():
+            options.setdefault(key, value)
+        for key, attr in getattr(self, 'extra_options', ()):
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
@@ -0,0 +1,121 @@
+"""
+Content-addressed file storage.
+
+Files are named after the SHA-1 hash of their contents and kept in nested
+directories made from the start of the hash, e.g.
+
+    pages/files/3f/a1/3fa1...9c.jpg
+
+so that no single directory gets too big, and so that uploading the same
+file again -- to another page, or as a new version of a file -- doesn't
+store another copy.  The hash is worked out as the upload is written.
+
+Because a stored file may be shared by any number of objects and
+historical versions, files are never deleted through this storage.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+# The number of directory levels, and the number of hash characters in
+# each level's name.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+_hashed_name = re.compile(r'^(?:[0-9a-f]{%d}/){%d}[0-9a-f]{40}(\.\w+)?$' %
+                          (SHARD_WIDTH, SHARD_LEVELS))
+
+
+def hashed_name(digest, name):
+    """
+    Returns:
+        The storage name of the file with SHA-1 hex digest `digest`, which
+        was uploaded with the name `name`.  The file goes in the same
+        directory `name` would have, and keeps its extension so it's
+        served with the right content type.
+    """
+    directory = os.path.dirname(name)
+    ext = os.path.splitext(name)[1].lower()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+              for i in range(SHARD_LEVELS)]
+    return os.path.join(directory, *(shards + [digest + ext]))
+
+
+def is_hashed_name(name):
+    """
+    Returns:
+        True if `name` is already a content-addressed storage name.
+    """
+    path = name.replace('\\', '/').split('/')
+    return bool(_hashed_name.match('/'.join(path[-(SHARD_LEVELS + 1):])))
+
+
+class ContentAddressedFileSystemStorage(FileSystemStorage):
+    def get_available_name(self, name):
+        # The name is decided by the contents in _save(), and a file with
+        # the same name is the same file.
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # A FieldFile hides the uploaded file it wraps.
+        upload = getattr(content, 'file', content)
+        digest = hashlib.sha1()
+        if hasattr(upload, 'temporary_file_path'):
+            # The upload is already on disk, so we move it rather than
+            # writing it out again.  utils.uploadhandler hashes uploads
+            # as they arrive; otherwise we read it for the hash.
+            if getattr(upload, 'sha1', None):
+                hexdigest = upload.sha1
+            else:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                hexdigest = digest.hexdigest()
+            tmp_path = upload.temporary_file_path()
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload')
+            try:
+                f = os.fdopen(fd, 'wb')
+                try:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        f.write(chunk)
+                finally:
+                    f.close()
+            except:
+                os.remove(tmp_path)
+                raise
+            hexdigest = digest.hexdigest()
+
+        name = hashed_name(hexdigest, name)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # We already have it.
+            if not hasattr(upload, 'temporary_file_path'):
+                os.remove(tmp_path)
+            return name
+
+        full_directory = os.path.dirname(full_path)
+        if not os.path.exists(full_directory):
+            try:
+                os.makedirs(full_directory)
+            except OSError:
+                # Made by someone else in the meantime.
+                if not os.path.isdir(full_directory):
+                    raise
+        file_move_safe(tmp_path, full_path, allow_overwrite=True)
+        # Our temporary files are only readable by us.
+        os.chmod(full_path, settings.FILE_UPLOAD_PERMISSIONS or 0644)
+        return name
+
+    def delete(self, name):
+        # Other objects, or versions of objects, may be using this file.
+        pass
@@ -0,0 +1,108 @@
+"""
+Making thumbnails outside of the request that shows them.
+
+Resizing an image with PIL takes long enough that a page with a few
+dozen freshly-resized images can hold up a request for a long time.
+queue_thumbnail() hands thumbnails to a small pool of local worker
+processes instead.  The workers go through sorl's usual get_thumbnail(),
+so the thumbnails end up in sorl's storage and key-value store exactly
+as if a template had made them.
+
+Pages rendered while a thumbnail is being made show the original image
+and depend on the thumbnail (see utils.cache_dependencies), so they're
+thrown out of the cache once it's been made.
+
+The number of worker processes is set by THUMBNAIL_WORKER_PROCESSES.
+With 0 the thumbnails are made right away, in the calling process.
+"""
+import logging
+import multiprocessing
+
+from django.conf import settings
+
+import cache_dependencies
+from workers import init_worker
+
+PROCESSES = getattr(settings, 'THUMBNAIL_WORKER_PROCESSES', 2)
+# Thumbnails waiting to be made past this are dropped.  They'll be asked
+# for again the next time the file or page is saved, or by the
+# make_thumbnails command.
+MAX_QUEUED = 1000
+
+_pool = None
+_queued = set()
+# Thumbnails made since the last wait().
+_made = 0
+
+
+def make_thumbnail(name, geometry):
+    """
+    Returns:
+        A tuple of (`name`, `geometry`) and whether the thumbnail was
+        made.
+    """
+    from sorl.thumbnail import get_thumbnail
+
+    try:
+        get_thumbnail(name, geometry)
+    except Exception:
+        # e.g. the file isn't an image or has gone away.
+        logging.exception('Unable to make a %s thumbnail of %s' %
+                          (geometry, name))
+        return (name, geometry), False
+    cache_dependencies.invalidate(
+        cache_dependencies.thumbnail_dependency(name, geometry))
+    return (name, geometry), True
+
+
+def _done(result):
+    global _made
+    key, made = result
+    _queued.discard(key)
+    if made:
+        _made += 1
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(PROCESSES, initializer=init_worker)
+    return _pool
+
+
+def queue_thumbnail(name, geometry):
+    """
+    Makes the `geometry` thumbnail of the image file with storage name
+    `name` in the background.  Does nothing if it's already waiting to
+    be made.
+
+    Returns:
+        True if the thumbnail was queued, or made right away.
+    """
+    name = unicode(name)
+    key = (name, geometry)
+    if not PROCESSES:
+        _done(make_thumbnail(name, geometry))
+        return True
+    if key in _queued or len(_queued) >= MAX_QUEUED:
+        return False
+    _queued.add(key)
+    get_pool().apply_async(make_thumbnail, (name, geometry), callback=_done)
+    return True
+
+
+def wait():
+    """
+    Waits for all of the queued thumbnails to be made.
+
+    Returns:
+        The number of thumbnails made since the last call.
+    """
+    global _pool, _made
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+        _queued.clear()
+    made, _made = _made, 0
+    return made
@@ -0,0 +1,93 @@
+"""
+Running code once the current transaction has been committed.
+
+Cache invalidation that happens as soon as something is saved, inside a
+transaction, comes too early: a request that starts before the
+transaction is committed still reads the old rows, but sees the new
+cache version and can cache what it read under it.  repeat_on_commit()
+invalidates right away and again once the change is committed.
+
+Django 1.3 has no way to hook into a commit, so the functions waiting
+for one are run by CommitHooksMiddleware, which sits outside of
+TransactionMiddleware, and when a block wrapped in our
+commit_on_success() finishes.  Outside of a managed transaction every
+save is committed straight away, so there's nothing to wait for.
+"""
+import threading
+from functools import wraps
+
+from django.db import transaction
+
+_state = threading.local()
+
+
+def _pending():
+    if getattr(_state, 'pending', None) is None:
+        _state.pending = []
+    return _state.pending
+
+
+def on_commit(func):
+    """
+    Calls `func` once the current transaction is committed, or now if
+    we're not in a managed transaction.
+    """
+    if not transaction.is_managed():
+        func()
+        return
+    _pending().append(func)
+
+
+def repeat_on_commit(func):
+    """
+    Calls `func` now, and again once the current transaction is committed
+    if we're in a managed transaction.
+    """
+    func()
+    if transaction.is_managed():
+        _pending().append(func)
+
+
+def run_pending():
+    """
+    Calls the functions waiting for a commit.
+    """
+    pending = _pending()
+    while pending:
+        pending.pop(0)()
+
+
+def discard_pending():
+    _state.pending = None
+
+
+def commit_on_success(func):
+    """
+    Like django.db.transaction.commit_on_success, but also runs the
+    functions waiting for the commit once it's done.
+    """
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        try:
+            result = transaction.commit_on_success(func)(*args, **kwargs)
+        except:
+            # Rolled back, so there's nothing to wait for.
+            discard_pending()
+            raise
+        run_pending()
+        return result
+    return wrapped
+
+
+class CommitHooksMiddleware(object):
+    """
+    Runs the functions waiting for a commit once TransactionMiddleware has
+    committed the request's changes.  Must come before
+    TransactionMiddleware in MIDDLEWARE_CLASSES.
+    """
+    def process_request(self, request):
+        discard_pending()
+
+    def process_response(self, request, response):
+        run_pending()
+        return response
@@ -0,0 +1,69 @@
+"""
+An upload handler that hashes and sniffs uploads as they arrive.
+
+Uploads are streamed to a temporary file, as with Django's
+TemporaryFileUploadHandler, but we also work out the SHA-1 of the file
+and guess its type from its first few bytes along the way.  The
+uploaded file gets:
+
+    sha1            The hex digest of its contents.  Our content-addressed
+                    storage (see utils/storage.py) uses this rather than
+                    reading the file again.
+    sniffed_type    The mime type its contents look like, or None.
+    sniffed_ext     The usual extension for sniffed_type, or None.
+
+Set FILE_UPLOAD_TEMP_DIR to a directory on the same disk as MEDIA_ROOT so
+that the finished upload is moved into place rather than copied.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# (offset, magic bytes, mime type, extension)
+MAGIC = [
+    (0, '\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (0, '\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (0, 'GIF87a', 'image/gif', 'gif'),
+    (0, 'GIF89a', 'image/gif', 'gif'),
+    (0, '%PDF-', 'application/pdf', 'pdf'),
+    (0, 'ID3', 'audio/mpeg', 'mp3'),
+    (0, 'OggS', 'audio/ogg', 'ogg'),
+    (0, 'fLaC', 'audio/flac', 'flac'),
+    (8, 'WAVE', 'audio/x-wav', 'wav'),
+    (8, 'AVI ', 'video/x-msvideo', 'avi'),
+    (4, 'ftyp', 'video/mp4', 'mp4'),
+    (0, '\x1aE\xdf\xa3', 'video/webm', 'webm'),
+]
+SNIFF_BYTES = 16
+
+
+def sniff(head):
+    """
+    Returns:
+        (mime type, extension) for the file starting with the bytes
+        `head`, or (None, None) if we don't recognize it.
+    """
+    for offset, magic, mime_type, ext in MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return mime_type, ext
+    return None, None
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super(HashingUploadHandler, self).new_file(*args, **kwargs)
+        self.digest = hashlib.sha1()
+        self.head = ''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+        return super(HashingUploadHandler, self).receive_data_chunk(
+            raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super(HashingUploadHandler, self).file_complete(file_size)
+        uploaded.sha1 = self.digest.hexdigest()
+        uploaded.sniffed_type, uploaded.sniffed_ext = sniff(self.head)
+        return uploaded
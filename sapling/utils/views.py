@@ -1,11 +1,19 @@
+import time
+import hashlib
+from datetime import datetime
+
 from django.utils.decorators import classonlymethod
 from django.http import HttpResponse, Http404, HttpResponseForbidden
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
 from django.utils import simplejson as json
 from django.views.generic import View
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import render_to_string
 from django.template.context import RequestContext
 
+import cache_dependencies
+
 
 class ForbiddenException:
     pass
@@ -129,3 +137,120 @@ class PermissionRequiredMixin(object):
                 return HttpResponseForbidden(html)
         return super(PermissionRequiredMixin, self).dispatch(request, *args,
                                                         **kwargs)
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Returns:
+        True if the client's copy, as described by the request's
+        If-None-Match or If-Modified-Since header, is still current.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # We only hand out weak ETags, which are fine for GET requests.
+        etags = [e[2:] if e.startswith('W/') else e
+                 for e in [e.strip() for e in if_none_match.split(',')]]
+        etags = parse_etags(', '.join(etags))
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_modified_since and last_modified:
+        return int(time.mktime(last_modified.timetuple())) <= if_modified_since
+    return False
+
+
+def conditional_response(request, last_modified, etag_parts, get_response):
+    """
+    Answers a conditional GET without generating the response if the
+    client's copy is current.  Otherwise calls get_response() and adds
+    Last-Modified and ETag headers to what it returns.
+
+    Args:
+        request: The HttpRequest.
+        last_modified: A datetime, the last time the content changed.
+        etag_parts: A list of things the content depends on, or None if
+            we don't know.  The ETag is made from these, the last modified
+            date and the user, as pages look different for each user.
+        get_response: A function returning the full response.
+    """
+    if (request.method not in ('GET', 'HEAD') or last_modified is None or
+            etag_parts is None):
+        return get_response()
+    user = getattr(request, 'user', None)
+    user_key = user and user.is_authenticated() and user.pk or ''
+    etag = hashlib.md5(repr([last_modified.isoformat(), user_key] +
+                            sorted(etag_parts))).hexdigest()
+    headers = {
+        'Last-Modified': http_date(time.mktime(last_modified.timetuple())),
+        'ETag': 'W/"%s"' % etag,
+    }
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+    for k, v in headers.items():
+        response[k] = v
+    return response
+
+
+class ConditionalGetMixin(object):
+    """
+    View mixin that adds Last-Modified and ETag headers to GET responses
+    and answers conditional GETs with a 304, skipping rendering entirely.
+
+    Override get_last_modified().  If the response also depends on other
+    things recorded with utils.cache_dependencies (for instance, whether
+    linked pages exist), set track_dependencies = True.  We then remember
+    what each response depended on and only hand out validators once we
+    know.  The last change to any of them counts as a modification, so
+    clients that only send If-Modified-Since see it too.
+    """
+    track_dependencies = False
+
+    def get_last_modified(self):
+        """
+        Returns:
+            A datetime, the last time the content changed, or None.
+        """
+        return None
+
+    def get_etag_parts(self):
+        if not self.track_dependencies:
+            return []
+        versions = cache_dependencies.stored_versions(self.request.path)
+        if versions is None:
+            return None
+        return versions.items()
+
+    def dispatch(self, request, *args, **kwargs):
+        self.request = request
+        self.args = args
+        self.kwargs = kwargs
+        parent = super(ConditionalGetMixin, self)
+        if request.method not in ('GET', 'HEAD'):
+            return parent.dispatch(request, *args, **kwargs)
+
+        def get_response():
+            response = parent.dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            dependencies = cache_dependencies.recorded_dependencies()
+            if (self.track_dependencies and dependencies and
+                    response.status_code == 200):
+                cache_dependencies.remember_dependencies(request.path,
+                                                         dependencies)
+            return response
+
+        last_modified = self.get_last_modified()
+        etag_parts = self.get_etag_parts()
+        if last_modified is not None and self.track_dependencies and \
+                etag_parts:
+            # Versions are the times the dependencies last changed.
+            newest = max([float(version) for key, version in etag_parts])
+            last_modified = max(last_modified,
+                                datetime.fromtimestamp(newest))
+        return conditional_response(request, last_modified, etag_parts,
+                                    get_response)
+
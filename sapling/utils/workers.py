@@ -0,0 +1,20 @@
+"""
+Setting up worker processes forked from the site, such as the thumbnail
+and static export pools.
+"""
+from django.db import connection
+
+import cache_dependencies
+
+
+def init_worker():
+    """
+    Gives a freshly-forked worker connections of its own in place of the
+    ones it inherited from its parent.  Use as a multiprocessing.Pool
+    initializer.
+    """
+    # Drop the database connection without closing it, which would close
+    # it for the parent too.
+    connection.connection = None
+    if hasattr(cache_dependencies.cache, 'close'):
+        cache_dependencies.cache.close()
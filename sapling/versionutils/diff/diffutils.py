@@ -14,6 +14,7 @@ from utils import static_url, reverse_lazy
 import diff_match_patch
 import daisydiff
 from versionutils.versioning.utils import is_historical_instance
+from versionutils.versioning.fields import VersionInfoField
 
 
 class DiffUtilNotFound(Exception):
@@ -218,7 +219,9 @@ class BaseModelDiff(object):
         if self.fields:
             diff_fields = self.fields
         else:
-            diff_fields = [f.name for f in self.model_class._meta.fields]
+            # VersionInfoFields aren't kept on historical instances.
+            diff_fields = [f.name for f in self.model_class._meta.fields
+                           if not isinstance(f, VersionInfoField)]
 
         for name in diff_fields:
             if isinstance(name, basestring):
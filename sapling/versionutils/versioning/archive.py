@@ -0,0 +1,258 @@
+"""
+Archiving of old historical records.
+
+Most of the space taken up by history -- and most of what has to be read
+when scanning it -- is in the large text fields of old revisions, e.g.
+the content of every old version of every page.  Archiving moves those
+values for records older than a given age, except for each object's
+most recent few records, into ArchivedRevision as compressed data.
+
+The historical records themselves stay where they are, so version
+numbers, as_of(), revert_to(), diffs and related lookups keep working.
+When an archived field is read on a historical instance its values are
+fetched from the archive, as are the values returned by values() and
+values_list() on historical querysets.  The exception is grouped
+(annotated) or distinct values, which aren't per-record, so archived
+fields come back empty there.
+"""
+import base64
+import datetime
+import zlib
+from itertools import islice
+
+from django.db import models, transaction
+from django.db.models.query import ValuesQuerySet, ValuesListQuerySet
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import simplejson as json
+
+from fields import VersionInfoField
+
+# Records older than this many days may be archived.
+ARCHIVE_AFTER_DAYS = getattr(settings, 'VERSIONUTILS_ARCHIVE_AFTER_DAYS', 365)
+# The number of most recent records of each object that are never
+# archived.
+ARCHIVE_KEEP = getattr(settings, 'VERSIONUTILS_ARCHIVE_KEEP', 10)
+# Rows read at a time when filling in archived values.
+VALUES_CHUNK_SIZE = 100
+
+
+def get_archived_fields(model):
+    """
+    Args:
+        model: A versioned model class.
+
+    Returns:
+        A list of the fields of `model` whose values are moved to the
+        archive.
+    """
+    return [f for f in model._meta.local_fields
+            if isinstance(f, models.TextField) and
+               not isinstance(f, VersionInfoField)]
+
+
+def _placeholder(field):
+    return None if field.null else ''
+
+
+def compress(values):
+    return base64.b64encode(zlib.compress(json.dumps(values)))
+
+
+def decompress(data):
+    return json.loads(zlib.decompress(base64.b64decode(data)))
+
+
+class ArchivedFieldDescriptor(object):
+    """
+    Installed on historical models for each archived field.  When the
+    historical record has been archived, reading the field fetches the
+    archived values.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        d = instance.__dict__
+        if d.get('history_archived') and not d.get('_archive_loaded'):
+            load_archived_values(instance)
+        return d.get(self.field.attname)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+def load_archived_values(hm):
+    """
+    Fills in the archived fields of the historical instance `hm` from the
+    archive.
+    """
+    from models import ArchivedRevision
+
+    hm.__dict__['_archive_loaded'] = True
+    try:
+        archived = ArchivedRevision.objects.get(
+            content_type=ContentType.objects.get_for_model(hm.__class__),
+            history_id=hm.history_id)
+    except ArchivedRevision.DoesNotExist:
+        return
+    for attname, value in decompress(archived.data).iteritems():
+        hm.__dict__[attname] = value
+
+
+def archived_values(hist_model, history_ids):
+    """
+    Returns:
+        A dictionary mapping each of `history_ids` that's in the archive
+        to a dictionary of its archived values, by attname.
+    """
+    from models import ArchivedRevision
+
+    if not history_ids:
+        return {}
+    archived = ArchivedRevision.objects.filter(
+        content_type=ContentType.objects.get_for_model(hist_model),
+        history_id__in=history_ids).values_list('history_id', 'data')
+    return dict((history_id, decompress(data))
+                for history_id, data in archived)
+
+
+class ArchivedValuesMixin(object):
+    def _archived_names(self):
+        if (self.query.aggregate_select or self.query.distinct or
+                self.query.extra_select):
+            # Not per-record values.
+            return []
+        archived = [f.attname for f in
+                    get_archived_fields(self.model._original_model)]
+        return [name for name in self.field_names if name in archived]
+
+
+class ArchivedValuesQuerySet(ArchivedValuesMixin, ValuesQuerySet):
+    """
+    values() on a historical queryset.  Archived fields are filled in from
+    the archive, a chunk of rows at a time.
+    """
+    def iterator(self):
+        names = self._archived_names()
+        if not names:
+            for row in super(ArchivedValuesQuerySet, self).iterator():
+                yield row
+            return
+        # Also read what we need to find the archived values.
+        extra = [n for n in ('history_id', 'history_archived')
+                 if n not in self.field_names]
+        qs = self._clone(klass=ValuesQuerySet, setup=True,
+                         _fields=list(self.field_names) + extra)
+        rows = qs.iterator()
+        while True:
+            chunk = list(islice(rows, VALUES_CHUNK_SIZE))
+            if not chunk:
+                return
+            archived = archived_values(self.model, [
+                row['history_id'] for row in chunk
+                if row['history_archived']])
+            for row in chunk:
+                values = archived.get(row['history_id'], {})
+                for name in names:
+                    if name in values:
+                        row[name] = values[name]
+                for name in extra:
+                    del row[name]
+                yield row
+
+
+class ArchivedValuesListQuerySet(ArchivedValuesMixin, ValuesListQuerySet):
+    """
+    values_list() on a historical queryset.  Archived fields are filled in
+    as for ArchivedValuesQuerySet.
+    """
+    def iterator(self):
+        if not self._archived_names():
+            for row in super(ArchivedValuesListQuerySet, self).iterator():
+                yield row
+            return
+        names = list(self.field_names)
+        qs = self._clone(klass=ArchivedValuesQuerySet, setup=True,
+                         _fields=names)
+        for row in qs.iterator():
+            if self.flat:
+                yield row[names[0]]
+            else:
+                yield tuple([row[name] for name in names])
+
+
+@transaction.commit_on_success
+def archive_records(hist_model, history_ids):
+    """
+    Moves the archived fields of the historical records with the given
+    history_ids into the archive.
+
+    Returns:
+        The number of records archived.
+    """
+    from models import ArchivedRevision
+
+    fields = get_archived_fields(hist_model._original_model)
+    if not fields or not history_ids:
+        return 0
+    content_type = ContentType.objects.get_for_model(hist_model)
+    qs = hist_model.objects.filter(history_id__in=history_ids,
+                                   history_archived=False)
+    attnames = [f.attname for f in fields]
+    count = 0
+    for row in qs.values('history_id', *attnames):
+        history_id = row.pop('history_id')
+        ArchivedRevision(content_type=content_type, history_id=history_id,
+                         data=compress(row)).save()
+        count += 1
+    placeholders = dict((f.name, _placeholder(f)) for f in fields)
+    hist_model.objects.filter(history_id__in=history_ids,
+        history_archived=False).update(history_archived=True,
+                                       **placeholders)
+    return count
+
+
+def archivable_ids(hist_model, days=None, keep=None):
+    """
+    Returns:
+        A generator yielding, for each object, a list of the history_ids
+        of its records that are older than `days` days and aren't among
+        its `keep` most recent records.
+    """
+    if days is None:
+        days = ARCHIVE_AFTER_DAYS
+    if keep is None:
+        keep = ARCHIVE_KEEP
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    pk_name = hist_model._original_model._meta.pk.name
+    old = hist_model.objects.filter(history_date__lt=cutoff,
+                                    history_archived=False)
+    pks = old.order_by(pk_name).values_list(pk_name, flat=True).distinct()
+    for pk in pks.iterator():
+        recent = hist_model.objects.filter(**{pk_name: pk}).order_by(
+            '-history_date').values_list('history_id', flat=True)[:keep]
+        ids = list(old.filter(**{pk_name: pk}).exclude(
+            history_id__in=list(recent)).values_list('history_id', flat=True))
+        if ids:
+            yield ids
+
+
+def prune_archive(hist_model):
+    """
+    Removes archived values whose historical records have been deleted.
+
+    Returns:
+        The number of archived values removed.
+    """
+    from models import ArchivedRevision
+
+    content_type = ContentType.objects.get_for_model(hist_model)
+    archived = ArchivedRevision.objects.filter(content_type=content_type)
+    orphans = archived.exclude(history_id__in=hist_model.objects.filter(
+        history_archived=True).values('history_id'))
+    count = orphans.count()
+    orphans.delete()
+    return count
@@ -0,0 +1,413 @@
+"""
+Helpers for writing historical records in batches.
+
+The normal path (ChangesTracker.post_save) writes one historical record
+per save() and resolves every versioned foreign key and ManyToMany
+member with its own query.  When a large number of objects are changed
+at once, the helpers here let the caller do the real database writes
+however it likes and then record all of the history with a handful of
+multi-row INSERTs.
+
+bulk_history() does the same for ordinary save() and delete() calls:
+
+    with bulk_history():
+        for f in files:
+            f.slug = new_slug
+            f.save(comment="Moved")
+
+NOTE: These helpers don't support models that are concretely subclassed
+      from a versioned model.
+"""
+import copy
+import datetime
+import threading
+from contextlib import contextmanager
+
+from django.db import models, connection, transaction
+from django.db.models import Max
+
+from constants import ADDED_TYPES, TYPE_UPDATED
+from signals import history_recorded
+from utils import (get_versions, is_versioned, get_version_info_fields,
+    bulk_update_version_info)
+
+_state = threading.local()
+
+
+def latest_history_ids(model, pks):
+    """
+    Args:
+        model: A versioned model class.
+        pks: An iterable of primary key values of `model`.
+
+    Returns:
+        A dictionary mapping each primary key to the history_id of the
+        most recent historical record for that object.  Objects with no
+        historical record are left out.
+    """
+    pks = set(pks)
+    if not pks:
+        return {}
+    pk_name = model._meta.pk.name
+    qs = get_versions(model).filter(**{'%s__in' % pk_name: pks})
+    # We clear the default ordering, otherwise the ordering column ends
+    # up in the GROUP BY.
+    qs = qs.order_by(pk_name).values(pk_name).annotate(Max('history_id'))
+    return dict((v[pk_name], v['history_id__max']) for v in qs)
+
+
+def _insert_rows(table, columns, rows):
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(table),
+        ', '.join([qn(c) for c in columns]),
+        ', '.join(['%s'] * len(columns))
+    )
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    # Raw writes don't mark the transaction as dirty on their own.
+    transaction.set_dirty()
+
+
+def create_historical_records(model, instances, history_type, date=None):
+    """
+    Writes a historical record for each of `instances` using a single
+    multi-row INSERT, rather than one INSERT (plus a lookup for each
+    versioned foreign key) per instance.
+
+    The instances must already be saved.  As with save(), per-instance
+    history information (e.g. comment, user) is read from
+    instance._save_with, and instance._history_type, if set, overrides
+    `history_type`.  Versioned foreign keys point at the most recent
+    historical record of the related object, unless
+    instance._history_fks maps the field's name to a history_id to use
+    instead.
+
+    NOTE: This doesn't initialize the historical ManyToMany sets.  Use
+          create_historical_m2m() for that.
+
+    Args:
+        model: A versioned model class.
+        instances: A list of saved instances of `model`.
+        history_type: One of the TYPE_* constants.
+        date: Optional datetime to record the change at.  Defaults to
+            now.
+
+    Returns:
+        A dictionary mapping the pk of each instance to the history_id
+        of its new historical record.
+    """
+    instances = list(instances)
+    if not instances:
+        return {}
+    if date is None:
+        date = datetime.datetime.now()
+    hist_model = get_versions(model).model
+    pk_name = model._meta.pk.name
+
+    # Resolve versioned foreign keys to their most recent historical
+    # records with one query per field.
+    fk_hist_ids = {}
+    for field in model._meta.fields:
+        if not isinstance(field, models.ForeignKey):
+            continue
+        if field.rel.parent_link:
+            raise NotImplementedError(
+                "Batched history isn't supported for subclassed models.")
+        parent_model = field.rel.to
+        if is_versioned(parent_model) or parent_model == model:
+            fk_hist_ids[field.name] = latest_history_ids(parent_model,
+                [getattr(m, field.attname) for m in instances
+                 if field.name not in getattr(m, '_history_fks', {})])
+
+    hist_fields = [f for f in hist_model._meta.local_fields
+                   if not isinstance(f, models.AutoField)]
+    rows = []
+    for m in instances:
+        values = {}
+        history_fks = getattr(m, '_history_fks', {})
+        for field in model._meta.fields:
+            if field.name in history_fks:
+                values[field.name] = history_fks[field.name]
+            elif field.name in fk_hist_ids:
+                values[field.name] = fk_hist_ids[field.name].get(
+                    getattr(m, field.attname))
+            else:
+                values[field.name] = getattr(m, field.attname)
+        for k, v in getattr(m, '_save_with', {}).iteritems():
+            values['history_%s' % k] = v
+        values['history_date'] = date
+        values['history_type'] = getattr(m, '_history_type', None) or \
+            history_type
+
+        row = []
+        for f in hist_fields:
+            if f.name in values:
+                v = values[f.name]
+            elif f.attname in values:
+                v = values[f.attname]
+            else:
+                v = f.get_default()
+            if isinstance(v, models.Model):
+                v = v.pk
+            row.append(f.get_db_prep_save(v, connection=connection))
+        rows.append(row)
+
+    _insert_rows(hist_model._meta.db_table,
+                 [f.column for f in hist_fields], rows)
+
+    # All the new records share the same history_date, so we can look
+    # up their ids in one go.
+    pks = [m.pk for m in instances]
+    qs = hist_model.objects.filter(
+        **{'%s__in' % pk_name: pks, 'history_date': date})
+    history_ids = {}
+    for pk, history_id in qs.values_list(pk_name, 'history_id'):
+        history_ids[pk] = max(history_id, history_ids.get(pk, 0))
+
+    # Close the records that were current until now.  We go by primary
+    # key here rather than by unique fields, as save() does, so a record
+    # left over from before a delete -> re-create cycle may stay open.
+    # as_of() and valid_at() order by date, so that's harmless.
+    hist_model.objects.filter(**{
+        '%s__in' % pk_name: pks,
+        'history_valid_to__isnull': True,
+    }).exclude(history_id__in=history_ids.values()).update(
+        history_valid_to=date)
+
+    if get_version_info_fields(model):
+        changes = []
+        for m in instances:
+            user = getattr(m, '_save_with', {}).get('user')
+            m_type = getattr(m, '_history_type', None) or history_type
+            changes.append((m, getattr(user, 'pk', user),
+                            m_type in ADDED_TYPES))
+        bulk_update_version_info(model, changes, date)
+
+    if history_recorded.receivers:
+        history_recorded.send(sender=model, records=list(
+            hist_model.objects.filter(history_id__in=history_ids.values())))
+    return history_ids
+
+
+def create_historical_m2m(model, attname, members):
+    """
+    Fills in the ManyToMany set `attname` on freshly-created historical
+    records.  Members pointing at versioned models are resolved to their
+    most recent historical records with a single query.
+
+    Args:
+        model: A versioned model class.
+        attname: Name of the ManyToManyField on `model`.
+        members: A dictionary mapping history_id to an iterable of the
+            pks of the (non-historical) objects in the set.
+    """
+    related_model = model._meta.get_field(attname).rel.to
+    if not is_versioned(related_model):
+        # As with ChangesTracker.m2m_init, only sets of versioned
+        # objects are kept on the historical records.
+        return
+    hist_model = get_versions(model).model
+    hist_field = hist_model._meta.get_field(attname)
+
+    all_pks = set()
+    for pks in members.itervalues():
+        all_pks.update(pks)
+    lookup = latest_history_ids(related_model, all_pks)
+
+    rows = []
+    for history_id, pks in members.iteritems():
+        for pk in set(pks):
+            if pk in lookup:
+                rows.append((history_id, lookup[pk]))
+
+    _insert_rows(hist_field.m2m_db_table(),
+        [hist_field.m2m_column_name(), hist_field.m2m_reverse_name()], rows)
+
+
+def _pending():
+    return getattr(_state, 'pending', None)
+
+
+def defer_historical_record(model, instance, history_type):
+    """
+    Called by ChangesTracker in place of writing a historical record.
+
+    Returns:
+        True if we're inside bulk_history() and the record will be
+        written when it exits, otherwise False.
+    """
+    pending = _pending()
+    if pending is None or not instance._track_changes:
+        return False
+    if instance.__class__ is not model or model._meta.parents:
+        # Subclassed models write their records through their parents'
+        # historical models, which create_historical_records() can't do.
+        return False
+    snapshot = copy.copy(instance)
+    snapshot._save_with = dict(getattr(instance, '_save_with', {}))
+    snapshot._history_type = history_type
+    # save() points versioned foreign keys at the related object's most
+    # recent record at the time of the call.  If that record is waiting
+    # to be written too, remember which one it is.
+    snapshot._history_fk_refs = {}
+    for field in _versioned_fks(model):
+        key = (field.rel.to, getattr(instance, field.attname))
+        if key in _state.latest:
+            snapshot._history_fk_refs[field.name] = _state.latest[key]
+    _state.latest[(model, instance.pk)] = len(pending)
+    pending.append((model, snapshot, datetime.datetime.now()))
+    return True
+
+
+def is_deferred(instance):
+    """
+    Returns:
+        True if a historical record for `instance` is waiting to be
+        written by bulk_history().
+    """
+    if _pending() is None:
+        return False
+    return (instance.__class__, instance.pk) in _state.latest
+
+
+def _versioned_fks(model):
+    return [f for f in model._meta.fields if isinstance(f, models.ForeignKey)
+            and (is_versioned(f.rel.to) or f.rel.to == model)]
+
+
+def _resolve_fks(pending):
+    """
+    Points the versioned foreign keys of the pending records that don't
+    refer to another pending record at the most recent historical
+    records written before the batch, as save() would have.
+    """
+    targets = {}
+    for model, snapshot, date in pending:
+        for field in _versioned_fks(model):
+            if field.name not in snapshot._history_fk_refs:
+                targets.setdefault(field.rel.to, set()).add(
+                    getattr(snapshot, field.attname))
+    latest = dict((m, latest_history_ids(m, pks))
+                  for m, pks in targets.iteritems())
+    for model, snapshot, date in pending:
+        snapshot._history_fks = {}
+        for field in _versioned_fks(model):
+            if field.name not in snapshot._history_fk_refs:
+                snapshot._history_fks[field.name] = latest[field.rel.to].get(
+                    getattr(snapshot, field.attname))
+
+
+def _current_m2m(model, pks):
+    """
+    Returns:
+        A dictionary mapping each ManyToManyField name on `model` that
+        points at a versioned model to a dictionary of pk -> set of
+        member pks.
+    """
+    sets = {}
+    for field in model._meta.many_to_many:
+        if not is_versioned(field.rel.to):
+            continue
+        through = field.rel.through
+        members = dict((pk, set()) for pk in pks)
+        qs = through.objects.filter(
+            **{'%s__in' % field.m2m_field_name(): pks})
+        for pk, member in qs.values_list(field.m2m_field_name(),
+                                         field.m2m_reverse_field_name()):
+            members[pk].add(member)
+        sets[field.name] = members
+    return sets
+
+
+def _write_pending(pending):
+    _resolve_fks(pending)
+    by_model = {}
+    order = []
+    for i, (model, snapshot, date) in enumerate(pending):
+        if model not in by_model:
+            by_model[model] = []
+            order.append(model)
+        by_model[model].append((i, snapshot, date))
+
+    # Maps the position of each record in `pending` to its history_id.
+    written = {}
+    for model in order:
+        # Each round holds at most one record per object, so that every
+        # record in a round can share a history_date.  Later rounds get
+        # later dates, so objects saved several times keep their order.
+        rounds = []
+        seen = {}
+        for record in by_model[model]:
+            pk = record[1].pk
+            n = seen.get(pk, 0)
+            seen[pk] = n + 1
+            if n == len(rounds):
+                rounds.append([])
+            rounds[n].append(record)
+
+        m2m = _current_m2m(model, seen.keys())
+        last_date = None
+        for records in rounds:
+            date = max([d for i, s, d in records])
+            if last_date is not None and date <= last_date:
+                date = last_date + datetime.timedelta(microseconds=1)
+            last_date = date
+            for i, snapshot, d in records:
+                for name, ref in snapshot._history_fk_refs.iteritems():
+                    # If the record we refer to hasn't been written yet
+                    # (e.g. the models refer to each other) we fall back
+                    # to the most recent record when this one's written.
+                    if ref in written:
+                        snapshot._history_fks[name] = written[ref]
+            snapshots = [s for i, s, d in records]
+            history_ids = create_historical_records(model, snapshots,
+                                                    TYPE_UPDATED, date)
+            for i, snapshot, d in records:
+                if snapshot.pk in history_ids:
+                    written[i] = history_ids[snapshot.pk]
+            for attname, members in m2m.iteritems():
+                # Deleted objects have no members left, so as with
+                # ChangesTracker.m2m_init their sets are empty.
+                create_historical_m2m(model, attname, dict(
+                    (history_ids[s.pk], members[s.pk]) for s in snapshots
+                    if s.pk in history_ids))
+
+
+@contextmanager
+def bulk_history():
+    """
+    Collects the historical records for versioned objects saved or
+    deleted inside the block and writes them with a few multi-row
+    INSERTs when the block exits, rather than with an INSERT (and
+    lookups) per save().
+
+    The records are the ones save() and delete() would have written:
+    the history type, comment, user and so on are taken as of each
+    call, and versioned foreign keys point at the records that were most
+    recent at the time.  ManyToMany sets are read when the block exits.
+
+    Nested blocks write their records when the outermost one exits.  If
+    the block raises an exception nothing is written.  Run the block
+    inside a transaction (e.g. under commit_on_success) if the objects
+    and their history should be committed together.
+    """
+    if _pending() is not None:
+        yield
+        return
+    _state.pending = []
+    # Maps (model, pk) to the position in _state.pending of the object's
+    # most recent record.
+    _state.latest = {}
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+        _state.latest = None
+    if transaction.is_managed():
+        _write_pending(pending)
+    else:
+        transaction.commit_on_success(_write_pending)(pending)
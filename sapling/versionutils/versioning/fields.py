@@ -18,6 +18,56 @@ class AutoUserField(models.ForeignKey, AutoSetField):
 class AutoIPAddressField(models.IPAddressField, AutoSetField):
     pass
 
+
+class VersionInfoField(object):
+    """
+    A field that describes a versioned model's history rather than being
+    part of it, e.g. when the object was last changed.  These fields
+    aren't copied onto the historical model.  Instead, they're kept up to
+    date each time a historical record is written, so that the
+    information can be shown without querying the historical model.
+    """
+    pass
+
+
+class LastModifiedField(models.DateTimeField, VersionInfoField):
+    """
+    The date of the most recent historical record.
+    """
+    def __init__(self, *args, **kws):
+        kws.setdefault('null', True)
+        kws.setdefault('blank', True)
+        kws['editable'] = False
+        super(LastModifiedField, self).__init__(*args, **kws)
+
+
+class LastEditorField(models.ForeignKey, VersionInfoField):
+    """
+    The User who made the most recent change, if it was made by a
+    logged-in user.
+    """
+    def __init__(self, **kws):
+        if 'to' in kws:
+            # Fixes south.  We always want this to point to the User
+            # model.
+            del kws['to']
+        kws.setdefault('null', True)
+        kws.setdefault('blank', True)
+        kws.setdefault('related_name', '+')
+        kws.setdefault('on_delete', models.SET_NULL)
+        kws['editable'] = False
+        super(LastEditorField, self).__init__(User, **kws)
+
+
+class VersionCountField(models.PositiveIntegerField, VersionInfoField):
+    """
+    The number of historical records.
+    """
+    def __init__(self, *args, **kws):
+        kws.setdefault('default', 0)
+        kws['editable'] = False
+        super(VersionCountField, self).__init__(*args, **kws)
+
 try:
     from south.modelsinspector import add_introspection_rules
     add_introspection_rules([], ["^versionutils\.versioning\.fields"])
@@ -9,13 +9,14 @@ import datetime
 from functools import partial
 
 from django.db import models
-from django.db.models import Max
 from django.utils.functional import SimpleLazyObject
 from django.db.models.sql.constants import LOOKUP_SEP
 from django.core.exceptions import ObjectDoesNotExist
 
 from constants import *
 from utils import *
+from fields import VersionInfoField
+import registry
 
 
 def get_history_methods(self, model):
@@ -29,9 +30,7 @@ def get_history_methods(self, model):
         'version_info': HistoricalMetaInfo(),
         'revert_to': revert_to,
         '__init__': historical_record_init,
-        '__getattribute__':
-            # not sure why functools.partial doesn't work here
-            lambda m, name: historical_record_getattribute(model, m, name),
+        '__getattr__': historical_record_getattr,
     }
 
     return fields
@@ -52,6 +51,11 @@ def get_history_fields(self, model):
         'history__object_rel_populated': HistoricalObjectDescriptor(
             model, populate_related=True),
         'history_date': models.DateTimeField(default=datetime.datetime.now),
+        # The record describes the object from history_date until
+        # history_valid_to, which is set when the next record is written.
+        'history_valid_to': models.DateTimeField(null=True, db_index=True),
+        # Whether the large fields have been moved to the archive.
+        'history_archived': models.BooleanField(default=False),
         'history_version_number': version_number_of,
         'history_type': models.SmallIntegerField(choices=TYPE_CHOICES),
         'history_type_verbose': type_to_verbose,
@@ -85,13 +89,138 @@ def historical_record_init(m, *args, **kws):
             del kws['__class__']
 
     retval = base.__init__(m, *args, **kws)
-    m._wrapped_lookup_fields = {}
-    _wrap_m2m_relation_lookups(m)
-    _wrap_reverse_lookups(m)
+    cls = m.__class__
+    if cls.__dict__.get('_relation_descriptors_generation') != \
+            registry.generation:
+        install_relation_descriptors(cls)
     return retval
 
 
-def _wrap_m2m_relation_lookups(m):
+class OriginalCallableDescriptor(object):
+    """
+    Looks up a method of the non-historical model on the non-historical
+    form of the historical instance, so that e.g.
+    historical_page.get_absolute_url() works.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance.version_info._object_rel_populated, self.name)
+
+
+def install_callable_descriptors(hist_model, callables):
+    """
+    Installs an OriginalCallableDescriptor on the historical model for
+    each of the non-historical model's callables.
+
+    Args:
+        hist_model: A historical model class.
+        callables: A dictionary of the non-historical model's callables,
+            as returned by ChangesTracker.get_callables().
+    """
+    for name in callables:
+        if name.startswith('__') and name.endswith('__'):
+            # Special methods are looked up on the type, so these have
+            # always come from the historical model.
+            continue
+        if name in hist_model.__dict__:
+            # Something the historical model defines itself, such as
+            # DoesNotExist.
+            continue
+        setattr(hist_model, name, OriginalCallableDescriptor(name))
+
+
+class LazyRelationDescriptor(object):
+    """
+    Returns a SimpleLazyObject wrapping `lookup(instance)`.  The wrapper is
+    only created when the attribute is first accessed and the lookup
+    only runs when the wrapper is first used.
+
+    We can't simply set history_instance.att = SimpleLazyObject(..)
+    because Django does an isinstance() check on assignment to model
+    fields.  Additionally, the __set__ method on related fields will
+    force evaluation due to equality checks.
+
+    Args:
+        name: Attribute name.
+        lookup: A function taking the historical instance.
+        shadowed: The class attribute we're replacing, if any.  Assignment
+            is passed along to it.
+    """
+    def __init__(self, name, lookup, shadowed=None):
+        self.name = name
+        self.lookup = lookup
+        self.shadowed = shadowed
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        wrapped = instance.__dict__.setdefault('_wrapped_lookup_fields', {})
+        value = wrapped.get(self.name)
+        if value is None:
+            value = SimpleLazyObject(partial(self.lookup, instance))
+            wrapped[self.name] = value
+        return value
+
+    def __set__(self, instance, value):
+        if hasattr(self.shadowed, '__set__'):
+            self.shadowed.__set__(instance, value)
+        else:
+            instance.__dict__[self.name] = value
+
+
+def _set_relation_descriptor(cls, name, lookup):
+    shadowed = cls.__dict__.get(name)
+    if isinstance(shadowed, LazyRelationDescriptor):
+        shadowed = shadowed.shadowed
+    elif shadowed is None:
+        shadowed = getattr(cls, name, None)
+    setattr(cls, name, LazyRelationDescriptor(name, lookup, shadowed))
+
+
+def install_relation_descriptors(cls):
+    """
+    Installs LazyRelationDescriptors on the historical model `cls` for its
+    non-versioned ManyToMany fields and its reverse relations from
+    versioned models.
+
+    This depends on which models are versioned, so it's done when the
+    first historical instance is created rather than when the historical
+    model is, and again if more models are registered.
+
+    Args:
+        cls: A historical model class.
+    """
+    generation = registry.generation
+    model_meta = cls._original_model._meta
+    for field in _non_versioned_m2m_fields(model_meta):
+        _set_relation_descriptor(cls, field.name,
+                                 partial(_m2m_relation_lookup, field.name))
+
+    related_objects = model_meta.get_all_related_objects()
+    related_objects += model_meta.get_all_related_many_to_many_objects()
+    related_versioned = [o for o in related_objects if is_versioned(o.model)]
+    for rel_o in related_versioned:
+        if isinstance(rel_o.field, models.OneToOneField):
+            # OneToOneFields have a direct lookup (not a set).
+            lookup = partial(_reverse_attr_lookup, rel_o)
+        else:
+            lookup = partial(_reverse_set_lookup, rel_o)
+        _set_relation_descriptor(cls, rel_o.get_accessor_name(), lookup)
+    cls._relation_descriptors_generation = generation
+
+
+def _non_versioned_m2m_fields(model_meta):
+    return [f for f in model_meta.local_many_to_many if
+        isinstance(f, models.fields.related.RelatedField) and
+        not is_versioned(f.rel.to)
+    ]
+
+
+def _m2m_relation_lookup(name, m):
     """
     We wrap ManyToMany relation lookup on the historical models and have the
     fields, when accessed, return the associated fields on the non-historical
@@ -108,164 +237,123 @@ def _wrap_m2m_relation_lookups(m):
     the related set at the right historical time).
 
     Args:
+        name: Name of the ManyToManyField.
         m: A historical record instance.
     """
-    model_meta = m._original_model._meta
-    non_versioned_m2m_fields = [f for f in model_meta.local_many_to_many if
-        isinstance(f, models.fields.related.RelatedField) and
-        not is_versioned(f.rel.to)
-    ]
-    for field in non_versioned_m2m_fields:
-        def _lookup():
-            orig_obj = m.version_info._object
-            return getattr(orig_obj, field.name)
-        m._wrapped_lookup_fields[field.name] = SimpleLazyObject(_lookup)
+    orig_obj = m.version_info._object
+    return getattr(orig_obj, name)
 
 
-def _wrap_reverse_lookups(m):
+def _reverse_set_lookup(rel_o, m):
     """
     Make reverse foreign key lookups return historical versions
     if the model is versioned.
 
     Args:
+        rel_o: The RelatedObject describing the relation.
         m: A historical record instance.
     """
-    def _reverse_set_lookup(m, rel_o):
-        attr = rel_o.field.name
-        parent_model = rel_o.model
-        as_of = m.version_info.date
-        parent_pk_att = parent_model._meta.pk.attname
-
-        # Find unique fields of the base (non-historical) model
-        # or use the pk.  We use unique fields, if available, because
-        # the underlying pk can change through delete -> recreation
-        # cycles while the unique fields stay the same.
-        unique_values = unique_lookup_values_for(m.version_info._object)
-        if not unique_values:
-            pk_att = m.version_info._object._meta.pk.attname
-            pk_val = getattr(m.version_info._object, pk_att)
-            unique_values = {pk_att: pk_val}
-
-        # Construct something like {'b__email':'a@example.org', ...}
-        # from the unique fields of the base model.
-        new_unique_values = {}
-        for k, v in unique_values.iteritems():
-            new_unique_values['%s%s%s' % (attr, LOOKUP_SEP, k)] = v
-        unique_values = new_unique_values
-
-        # Grab parent history objects that are less than the as_of date
-        # that point at the base model.
-        qs = get_versions(parent_model).filter(
-            history_date__lte=as_of,
-            **unique_values
-        )
-        # Then group by the parent_pk
-        qs = qs.order_by(parent_pk_att).values(parent_pk_att).distinct()
-        # then annotate the maximum history object id
-        ids = qs.annotate(Max('history_id'))
-        history_ids = [v['history_id__max'] for v in ids]
-        # return a QuerySet containing the proper history objects
-        return get_versions(parent_model).filter(history_id__in=history_ids)
-
-    def _reverse_attr_lookup(m, rel_o):
-        attr = rel_o.field.name
-        parent_model = rel_o.model
-        as_of = m.version_info.date
-        is_subclass = False
-
-        # Find unique values of the base (non-historical) model.
-        unique_values = unique_lookup_values_for(m.version_info._object)
-        if not unique_values:
-            # Check to see if this is a subclass relation with a
-            # historical model.
-            for k, v in rel_o.opts.parents.iteritems():
-                if is_versioned(k):
-                    # Cheap comparison hack.
-                    is_subclass = v.related.__dict__ == rel_o.__dict__
-
-            pk_att = m.version_info._object._meta.pk.attname
-            if is_subclass:
-                # For subclassed historical models' implicit OneToOne
-                # relation we want to use the id of the historical
-                # model when the related object is also versioned.
-                pk_val = getattr(m, 'history_id')
-            else:
-                pk_val = getattr(m.version_info._object, pk_att)
-            unique_values = {pk_att: pk_val}
+    attr = rel_o.field.name
+    parent_model = rel_o.model
+    as_of = m.version_info.date
+
+    # Find unique fields of the base (non-historical) model
+    # or use the pk.  We use unique fields, if available, because
+    # the underlying pk can change through delete -> recreation
+    # cycles while the unique fields stay the same.
+    unique_values = unique_lookup_values_for(m.version_info._object)
+    if not unique_values:
+        pk_att = m.version_info._object._meta.pk.attname
+        pk_val = getattr(m.version_info._object, pk_att)
+        unique_values = {pk_att: pk_val}
+
+    # Construct something like {'b__email':'a@example.org', ...}
+    # from the unique fields of the base model.
+    new_unique_values = {}
+    for k, v in unique_values.iteritems():
+        new_unique_values['%s%s%s' % (attr, LOOKUP_SEP, k)] = v
+    unique_values = new_unique_values
+
+    # The parent history objects that were current at the as_of date
+    # and that point at the base model.
+    return get_versions(parent_model).valid_at(as_of).filter(**unique_values)
+
+
+def _reverse_attr_lookup(rel_o, m):
+    """
+    Make reverse OneToOne lookups return the historical version if the
+    model is versioned.
 
-        # Construct something like {'b__email':'a@example.org', ...}
-        # from the unique fields of the base model.
-        new_unique_values = {}
-        for k, v in unique_values.iteritems():
-            new_unique_values['%s%s%s' % (attr, LOOKUP_SEP, k)] = v
-        unique_values = new_unique_values
+    Args:
+        rel_o: The RelatedObject describing the relation.
+        m: A historical record instance.
+    """
+    attr = rel_o.field.name
+    parent_model = rel_o.model
+    as_of = m.version_info.date
+    is_subclass = False
+
+    # Find unique values of the base (non-historical) model.
+    unique_values = unique_lookup_values_for(m.version_info._object)
+    if not unique_values:
+        # Check to see if this is a subclass relation with a
+        # historical model.
+        for k, v in rel_o.opts.parents.iteritems():
+            if is_versioned(k):
+                # Cheap comparison hack.
+                is_subclass = v.related.__dict__ == rel_o.__dict__
+
+        pk_att = m.version_info._object._meta.pk.attname
+        if is_subclass:
+            # For subclassed historical models' implicit OneToOne
+            # relation we want to use the id of the historical
+            # model when the related object is also versioned.
+            pk_val = getattr(m, 'history_id')
+        else:
+            pk_val = getattr(m.version_info._object, pk_att)
+        unique_values = {pk_att: pk_val}
 
-        try:
-            obj = get_versions(parent_model).filter(
-                history_date__lte=as_of,
-                **unique_values
-            )[0]
-        except IndexError:
-            raise getattr(parent_model, hist_name).model.DoesNotExist(
-                "%s matching query does not exist." %
-                getattr(parent_model, hist_name).model._meta.object_name)
-        return obj
-
-    model_meta = m._original_model._meta
-    related_objects = model_meta.get_all_related_objects()
-    related_objects += model_meta.get_all_related_many_to_many_objects()
-    related_versioned = [o for o in related_objects if is_versioned(o.model)]
-    for rel_o in related_versioned:
-        # Set the accessor to a lazy lookup function that, when
-        # accessed, looks up the proper related set.
-        accessor = rel_o.get_accessor_name()
+    # Construct something like {'b__email':'a@example.org', ...}
+    # from the unique fields of the base model.
+    new_unique_values = {}
+    for k, v in unique_values.iteritems():
+        new_unique_values['%s%s%s' % (attr, LOOKUP_SEP, k)] = v
+    unique_values = new_unique_values
 
-        if isinstance(rel_o.field, models.OneToOneField):
-            # OneToOneFields have a direct lookup (not a set).
-            _reverse_lookup = partial(_reverse_attr_lookup, m, rel_o)
-        else:
-            _reverse_lookup = partial(_reverse_set_lookup, m, rel_o)
-        m._wrapped_lookup_fields[accessor] = SimpleLazyObject(_reverse_lookup)
+    try:
+        obj = get_versions(parent_model).valid_at(as_of).filter(
+            **unique_values)[0]
+    except IndexError:
+        hist_model = get_versions(parent_model).model
+        raise hist_model.DoesNotExist(
+            "%s matching query does not exist." %
+            hist_model._meta.object_name)
+    return obj
 
 
-def historical_record_getattribute(model, m, name):
+def historical_record_getattr(m, name):
     """
-    We have to define our own __getattribute__ because otherwise there's
-    no way to set our wrapped foreign key attributes.  We also use this
-    function to do a 'fallback' lookup on methods and attributes on the
-    non-historical instance.
-
-    If we try and set
-    history_instance.att = SimpleLazyObject(_lookup_proper_fk_version)
-    we'll get an error because Django does an isinstance() check on
-    assignment to model fields. Additionally, the __set__ method on
-    related fields will force evaluation due to equality checks.
+    We allow the original attribute to be obtained by asking for
+    m.__direct_name, skipping the lazy relation lookups set up by
+    install_relation_descriptors().
 
     Args:
-        model: A model class.
         m: The model instance.
         name: The string representing the attribute name.
     """
-    basedict = model.__getattribute__(m, '__dict__')
-    direct_val = basedict.get('_wrapped_lookup_fields', {}).get(name)
-    if direct_val is not None:
-        return direct_val
-    # We allow the original attribute to be obtained by asking for
-    # m.__direct_name.
-    if name.startswith('__direct_'):
-        name = name[9:]
-
-    try:
-        callables = model.__getattribute__(m, '_original_callables')
-    except AttributeError:
-        pass
-    else:
-        if name in callables:
-            # This is a callable so let's do a lookup on the non-historical
-            # model instance.
-            return m.version_info._object_rel_populated.__getattribute__(name)
-
-    return model.__getattribute__(m, name)
+    if not name.startswith('__direct_'):
+        raise AttributeError("'%s' object has no attribute '%s'" %
+                             (m.__class__.__name__, name))
+    name = name[9:]
+    attr = getattr(m.__class__, name, None)
+    if isinstance(attr, LazyRelationDescriptor):
+        if attr.shadowed is None:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (m.__class__.__name__, name))
+        if hasattr(attr.shadowed, '__get__'):
+            return attr.shadowed.__get__(m, m.__class__)
+        return attr.shadowed
+    return getattr(m, name)
 
 
 def _cascade_revert(current_hm, m, **kws):
@@ -481,6 +569,10 @@ class HistoricalObjectDescriptor(object):
     def __get__(self, instance, owner):
         values = []
         for f in self.model._meta.fields:
+            if isinstance(f, VersionInfoField):
+                # Not kept on the historical model.
+                values.append(f.get_default())
+                continue
             related = getattr(f, 'related', None)
             if related and is_versioned(related.parent_model):
                 # If the field points to a related, versioned model then
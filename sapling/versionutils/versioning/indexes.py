@@ -0,0 +1,157 @@
+"""
+Composite indexes on historical tables.
+
+Django only gives us single-column indexes, but the queries we run most
+against historical models filter on one set of columns and order or
+range on another:
+
+    * The history of an object -- HistoryManager.get_query_set(),
+      as_of() and version_number_of() -- filters on the object's unique
+      fields (or primary key) and orders or ranges on history_date.
+    * Recent changes filter and order on history_date, and on
+      history_type.
+
+The indexes returned by history_indexes() are created for new
+historical tables after syncdb.  Use the history_indexes management
+command to check existing databases.
+"""
+import hashlib
+
+from django.db import connection, transaction
+from django.db.models.signals import post_syncdb
+
+from utils import get_history_models
+
+
+def get_identity_fields(hist_model):
+    """
+    Returns:
+        The historical model's fields that identify the object a record
+        belongs to: the non-relational unique fields of the model if it
+        has them, otherwise its primary key.
+    """
+    opts = hist_model._original_model._meta
+    names = None
+    for field in opts.fields:
+        if field.unique and not field.primary_key and not field.rel:
+            names = [field.name]
+            break
+    if names is None and opts.unique_together:
+        fields = [opts.get_field(name) for name in opts.unique_together[0]]
+        if not [f for f in fields if f.rel]:
+            names = list(opts.unique_together[0])
+    if names is None:
+        names = [opts.pk.name]
+    return [hist_model._meta.get_field(name) for name in names]
+
+
+def get_identity_columns(hist_model):
+    return [f.column for f in get_identity_fields(hist_model)]
+
+
+def history_indexes(hist_model):
+    """
+    Returns:
+        A list of the column lists we want indexed on the historical
+        model's table.
+    """
+    opts = hist_model._meta
+    date_col = opts.get_field('history_date').column
+    return [
+        get_identity_columns(hist_model) + [
+            date_col, opts.get_field('history_valid_to').column],
+        [date_col, opts.get_field('history_type').column],
+    ]
+
+
+def index_name(table, columns):
+    digest = hashlib.md5(','.join(columns)).hexdigest()[:8]
+    max_length = connection.ops.max_name_length() or 200
+    return '%s_%s' % (table[:max_length - 9], digest)
+
+
+def existing_indexes(table):
+    """
+    Returns:
+        A list of the column lists of the indexes on `table`, or None if
+        we don't know how to find them for this database.
+    """
+    cursor = connection.cursor()
+    engine = connection.settings_dict['ENGINE']
+    indexes = []
+    if 'postgres' in engine or 'postgis' in engine:
+        cursor.execute("SELECT pg_get_indexdef(i.indexrelid) "
+            "FROM pg_index i JOIN pg_class c ON c.oid = i.indrelid "
+            "WHERE c.relname = %s", [table])
+        for (definition,) in cursor.fetchall():
+            columns = definition[definition.rindex('(') + 1:
+                                 definition.rindex(')')]
+            indexes.append([c.strip().strip('"') for c in columns.split(',')])
+    elif 'sqlite' in engine:
+        cursor.execute('PRAGMA index_list(%s)' % connection.ops.quote_name(
+            table))
+        for row in cursor.fetchall():
+            cursor.execute('PRAGMA index_info(%s)' %
+                           connection.ops.quote_name(row[1]))
+            indexes.append([r[2] for r in sorted(cursor.fetchall())])
+    elif 'mysql' in engine:
+        cursor.execute('SHOW INDEX FROM %s' % connection.ops.quote_name(
+            table))
+        by_name = {}
+        for row in cursor.fetchall():
+            by_name.setdefault(row[2], []).append((row[3], row[4]))
+        for columns in by_name.values():
+            indexes.append([c for seq, c in sorted(columns)])
+    else:
+        return None
+    return indexes
+
+
+def missing_history_indexes(hist_model):
+    """
+    Returns:
+        The column lists from history_indexes() that aren't covered by an
+        existing index, or None if we can't tell.
+    """
+    existing = existing_indexes(hist_model._meta.db_table)
+    if existing is None:
+        return None
+    missing = []
+    for columns in history_indexes(hist_model):
+        if not [e for e in existing if e[:len(columns)] == columns]:
+            missing.append(columns)
+    return missing
+
+
+def create_index(hist_model, columns):
+    qn = connection.ops.quote_name
+    table = hist_model._meta.db_table
+    cursor = connection.cursor()
+    cursor.execute('CREATE INDEX %s ON %s (%s)' % (
+        qn(index_name(table, columns)), qn(table),
+        ', '.join([qn(c) for c in columns])))
+    transaction.commit_unless_managed()
+
+
+def create_missing_indexes(hist_model):
+    """
+    Creates any of the indexes from history_indexes() that are missing.
+
+    Returns:
+        A list of the column lists that were indexed.
+    """
+    missing = missing_history_indexes(hist_model)
+    if missing is None:
+        # We can't tell what's there.
+        return []
+    for columns in missing:
+        create_index(hist_model, columns)
+    return missing
+
+
+def create_indexes_after_syncdb(sender, created_models, **kws):
+    for hist_model in get_history_models():
+        if hist_model in created_models:
+            create_missing_indexes(hist_model)
+
+post_syncdb.connect(create_indexes_after_syncdb)
@@ -0,0 +1,63 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import get_model
+
+from versionutils.versioning.utils import (is_versioned, get_versions,
+    get_history_models)
+from versionutils.versioning.archive import (ARCHIVE_AFTER_DAYS,
+    ARCHIVE_KEEP, get_archived_fields, archivable_ids, archive_records,
+    prune_archive)
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName app_label.ModelName ...>'
+    help = ('Moves the large fields of old historical records into the '
+            'compressed archive.  They are still read transparently when '
+            'needed.  By default every versioned model with text fields '
+            'is archived.')
+    option_list = BaseCommand.option_list + (
+        make_option('--days', dest='days', type='int',
+            default=ARCHIVE_AFTER_DAYS,
+            help='Archive records older than this many days.'),
+        make_option('--keep', dest='keep', type='int', default=ARCHIVE_KEEP,
+            help='Never archive the most recent KEEP records of an object.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False,
+            help='Only report how many records would be archived.'),
+    )
+
+    def handle(self, *labels, **options):
+        if labels:
+            hist_models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError('Models must be given as '
+                                       'app_label.ModelName')
+                model = get_model(app_label, model_name)
+                if model is None or not is_versioned(model):
+                    raise CommandError('Unknown versioned model: %s' % label)
+                hist_models.append(get_versions(model).model)
+        else:
+            hist_models = get_history_models()
+        hist_models = [h for h in hist_models
+                       if get_archived_fields(h._original_model)]
+
+        for hist_model in hist_models:
+            count = 0
+            for ids in archivable_ids(hist_model, days=options['days'],
+                                      keep=options['keep']):
+                if options['dry_run']:
+                    count += len(ids)
+                else:
+                    count += archive_records(hist_model, ids)
+            name = hist_model._meta.verbose_name_plural
+            if options['dry_run']:
+                self.stdout.write('Would archive %d %s.\n' % (count, name))
+                continue
+            pruned = prune_archive(hist_model)
+            self.stdout.write('Archived %d %s, removed %d stale entries.\n'
+                              % (count, name, pruned))
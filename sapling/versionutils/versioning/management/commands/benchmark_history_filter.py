@@ -0,0 +1,71 @@
+import datetime
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import get_model, get_models
+
+from versionutils.versioning.utils import is_versioned, get_versions
+from versionutils.versioning.manager import get_lookup_translator
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName app_label.ModelName ...>'
+    help = ('Measures the per-call cost of translating filter() lookups on '
+            'historical models, with and without the precompiled rules.  '
+            'No queries are run.')
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', dest='iterations', type='int',
+            default=10000, help='Number of calls to time.'),
+    )
+
+    def handle(self, *labels, **options):
+        if labels:
+            models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError('Models must be given as '
+                                       'app_label.ModelName')
+                model = get_model(app_label, model_name)
+                if model is None or not is_versioned(model):
+                    raise CommandError('Unknown versioned model: %s' % label)
+                models.append(model)
+        else:
+            models = [m for m in get_models() if is_versioned(m)]
+
+        iterations = options['iterations']
+        self.stdout.write('%-30s %12s %12s %12s\n' % (
+            'model', 'uncompiled', 'compiled', 'filter()'))
+        for model in models:
+            hist_model = get_versions(model).model
+            translator = get_lookup_translator(hist_model)
+            kws = {
+                'version_info__date__lte': datetime.datetime.now(),
+                'version_info__type__in': [0, 1],
+                model._meta.pk.name: 1,
+            }
+            translator.compile()
+            for var_name in translator.versioned_vars:
+                kws['%s__id' % var_name] = 1
+
+            def uncompiled():
+                # What every filter() call used to do.
+                translator.compile()
+                translator.translate(kws)
+
+            def compiled():
+                translator.translate(kws)
+
+            def build_queryset():
+                get_versions(model).filter(**kws)
+
+            times = []
+            for f in (uncompiled, compiled, build_queryset):
+                seconds = min(timeit.repeat(f, number=iterations, repeat=3))
+                times.append(seconds / iterations * 1e6)
+            self.stdout.write('%-30s %10.2fus %10.2fus %10.2fus\n' % tuple(
+                ['%s.%s' % (model._meta.app_label, model._meta.object_name)] +
+                times))
@@ -0,0 +1,57 @@
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import get_model
+
+from versionutils.versioning.utils import is_versioned, get_versions
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName>'
+    help = ('Measures the cost of creating historical instances and reading '
+            'their attributes, e.g. when iterating through a large history '
+            'for a feed.  Rows are fetched once up front so the database '
+            'isn\'t part of the timing.')
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', dest='rows', type='int', default=500,
+            help='Number of historical records to use.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+            help='Number of times to repeat each measurement.'),
+    )
+
+    def handle(self, label='pages.Page', **options):
+        try:
+            app_label, model_name = label.split('.')
+        except ValueError:
+            raise CommandError('Model must be given as app_label.ModelName')
+        model = get_model(app_label, model_name)
+        if model is None or not is_versioned(model):
+            raise CommandError('Unknown versioned model: %s' % label)
+
+        hist_model = get_versions(model).model
+        attnames = [f.attname for f in hist_model._meta.fields]
+        rows = list(get_versions(model).all().values_list(*attnames)[
+            :options['rows']])
+        if not rows:
+            raise CommandError('%s has no history to use.' % label)
+        instances = [hist_model(*row) for row in rows]
+
+        def instantiate():
+            for row in rows:
+                hist_model(*row)
+
+        def read_attributes():
+            for m in instances:
+                for attname in attnames:
+                    getattr(m, attname)
+                m.version_info.date
+                m.version_info.user_id
+
+        for name, f in (('instantiate', instantiate),
+                        ('read attributes', read_attributes)):
+            seconds = min(timeit.repeat(f, number=1,
+                                        repeat=options['repeat']))
+            self.stdout.write('%-16s %8.2fms total %8.2fus per row\n' % (
+                name, seconds * 1e3, seconds / len(rows) * 1e6))
@@ -0,0 +1,104 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Q, get_model
+
+from versionutils.versioning.utils import (is_versioned, get_versions,
+    get_history_models)
+from versionutils.versioning.indexes import (get_identity_fields,
+    missing_history_indexes, create_index)
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName app_label.ModelName ...>'
+    help = ('Reports the composite indexes missing from the historical '
+            'tables of versioned models, along with the query plans of '
+            'common history queries.')
+    option_list = BaseCommand.option_list + (
+        make_option('--create', action='store_true', dest='create',
+            default=False, help='Create the missing indexes.'),
+        make_option('--no-explain', action='store_false', dest='explain',
+            default=True, help="Don't show query plans."),
+    )
+
+    def handle(self, *labels, **options):
+        if labels:
+            hist_models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError('Models must be given as '
+                                       'app_label.ModelName')
+                model = get_model(app_label, model_name)
+                if model is None or not is_versioned(model):
+                    raise CommandError('Unknown versioned model: %s' % label)
+                hist_models.append(get_versions(model).model)
+        else:
+            hist_models = get_history_models()
+
+        tables = connection.introspection.table_names()
+        for hist_model in hist_models:
+            table = hist_model._meta.db_table
+            self.stdout.write('%s\n' % table)
+            if table not in tables:
+                self.stdout.write('  table does not exist\n')
+                continue
+            missing = missing_history_indexes(hist_model)
+            if missing is None:
+                self.stdout.write("  can't list indexes for this database\n")
+            elif not missing:
+                self.stdout.write('  no missing indexes\n')
+            for columns in missing or []:
+                self.stdout.write('  missing index on (%s)\n' %
+                                  ', '.join(columns))
+                if options['create']:
+                    create_index(hist_model, columns)
+                    self.stdout.write('    created\n')
+            if options['explain']:
+                for name, qs in self.sample_queries(hist_model):
+                    self.stdout.write('  %s:\n' % name)
+                    for line in self.explain(qs):
+                        self.stdout.write('    %s\n' % line)
+
+    def sample_queries(self, hist_model):
+        """
+        Returns:
+            A list of (description, queryset) for the queries we expect
+            the history indexes to serve.
+        """
+        now = datetime.datetime.now()
+        queries = [
+            ('recent changes', hist_model.objects.filter(
+                history_date__gte=now - datetime.timedelta(days=7)).order_by(
+                '-history_date')[:50]),
+        ]
+        attnames = [f.attname for f in get_identity_fields(hist_model)]
+        sample = hist_model.objects.values(*attnames)[:1]
+        if sample:
+            identity = dict((str(k), v) for k, v in sample[0].iteritems())
+            history = hist_model.objects.filter(**identity)
+            queries.extend([
+                ('object history',
+                 history.order_by('-history_date')),
+                ('object as of now',
+                 history.filter(history_date__lte=now).filter(
+                    Q(history_valid_to__gt=now) |
+                    Q(history_valid_to__isnull=True))),
+            ])
+        return queries
+
+    def explain(self, qs):
+        sql, params = qs.query.get_compiler(using=qs.db).as_sql()
+        engine = connection.settings_dict['ENGINE']
+        if 'sqlite' in engine:
+            explain = 'EXPLAIN QUERY PLAN '
+        else:
+            explain = 'EXPLAIN '
+        cursor = connection.cursor()
+        cursor.execute(explain + sql, params)
+        return [' '.join([unicode(c) for c in row])
+                for row in cursor.fetchall()]
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import get_model, get_models
+
+from versionutils.versioning.utils import (is_versioned,
+    get_version_info_fields, fill_version_info)
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName app_label.ModelName ...>'
+    help = ('Fills in the version information fields (last_modified, '
+            'last_editor, version_count) of versioned models from their '
+            'history.  By default every versioned model with these fields '
+            'is updated.')
+
+    def handle(self, *labels, **options):
+        if labels:
+            models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError('Models must be given as '
+                                       'app_label.ModelName')
+                model = get_model(app_label, model_name)
+                if model is None:
+                    raise CommandError('Unknown model: %s' % label)
+                models.append(model)
+        else:
+            models = get_models()
+        models = [m for m in models
+                  if is_versioned(m) and get_version_info_fields(m)]
+
+        for model in models:
+            count = transaction.commit_on_success(fill_version_info)(model)
+            self.stdout.write('Updated %d %s.\n' %
+                (count, model._meta.verbose_name_plural))
@@ -1,8 +1,11 @@
 from django.db import models
 from django.db.models.query import QuerySet
+from django.db.models.sql.constants import LOOKUP_SEP
 
 from utils import *
 from decorators import *
+from archive import ArchivedValuesQuerySet, ArchivedValuesListQuerySet
+import registry
 
 
 class HistoryDescriptor(object):
@@ -19,54 +22,128 @@ class HistoryDescriptor(object):
         return instance._history_manager
 
 
-class HistoricalMetaInfoQuerySet(QuerySet):
+class LookupTranslator(object):
     """
-    Simple QuerySet to make filtering intuitive.
+    Translates filter() keywords on a historical model into the lookups
+    that the historical model actually understands, e.g.
+    version_info__date -> history_date.
+
+    The rules depend on which related and parent models are versioned.
+    We work these out the first time they're needed -- not when the
+    historical model is created, as the models related to it may not
+    have been loaded or registered yet -- and again whenever another
+    model is registered.  Each translated keyword is remembered.
     """
-    def filter(self, *args, **kws):
-        # Get the variable names of related, versioned objects.
-        rels = self.model._original_model._meta.get_all_related_objects()
-        versioned_vars = [o.var_name for o in rels if is_versioned(o.model)]
+    def __init__(self, model):
+        self.model = model
+        self.generation = None
+        self.versioned_vars = set()
+        self.versioned_parents = set()
+        self.translations = {}
 
+    def compile(self):
+        original_model = self.model._original_model
+        # Get the variable names of related, versioned objects.
+        rels = original_model._meta.get_all_related_objects()
+        self.versioned_vars = set(
+            [o.var_name for o in rels if is_versioned(o.model)])
         # Get the lookup names of versioned parent models.
-        parents = self.model._original_model._meta.parents
-        versioned_parents = []
-        for k, v in parents.iteritems():
-            if is_versioned(k):
-                versioned_parents.append(v.name)
-
-        # Iterate through the provided keywords, replacing certain
-        # attributes with ones that correspond to historical models.
+        self.versioned_parents = set(
+            [v.name for k, v in original_model._meta.parents.iteritems()
+             if is_versioned(k)])
+        self.translations = {}
+        self.generation = registry.generation
+
+    def translate_keyword(self, k):
+        k_new = k
+        parts = k.split(LOOKUP_SEP)
+        rest = LOOKUP_SEP.join(parts[2:])
+        if rest:
+            rest = "%s%s" % (LOOKUP_SEP, rest)
+        # Replace all instances of version_info__whatever with
+        # history_whatever.
+        if len(parts) > 1 and parts[0] == 'version_info':
+            k_new = 'history_%s%s' % (parts[1], rest)
+        # Replace all instances of fk__whatever with
+        # fk_hist__whatever if fk is a versioned model.
+        if parts[0] in self.versioned_vars:
+            k_new = '%s_hist%s' % (parts[0], rest)
+        # Replace all instances of parent_ptr__whatever
+        # with parent_hist_ptr__whatever if parent's versioned.
+        if parts[0] in self.versioned_parents:
+            # -4 will remove '_ptr' from the original string.
+            k_new = '%s_hist_ptr%s' % (parts[0][:-4], rest)
+        return k_new
+
+    def translate(self, kws):
+        """
+        Returns:
+            A copy of the keyword dictionary `kws` with its keys translated
+            to historical model lookups.
+        """
+        if self.generation != registry.generation:
+            self.compile()
+        translations = self.translations
         kws_new = {}
         for k, v in kws.iteritems():
-            k_new = k
-            parts = k.split(models.sql.constants.LOOKUP_SEP)
-            # Replace all instances of version_info__whatever with
-            # history_whatever.
-            if len(parts) > 1 and parts[0] == 'version_info':
-                rest = models.sql.constants.LOOKUP_SEP.join(parts[2:])
-                if rest:
-                    rest = "%s%s" % (models.sql.constants.LOOKUP_SEP, rest)
-                k_new = 'history_%s%s' % (parts[1], rest)
-            # Replace all instances of fk__whatever with
-            # fk_hist__whatever if fk is a versioned model.
-            if parts[0] in versioned_vars:
-                rest = models.sql.constants.LOOKUP_SEP.join(parts[2:])
-                if rest:
-                    rest = "%s%s" % (models.sql.constants.LOOKUP_SEP, rest)
-                k_new = '%s_hist%s' % (parts[0], rest)
-            # Replace all instances of parent_ptr__whatever
-            # with parent_hist_ptr__whatever if parent's versioned.
-            if parts[0] in versioned_parents:
-                rest = models.sql.constants.LOOKUP_SEP.join(parts[2:])
-                if rest:
-                    rest = "%s%s" % (models.sql.constants.LOOKUP_SEP, rest)
-                # -4 will remove '_ptr' from the original string.
-                k_new = '%s_hist_ptr%s' % (parts[0][:-4], rest)
-
+            k_new = translations.get(k)
+            if k_new is None:
+                k_new = translations[k] = self.translate_keyword(k)
             kws_new[k_new] = v
+        return kws_new
+
+
+def get_lookup_translator(model):
+    """
+    Returns:
+        The LookupTranslator for the historical model `model`.
+    """
+    # Look in __dict__ so that historical models of concretely
+    # subclassed models don't pick up their parent's translator.
+    translator = model.__dict__.get('_lookup_translator')
+    if translator is None:
+        translator = LookupTranslator(model)
+        model._lookup_translator = translator
+    return translator
 
-        return super(HistoricalMetaInfoQuerySet, self).filter(*args, **kws_new)
+
+class HistoricalMetaInfoQuerySet(QuerySet):
+    """
+    Simple QuerySet to make filtering intuitive.
+    """
+    def filter(self, *args, **kws):
+        # Replace certain attributes with ones that correspond to
+        # historical models.
+        kws = get_lookup_translator(self.model).translate(kws)
+        return super(HistoricalMetaInfoQuerySet, self).filter(*args, **kws)
+
+    def values(self, *fields):
+        # Like QuerySet.values(), but with archived values filled in.
+        return self._clone(klass=ArchivedValuesQuerySet, setup=True,
+                           _fields=fields)
+
+    def values_list(self, *fields, **kwargs):
+        # Like QuerySet.values_list(), but with archived values filled in.
+        flat = kwargs.pop('flat', False)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments to values_list: %s'
+                    % (kwargs.keys(),))
+        if flat and len(fields) > 1:
+            raise TypeError("'flat' is not valid when values_list is "
+                            "called with more than one field.")
+        return self._clone(klass=ArchivedValuesListQuerySet, setup=True,
+                           flat=flat, _fields=fields)
+
+    def valid_at(self, date):
+        """
+        Returns:
+            The historical records that describe their objects as they
+            were at `date`.
+        """
+        return self.filter(
+            models.Q(history_valid_to__gt=date) |
+            models.Q(history_valid_to__isnull=True),
+            history_date__lte=date)
 
 
 class HistoryManager(models.Manager):
@@ -153,6 +230,18 @@ class HistoryManager(models.Manager):
             raise self.instance.DoesNotExist("%s has no historical record." %
                                              self.instance._meta.object_name)
 
+    def valid_at(self, date):
+        return self.get_query_set().valid_at(date)
+
+    def close_open_records(self, hist_instance):
+        """
+        Marks the previously-current historical records as being valid
+        only until `hist_instance` was written.
+        """
+        qs = self.get_query_set().filter(history_valid_to__isnull=True)
+        qs.exclude(history_id=hist_instance.history_id).update(
+            history_valid_to=hist_instance.history_date)
+
     @require_instance
     def as_of(self, date=None, version=None):
         """
@@ -173,7 +262,7 @@ class HistoryManager(models.Manager):
             if version and version > 0:
                 v = self.all().order_by('history_date')[version - 1]
             elif date:
-                v = self.filter(history_date__lte=date)[0]
+                v = self.valid_at(date)[0]
         except IndexError:
             raise self.instance.DoesNotExist("%s hasn't been created yet." %
                     self.instance._meta.object_name)
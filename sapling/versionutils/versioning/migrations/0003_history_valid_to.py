@@ -0,0 +1,61 @@
+# encoding: utf-8
+from south.db import db
+from south.v2 import DataMigration
+from django.db import connection
+
+from versionutils.versioning.utils import get_history_models
+from versionutils.versioning.indexes import (get_identity_columns,
+    history_indexes, missing_history_indexes, create_index)
+
+
+class Migration(DataMigration):
+    # Tables may be created by syncdb with the column already in place,
+    # so we look before changing anything.
+    no_dry_run = True
+
+    def forwards(self, orm):
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        tables = connection.introspection.table_names()
+        for hist_model in get_history_models():
+            table = hist_model._meta.db_table
+            if table not in tables:
+                continue
+            field = hist_model._meta.get_field('history_valid_to')
+            columns = [c[0] for c in
+                connection.introspection.get_table_description(cursor, table)]
+            if field.column not in columns:
+                db.add_column(table, field.name, field, keep_default=False)
+
+            # Each record is valid until the date of the next record for
+            # the same object.
+            identity = get_identity_columns(hist_model)
+            date_col = hist_model._meta.get_field('history_date').column
+            same_object = ' AND '.join(['h2.%s = %s.%s' % (
+                qn(c), qn(table), qn(c)) for c in identity])
+            db.execute('UPDATE %(table)s SET %(valid_to)s = ('
+                'SELECT MIN(h2.%(date)s) FROM %(table)s h2 '
+                'WHERE %(same_object)s AND h2.%(date)s > %(table)s.%(date)s)'
+                % {'table': qn(table), 'valid_to': qn(field.column),
+                   'date': qn(date_col), 'same_object': same_object})
+
+            # Fresh tables get their indexes after syncdb.
+            index = history_indexes(hist_model)[0]
+            if index in (missing_history_indexes(hist_model) or [index]):
+                create_index(hist_model, index)
+
+    def backwards(self, orm):
+        tables = connection.introspection.table_names()
+        for hist_model in get_history_models():
+            table = hist_model._meta.db_table
+            if table not in tables:
+                continue
+            field = hist_model._meta.get_field('history_valid_to')
+            # Dropping the column drops the indexes on it.
+            db.delete_column(table, field.column)
+
+    models = {
+
+    }
+
+    complete_apps = ['versioning']
@@ -0,0 +1,70 @@
+# encoding: utf-8
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import connection
+
+from versionutils.versioning.utils import get_history_models
+
+
+class Migration(SchemaMigration):
+    # Tables may be created by syncdb with the column already in place,
+    # so we look before changing anything.
+    no_dry_run = True
+
+    def forwards(self, orm):
+        # Adding model 'ArchivedRevision'
+        db.create_table('versioning_archivedrevision', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('content_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['contenttypes.ContentType'])),
+            ('history_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('data', self.gf('django.db.models.fields.TextField')()),
+        ))
+        db.send_create_signal('versioning', ['ArchivedRevision'])
+
+        # Adding unique constraint on 'ArchivedRevision', fields ['content_type', 'history_id']
+        db.create_unique('versioning_archivedrevision', ['content_type_id', 'history_id'])
+
+        cursor = connection.cursor()
+        tables = connection.introspection.table_names()
+        for hist_model in get_history_models():
+            table = hist_model._meta.db_table
+            if table not in tables:
+                continue
+            field = hist_model._meta.get_field('history_archived')
+            columns = [c[0] for c in
+                connection.introspection.get_table_description(cursor, table)]
+            if field.column not in columns:
+                db.add_column(table, field.name, field, keep_default=False)
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'ArchivedRevision', fields ['content_type', 'history_id']
+        db.delete_unique('versioning_archivedrevision', ['content_type_id', 'history_id'])
+
+        # Deleting model 'ArchivedRevision'
+        db.delete_table('versioning_archivedrevision')
+
+        tables = connection.introspection.table_names()
+        for hist_model in get_history_models():
+            table = hist_model._meta.db_table
+            if table in tables:
+                db.delete_column(table,
+                    hist_model._meta.get_field('history_archived').column)
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'versioning.archivedrevision': {
+            'Meta': {'unique_together': "(('content_type', 'history_id'),)", 'object_name': 'ArchivedRevision'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'history_id': ('django.db.models.fields.IntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+
+    complete_apps = ['versioning']
@@ -0,0 +1,49 @@
+# encoding: utf-8
+from south.db import db
+from south.v2 import DataMigration
+from django.db import connection
+from django.db.models import get_models
+
+from versionutils.versioning.utils import (is_versioned,
+    get_version_info_fields, fill_version_info)
+
+
+def version_info_models():
+    return [m for m in get_models()
+            if is_versioned(m) and get_version_info_fields(m)]
+
+
+class Migration(DataMigration):
+    # Tables may be created by syncdb with the columns already in place,
+    # so we look before changing anything.
+    no_dry_run = True
+
+    def forwards(self, orm):
+        cursor = connection.cursor()
+        tables = connection.introspection.table_names()
+        for model in version_info_models():
+            table = model._meta.db_table
+            if table not in tables:
+                continue
+            columns = [c[0] for c in
+                connection.introspection.get_table_description(cursor, table)]
+            for field in get_version_info_fields(model):
+                if field.column not in columns:
+                    db.add_column(table, field.name, field,
+                                  keep_default=False)
+            fill_version_info(model)
+
+    def backwards(self, orm):
+        tables = connection.introspection.table_names()
+        for model in version_info_models():
+            table = model._meta.db_table
+            if table not in tables:
+                continue
+            for field in get_version_info_fields(model):
+                db.delete_column(table, field.column)
+
+    models = {
+
+    }
+
+    complete_apps = ['versioning']
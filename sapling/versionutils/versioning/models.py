@@ -6,14 +6,20 @@ from django.db import models
 from django.conf import settings
 from django.db.models.options import DEFAULT_NAMES as ALL_META_OPTIONS
 from django.utils.translation import string_concat
+from django.contrib.contenttypes.models import ContentType
 
 from utils import *
 from storage import *
 from constants import *
 from history_model_methods import get_history_fields
 from history_model_methods import get_history_methods
+from history_model_methods import install_callable_descriptors
+from archive import ArchivedFieldDescriptor, get_archived_fields
 import fields
 import manager
+import indexes
+import bulk
+from signals import history_recorded
 
 
 class ChangesTracker(object):
@@ -32,6 +38,9 @@ class ChangesTracker(object):
                 history_model = get_versions(m).model
         else:
             history_model = self.create_history_model(m)
+            # The lookup rules themselves are worked out on first use.
+            history_model._lookup_translator = manager.LookupTranslator(
+                history_model)
 
         do_versioning = getattr(
             settings, 'VERSIONUTILS_VERSIONING_ENABLED', True)
@@ -125,11 +134,22 @@ class ChangesTracker(object):
         # models in the exact same fashion as non-historical models.
         if model._meta.parents:
             if is_versioned(model.__base__):
-                return type(
+                history_model = type(
                     name, (get_versions(model.__base__).model,), attrs)
-            return type(name, (model.__base__,), attrs)
-
-        return type(name, (models.Model,), attrs)
+            else:
+                history_model = type(name, (model.__base__,), attrs)
+        else:
+            history_model = type(name, (models.Model,), attrs)
+            # Calls to the non-historical model's methods are passed
+            # along to the non-historical form of the instance.
+            install_callable_descriptors(history_model,
+                                         attrs['_original_callables'])
+
+        # Archived values are fetched when they're first read.
+        for field in get_archived_fields(model):
+            setattr(history_model, field.attname,
+                    ArchivedFieldDescriptor(field))
+        return history_model
 
     def wrap_model_fields(self, model):
         """
@@ -254,6 +274,9 @@ class ChangesTracker(object):
 
         for field in (model._meta.local_fields +
                       model._meta.local_many_to_many):
+            if isinstance(field, fields.VersionInfoField):
+                # These describe the history, so they aren't part of it.
+                continue
             field = copy.deepcopy(field)
 
             if isinstance(field, models.AutoField):
@@ -420,8 +443,13 @@ class ChangesTracker(object):
                 history_type = TYPE_REVERTED_ADDED if is_revert else TYPE_ADDED
             else:
                 history_type = history_type or TYPE_UPDATED
+        if bulk.defer_historical_record(parent, instance, history_type):
+            return
         hist_instance = self.create_historical_record(instance, history_type)
         self.m2m_init(instance, hist_instance)
+        if hist_instance is not None:
+            update_version_info(instance, hist_instance.history_date,
+                                hist_instance.history_user_id, created)
 
     def pre_delete(self, parent, instance, **kws):
         # To support subclassing.
@@ -478,7 +506,9 @@ class ChangesTracker(object):
             else:
                 history_type = TYPE_DELETED
 
-        if not is_pk_recycle_a_problem(instance) and instance._track_changes:
+        if (not is_pk_recycle_a_problem(instance) and
+            instance._track_changes and
+            not bulk.defer_historical_record(parent, instance, history_type)):
             hist_instance = self.create_historical_record(
                 instance, history_type)
             self.m2m_init(instance, hist_instance)
@@ -510,6 +540,9 @@ class ChangesTracker(object):
         Args:
             attname: Attribute name of the m2m field on the base model.
         """
+        if bulk.is_deferred(instance):
+            # The set is read when the historical record is written.
+            return
         if pk_set:
             changed_ms = [model.objects.get(pk=pk) for pk in pk_set]
             hist_changed_ms = []
@@ -535,6 +568,8 @@ class ChangesTracker(object):
             return
         attrs = {}
         for field in instance._meta.fields:
+            if isinstance(field, fields.VersionInfoField):
+                continue
             if isinstance(field, models.fields.related.ForeignKey):
                 is_fk_to_self = (field.related.parent_model ==
                                  instance.__class__)
@@ -566,7 +601,11 @@ class ChangesTracker(object):
             attrs[field.attname] = getattr(instance, field.attname)
 
         attrs.update(self._get_save_with_attrs(instance))
-        return manager.create(history_type=type, **attrs)
+        hist_instance = manager.create(history_type=type, **attrs)
+        manager.close_open_records(hist_instance)
+        history_recorded.send(sender=instance.__class__,
+                              records=[hist_instance])
+        return hist_instance
 
     def _get_save_with_attrs(self, instance):
         """
@@ -714,3 +753,15 @@ def delete_with_arguments(model_delete, m, using=None,
 
     _related_objs_cascade_bookkeeping(m)
     return model_delete(m, using=using)
+
+
+class ArchivedRevision(models.Model):
+    """
+    The archived field values of a historical record.  See archive.py.
+    """
+    content_type = models.ForeignKey(ContentType)
+    history_id = models.IntegerField()
+    data = models.TextField()
+
+    class Meta:
+        unique_together = ('content_type', 'history_id')
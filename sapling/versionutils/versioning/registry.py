@@ -1,5 +1,9 @@
 from utils import is_versioned
 
+# Bumped each time a model is registered.  Anything computed from the set
+# of versioned models can compare against this to know when to redo it.
+generation = 0
+
 
 def register(cls, manager_name='versions', changes_tracker=None):
     """
@@ -21,5 +25,7 @@ def register(cls, manager_name='versions', changes_tracker=None):
     if is_versioned(cls):
         return
 
+    global generation
     tracker = changes_tracker()
     tracker.connect(cls, manager_name=manager_name)
+    generation += 1
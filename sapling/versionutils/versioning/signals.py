@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after historical records are written, by save() and delete() and
+# by the batched helpers in bulk.py.  `sender` is the versioned model and
+# `records` is a list of the new historical instances.
+history_recorded = Signal(providing_args=['records'])
@@ -14,6 +14,12 @@ from utils import TestSettingsManager
 from models import *
 from versionutils.versioning.constants import *
 from versionutils.versioning.utils import is_versioned
+from versionutils.versioning.manager import get_lookup_translator
+from versionutils.versioning import registry
+from versionutils.versioning.archive import archivable_ids, archive_records
+from versionutils.versioning.bulk import bulk_history
+from versionutils.versioning.indexes import (history_indexes,
+    missing_history_indexes)
 
 mgr = TestSettingsManager()
 INSTALLED_APPS = list(settings.INSTALLED_APPS)
@@ -1214,3 +1220,129 @@ class ChangesTrackingTest(TestCase):
         m1_hs = M1.versions.all().defer('a')
         m = m1_hs.get(d="D2!")
         self.assertEqual(m.a, "A2!")
+
+    def test_lookup_translation(self):
+        translator = get_lookup_translator(M2.versions.model)
+        kws = translator.translate({'version_info__date__lte': 1, 'a': 2})
+        self.assertEqual(kws, {'history_date__lte': 1, 'a': 2})
+        # M17ForeignKeyVersioned has a ForeignKey to M2.
+        self.assertTrue('m17foreignkeyversioned' in translator.versioned_vars)
+        self.assertEqual(
+            translator.translations['version_info__date__lte'],
+            'history_date__lte')
+
+        # Registering another model means the rules are worked out again.
+        registry.generation += 1
+        translator.translate({'a': 2})
+        self.assertFalse('version_info__date__lte' in translator.translations)
+        self.assertEqual(translator.generation, registry.generation)
+
+    def test_lazy_relation_descriptors(self):
+        m2 = M2(a="lazy", b="lazy", c=0)
+        m2.save()
+        m17 = M17ForeignKeyVersioned(name="lazy", m2=m2)
+        m17.save()
+        m2.a += "!"
+        m2.save()
+
+        m2_h = m2.versions.most_recent()
+        # Nothing is wrapped until the relation is accessed.
+        self.assertFalse('_wrapped_lookup_fields' in m2_h.__dict__)
+        related = m2_h.m17foreignkeyversioned_set
+        self.assertEqual(len(related.all()), 1)
+        self.assertTrue(m2_h.m17foreignkeyversioned_set is related)
+        # The historical model's own reverse relation is still available.
+        direct = getattr(m2_h, '__direct_m17foreignkeyversioned_hist_set')
+        self.assertEqual(direct.model, M17ForeignKeyVersioned.versions.model)
+
+    def test_valid_to(self):
+        m2 = M2(a="valid", b="valid", c=0)
+        m2.save()
+        m2.c = 1
+        m2.save()
+        m2.c = 2
+        m2.save()
+
+        v1, v2, v3 = m2.versions.all().order_by('history_date')
+        self.assertEqual(v1.version_info.valid_to, v2.version_info.date)
+        self.assertEqual(v2.version_info.valid_to, v3.version_info.date)
+        self.assertEqual(v3.version_info.valid_to, None)
+
+        self.assertEqual(m2.versions.as_of(date=v2.version_info.date).c, 1)
+        self.assertEqual(
+            [h.c for h in M2.versions.valid_at(v2.version_info.date)
+             if h.a == "valid"], [1])
+
+        pk = m2.pk
+        m2.delete()
+        v3, v4 = M2.versions.filter(id=pk).order_by('history_date')[2:]
+        self.assertEqual(v4.version_info.type, TYPE_DELETED)
+        self.assertEqual(v3.version_info.valid_to, v4.version_info.date)
+
+    def test_archive(self):
+        m2 = M2(a="archive", b="first", c=0)
+        m2.save()
+        m2.b = "second"
+        m2.save()
+        m2.b = "third"
+        m2.save()
+
+        hist_model = M2.versions.model
+        ids = [ids for ids in archivable_ids(hist_model, days=-1, keep=1)
+               if m2.versions.filter(history_id__in=ids)]
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(archive_records(hist_model, ids[0]), 2)
+
+        # The values are gone from the historical table..
+        self.assertEqual(hist_model.objects.filter(
+            history_id__in=ids[0], b='').count(), 2)
+        # ..but are still there when reading historical instances..
+        self.assertEqual(m2.versions.as_of(version=1).b, "first")
+        self.assertEqual(m2.versions.as_of(version=2).b, "second")
+        self.assertEqual(m2.versions.as_of(version=3).b, "third")
+        # ..or values.
+        versions = m2.versions.order_by('history_date')
+        self.assertEqual(list(versions.values_list('b', flat=True)),
+                         ["first", "second", "third"])
+        self.assertEqual(list(versions.values_list('a', 'b'))[0],
+                         ("archive", "first"))
+        self.assertEqual([v['b'] for v in versions.values('b')],
+                         ["first", "second", "third"])
+
+        m2.versions.as_of(version=1).revert_to()
+        self.assertEqual(M2.objects.get(pk=m2.pk).b, "first")
+
+    def test_history_indexes(self):
+        hist_model = M2.versions.model
+        indexes = history_indexes(hist_model)
+        self.assertEqual(indexes[0][-2:], ['history_date', 'history_valid_to'])
+        self.assertEqual(indexes[1], ['history_date', 'history_type'])
+        # They're created along with the table.
+        missing = missing_history_indexes(hist_model)
+        if missing is not None:
+            self.assertEqual(missing, [])
+
+    def test_bulk_history(self):
+        with bulk_history():
+            m2 = M2(a="bulk", b="first", c=0)
+            m2.save(comment="created")
+            m2.b = "second"
+            m2.save(comment="changed")
+            other = M2(a="bulk other", b="other", c=1)
+            other.save()
+            # Nothing's written until the block exits.
+            self.assertEqual(m2.versions.count(), 0)
+            other.delete()
+
+        versions = list(m2.versions.order_by('history_date'))
+        self.assertEqual([v.b for v in versions], ["first", "second"])
+        self.assertEqual([v.version_info.type for v in versions],
+                         [TYPE_ADDED, TYPE_UPDATED])
+        self.assertEqual([v.version_info.comment for v in versions],
+                         ["created", "changed"])
+        self.assertEqual(m2.versions.most_recent().b, "second")
+        self.assertEqual(m2.versions.as_of(version=1).b, "first")
+
+        deleted = M2.versions.filter(a="bulk other").order_by('history_date')
+        self.assertEqual([v.version_info.type for v in deleted],
+                         [TYPE_ADDED, TYPE_DELETED])
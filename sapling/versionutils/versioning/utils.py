@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, connection, transaction
 from django.conf import settings
 from django.db.models.sql.constants import LOOKUP_SEP
 
 import exceptions
+import fields
 
 
 def is_versioned(m):
@@ -110,6 +111,153 @@ def get_m2m_versioned_fields(m):
     ]
 
 
+def get_history_models():
+    """
+    Returns:
+        A list of the historical models that keep their own history_date,
+        i.e. not those of concretely subclassed models.
+    """
+    hist_models = []
+    for model in models.get_models():
+        if not is_versioned(model) or model._meta.proxy:
+            continue
+        hist_model = get_versions(model).model
+        local = [f.name for f in hist_model._meta.local_fields]
+        if 'history_date' in local and hist_model not in hist_models:
+            hist_models.append(hist_model)
+    return hist_models
+
+
+def get_version_info_fields(m):
+    """
+    Args:
+        m: A model instance or model class.
+
+    Returns:
+        A list of the VersionInfoFields attached to m.
+    """
+    return [f for f in m._meta.fields
+            if isinstance(f, fields.VersionInfoField)]
+
+
+def update_version_info(m, date, user_id, created=False):
+    """
+    Brings the VersionInfoFields on m up to date after a historical
+    record has been written for it.  See bulk_update_version_info().
+
+    Args:
+        m: A model instance.
+        date: The history_date of the new historical record.
+        user_id: The pk of the User who made the change, or None.
+        created: True if m was just created.
+    """
+    bulk_update_version_info(m.__class__, [(m, user_id, created)], date)
+
+
+def bulk_update_version_info(model, changes, date):
+    """
+    Brings the VersionInfoFields up to date after a historical record has
+    been written for each of the changed objects, all at `date`.  Objects
+    that were changed get one UPDATE per user, with their version counts
+    bumped in the database.  New objects may already have history, e.g. a
+    page that was deleted and made again, so theirs are filled in from
+    their history with fill_version_info().  The fields are set with
+    UPDATEs, so no signals are sent.
+
+    Args:
+        model: A versioned model class.
+        changes: A list of (instance, pk of the User who made the change
+            or None, whether the instance was just created) tuples.
+        date: The history_date of the new historical records.
+    """
+    info_fields = get_version_info_fields(model)
+    if not info_fields or not changes:
+        return
+    manager = model._default_manager
+
+    created = [m for m, user_id, is_new in changes if is_new]
+    if created:
+        pks = [m.pk for m in created]
+        fill_version_info(model, pks)
+        names = [f.name for f in info_fields]
+        filled = dict((v[0], v[1:]) for v in
+                      manager.filter(pk__in=pks).values_list('pk', *names))
+        for m in created:
+            for field, v in zip(info_fields, filled.get(m.pk, ())):
+                setattr(m, field.attname, v)
+
+    by_user = {}
+    for m, user_id, is_new in changes:
+        if not is_new:
+            by_user.setdefault(user_id, []).append(m)
+    for user_id, instances in by_user.iteritems():
+        values = {}
+        for field in info_fields:
+            if isinstance(field, fields.LastModifiedField):
+                values[field] = date
+            elif isinstance(field, fields.LastEditorField):
+                values[field] = user_id
+            elif isinstance(field, fields.VersionCountField):
+                values[field] = models.F(field.name) + 1
+        manager.filter(pk__in=[m.pk for m in instances]).update(
+            **dict((f.name, v) for f, v in values.iteritems()))
+        for m in instances:
+            for field, v in values.iteritems():
+                if isinstance(field, fields.VersionCountField):
+                    v = (getattr(m, field.attname) or 0) + 1
+                setattr(m, field.attname, v)
+
+
+def fill_version_info(model, pks=None):
+    """
+    Sets the VersionInfoFields of `model`'s objects from their history,
+    with a single UPDATE.
+
+    Args:
+        model: A versioned model class.
+        pks: Optional list of the primary keys of the objects to fill in.
+            Defaults to every object.
+
+    Returns:
+        The number of objects filled in.
+    """
+    from indexes import get_identity_columns
+
+    info_fields = get_version_info_fields(model)
+    if not info_fields or pks == []:
+        return 0
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    hist_model = get_versions(model).model
+    hist_opts = hist_model._meta
+    history = 'FROM %s h WHERE %s' % (qn(hist_opts.db_table), ' AND '.join(
+        ['h.%s = %s.%s' % (qn(c), table, qn(c))
+         for c in get_identity_columns(hist_model)]))
+    date_col = qn(hist_opts.get_field('history_date').column)
+    user_col = qn(hist_opts.get_field('history_user').column)
+
+    sets = []
+    for field in info_fields:
+        if isinstance(field, fields.LastModifiedField):
+            value = 'SELECT MAX(h.%s) %s' % (date_col, history)
+        elif isinstance(field, fields.LastEditorField):
+            value = 'SELECT h.%s %s ORDER BY h.%s DESC, h.%s DESC LIMIT 1' % (
+                user_col, history, date_col, qn(hist_opts.pk.column))
+        elif isinstance(field, fields.VersionCountField):
+            value = 'SELECT COUNT(*) %s' % history
+        sets.append('%s = (%s)' % (qn(field.column), value))
+    sql = 'UPDATE %s SET %s' % (table, ', '.join(sets))
+    params = []
+    if pks is not None:
+        sql += ' WHERE %s IN (%s)' % (qn(model._meta.pk.column),
+                                      ', '.join(['%s'] * len(pks)))
+        params = list(pks)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+    return cursor.rowcount
+
+
 def get_parent_instance(m, parent):
     """
     Attrs: